@@ -1,21 +1,31 @@
-from fastapi import FastAPI, WebSocket
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Header, HTTPException, WebSocket
+from starlette.websockets import WebSocketState
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import argparse
 import json
 import base64
 import logging
 import time
 import asyncio
+import threading
 from transcription import OpenAITranscriber
-from rag import rag
+from audio_cache import get_reply_audio_cache
+from client_protocol import FRAME_AUDIO_INPUT, decode_frame
+from ephemeral_keys import EphemeralKeyPool
+from metrics import render_prometheus
+from realtime_session import REALTIME_POOL_SIZE, RealtimeSessionPool
+from session_limits import SESSION_IDLE_TIMEOUT, SESSION_REAPER_INTERVAL
+from session_registry import SESSION_HEARTBEAT_SECONDS, SessionRegistry, worker_usage
+from contextlib import asynccontextmanager
+from rag import get_retrieval_service, rag
 import uuid
 import traceback
-from typing import Dict
+from typing import Dict, Optional
 import asyncio
-from dotenv import load_dotenv
 import os
-import requests
+import httpx
 
 #LOG_FILENAME = "server_logs.txt"
 
@@ -27,7 +37,104 @@ logging.basicConfig(
 logger = logging.getLogger("websocket-audio")
 #reset_logs(LOG_FILENAME)
 
-app = FastAPI()
+# Worker processes for `python app.py --workers N`; more than one disables reload
+APP_WORKERS = int(os.environ.get("APP_WORKERS", "1"))
+# When set, /admin endpoints require this value in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+session_pool = None
+session_registry = None
+key_pool = None
+
+async def heartbeat_sessions():
+    """Publish this worker's sessions and their usage to the shared registry."""
+    loop = asyncio.get_running_loop()
+    while True:
+        usage = {connection_id: transcriber.usage() for connection_id, transcriber in transcriber_instances.items()}
+        try:
+            await loop.run_in_executor(None, session_registry.heartbeat, usage)
+        except Exception as e:
+            logger.error(f"Session registry heartbeat failed: {e}")
+        await asyncio.sleep(SESSION_HEARTBEAT_SECONDS)
+
+async def close_session(connection_id, websocket=None, reason=None):
+    """
+    Tear down one /ws session; safe to call more than once, from the
+    endpoint's own cleanup or from the reaper.
+    """
+    if websocket is not None:
+        connected_clients.discard(websocket)
+    transcriber = transcriber_instances.pop(connection_id, None)
+    if transcriber:
+        if reason:
+            logger.info(f"Closing session {connection_id}: {reason}")
+        await transcriber.stop_transcription()
+        websocket = websocket or transcriber.client_websocket
+        if websocket is not None and websocket.client_state == WebSocketState.CONNECTED \
+                and websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                # Wakes the endpoint's receive loop so it can finish as well
+                await websocket.close(code=1000 if reason else 1011)
+            except Exception:
+                pass
+    if session_registry:
+        await asyncio.get_running_loop().run_in_executor(None, session_registry.release, connection_id)
+
+def reap_reason(transcriber, now):
+    websocket = transcriber.client_websocket
+    if websocket is None or websocket.client_state == WebSocketState.DISCONNECTED \
+            or websocket.application_state == WebSocketState.DISCONNECTED:
+        return "client disconnected"
+    if transcriber.reader_task is not None and transcriber.reader_task.done():
+        return "upstream closed"
+    if SESSION_IDLE_TIMEOUT and now - transcriber.last_activity > SESSION_IDLE_TIMEOUT:
+        return f"idle for {now - transcriber.last_activity:.0f}s"
+    return None
+
+async def reap_sessions():
+    """Close idle sessions and ones whose client or upstream socket is already gone."""
+    while True:
+        await asyncio.sleep(SESSION_REAPER_INTERVAL)
+        now = time.monotonic()
+        for connection_id, transcriber in list(transcriber_instances.items()):
+            reason = reap_reason(transcriber, now)
+            if reason:
+                try:
+                    await close_session(connection_id, reason=reason)
+                except Exception as e:
+                    logger.error(f"Failed to reap session {connection_id}: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    global session_pool, session_registry, key_pool
+    # Every worker process runs its own lifespan, so the pool is per worker
+    if REALTIME_POOL_SIZE > 0:
+        session_pool = RealtimeSessionPool(REALTIME_POOL_SIZE)
+        await session_pool.start()
+        logger.info(f"Realtime session pool started with {REALTIME_POOL_SIZE} sessions")
+    session_registry = SessionRegistry()
+    session_registry.register_worker()
+    heartbeat_task = asyncio.create_task(heartbeat_sessions())
+    reaper_task = asyncio.create_task(reap_sessions())
+    key_pool = EphemeralKeyPool()
+    try:
+        await key_pool.start()
+    except ValueError as e:
+        logger.warning(f"Ephemeral keys disabled: {e}")
+        key_pool = None
+    yield
+    reaper_task.cancel()
+    heartbeat_task.cancel()
+    if key_pool:
+        await key_pool.close()
+        key_pool = None
+    session_registry.close()
+    session_registry = None
+    if session_pool:
+        await session_pool.close()
+        session_pool = None
+
+app = FastAPI(lifespan=lifespan)
 transcriber_instances: Dict[str, OpenAITranscriber] = {}
 # Enable CORS to allow requests from Next.js frontend
 app.add_middleware(
@@ -48,46 +155,138 @@ async def get():
     logger.info("Root endpoint accessed")
     return {"message": "WebSocket Audio Server"}
 
-@app.get("/getEphemeralKey")
-async def get_ephemeral_key():
-    load_dotenv()
-    OPEN_AI_API_KEY = os.getenv("OPENAI_API_KEY")
-    url = "https://api.openai.com/v1/realtime/sessions"
-    headers = {
-        "Authorization": f"Bearer {OPEN_AI_API_KEY}",
-        "Content-Type": "application/json",
-        "OpenAI-Beta": "realtime=v1"
+@app.get("/stats/upstream")
+async def get_upstream_stats():
+    return {
+        connection_id: transcriber.upstream_stats()
+        for connection_id, transcriber in transcriber_instances.items()
     }
-    payload = {
-        "model": "gpt-4o-realtime-preview-2024-12-17",
-        "voice": "verse"
+
+@app.get("/stats/retrieval")
+async def get_retrieval_stats():
+    return {
+        connection_id: transcriber.retrieval_stats()
+        for connection_id, transcriber in transcriber_instances.items()
+    }
+
+@app.get("/stats/rag")
+async def get_rag_stats():
+    """Embedding cache, answer caches, spoken answer index and context packing totals for this worker."""
+    stats = get_retrieval_service().stats()
+    audio_cache = get_reply_audio_cache()
+    if audio_cache:
+        stats["spoken_answers"] = audio_cache.answers.stats()
+    return stats
+
+@app.get("/stats/pool")
+async def get_pool_stats():
+    return session_pool.stats() if session_pool else {"size": 0}
+
+@app.get("/stats/memory")
+async def get_memory_stats():
+    """Estimated buffer memory of every session on this worker, and the worker's resident size."""
+    sessions = {connection_id: transcriber.memory_usage()
+                for connection_id, transcriber in transcriber_instances.items()}
+    return {
+        "worker": worker_usage(),
+        "session_bytes": sum(usage["total_bytes"] for usage in sessions.values()),
+        "connected_clients": len(connected_clients),
+        "sessions": sessions
     }
 
-    response = requests.post(url, headers=headers, json=payload)
-    response = response.json()
-    ephemeral_key = response["client_secret"]["value"]
-    return ephemeral_key
+@app.get("/stats/keys")
+async def get_key_stats():
+    return key_pool.stats() if key_pool else {"size": 0}
+
+@app.get("/admin/sessions")
+async def get_admin_sessions(x_admin_token: Optional[str] = Header(default=None)):
+    """Live sessions across every worker, with per-session and per-worker resource usage."""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    return await asyncio.get_running_loop().run_in_executor(None, session_registry.list_sessions)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    gauges = [
+        ("receptionist_active_sessions", "Connected /ws sessions", len(transcriber_instances)),
+        ("receptionist_threads", "Live Python threads in this process", threading.active_count()),
+        ("receptionist_pool_idle_sessions", "Idle pre-opened realtime sessions",
+         len(session_pool.ready) if session_pool else 0),
+        ("receptionist_pooled_ephemeral_keys", "Pre-minted ephemeral keys ready to hand out",
+         len(key_pool.ready) if key_pool else 0),
+    ]
+    rag_stats = get_retrieval_service().stats()
+    for cache in ("embedding_cache", "text_answer_cache", "event_answer_cache"):
+        if cache in rag_stats:
+            gauges.append(("receptionist_rag_cache_hit_ratio", "Hit rate of each retrieval cache since start",
+                           rag_stats[cache]["hit_rate"], {"cache": cache.removesuffix("_cache")}))
+    audio_cache = get_reply_audio_cache()
+    if audio_cache:
+        gauges.append(("receptionist_rag_cache_hit_ratio", "Hit rate of each retrieval cache since start",
+                       audio_cache.answers.stats()["hit_rate"], {"cache": "spoken_answer"}))
+    gauges.append(("receptionist_context_tokens_saved", "Retrieved context tokens removed by packing since start",
+                   rag_stats["context_packing"]["saved_tokens"]))
+    return PlainTextResponse(render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/getEphemeralKey")
+async def get_ephemeral_key():
+    if not key_pool:
+        raise HTTPException(status_code=503, detail="Ephemeral keys are not configured")
+    try:
+        return await key_pool.acquire()
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        logger.error(f"Failed to mint ephemeral key: {e}")
+        raise HTTPException(status_code=502, detail="Could not mint an ephemeral key")
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    connection_id = str(uuid.uuid4())
     try:
         await websocket.accept()
         logger.info("WebSocket connection accepted")
         connected_clients.add(websocket)
         
         # Create or reuse transcriber for this connection
-        connection_id = str(uuid.uuid4())
+        client = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else None
+        admitted = await asyncio.get_running_loop().run_in_executor(
+            None, session_registry.admit, connection_id, client)
+        if not admitted:
+            # Refuse before an upstream session is opened for the call
+            logger.warning("Session rejected: concurrent call cap reached")
+            await websocket.send_json({"event_type": "server_busy",
+                                       "event_data": "Too many concurrent calls, please try again shortly"})
+            await websocket.close(code=1013)
+            return
         if connection_id not in transcriber_instances:
-            transcriber_instances[connection_id] = OpenAITranscriber(websocket)
-            await asyncio.sleep(5)
+            transcriber_instances[connection_id] = OpenAITranscriber(websocket, session_pool=session_pool)
+            # start() returns once the upstream session is configured and ready for audio
+            await transcriber_instances[connection_id].start()
             await transcriber_instances[connection_id].test()
             
         try:
             while True:
-                data = await websocket.receive_json()  
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                transcriber = transcriber_instances.get(connection_id)
+                if transcriber is None:
+                    # Reaped while this message was in flight
+                    break
+                transcriber.touch()
+                if message.get("bytes") is not None:
+                    # Negotiated binary protocol: raw PCM16 frames, no base64 or JSON
+                    frame_type, _, _, payload = decode_frame(message["bytes"])
+                    if frame_type == FRAME_AUDIO_INPUT and transcriber.is_openai_connected():
+                        await transcriber.send_audio_to_openai(payload)
+                    continue
+                data = json.loads(message["text"])
                 #log(data, LOG_FILENAME)
+                if data['event_type'] == 'hello':
+                    reply = transcriber.client.negotiate(data)
+                    transcriber.reply_audio_mode = reply["reply_audio"]
+                    await transcriber.client.send_json(reply)
                 #this one is actually response
-                if data['event_type'] == 'audio_response_transmitting':
+                elif data['event_type'] == 'audio_response_transmitting':
                     try:
                         #log("Output Data transmitting", LOG_FILENAME)
                         await websocket.send_json(data)
@@ -97,27 +296,36 @@ async def websocket_endpoint(websocket: WebSocket):
                         raise  # This will trigger the outer exception handler
                 elif data['event_type'] == 'audio_input_transmitting':
                     #log("Transmitting data", LOG_FILENAME)
-                    if transcriber_instances[connection_id].is_openai_connected():
-                        transcriber_instances[connection_id].send_audio_to_openai(data['event_data'])
+                    if transcriber.is_openai_connected():
+                        await transcriber.send_audio_to_openai(data['event_data'])
                         #record_audio(data['event_data'])
                     #log("Data transmitted", LOG_FILENAME)
         except Exception as e:
             logger.error(f"WebSocket error: {str(e)}")
-        finally:
-            # Clean up
-            connected_clients.discard(websocket)
-            if connection_id in transcriber_instances:
-                transcriber_instances[connection_id].stop_transcription()
-                del transcriber_instances[connection_id]
-            logger.info("WebSocket connection closed")
     except Exception as e:
         print(e)
         #log(e, LOG_FILENAME)
         traceback.print_exc()
+    finally:
+        # Also runs when setup fails before the receive loop, so nothing is left behind
+        await close_session(connection_id, websocket)
+        logger.info("WebSocket connection closed")
         
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the receptionist server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=APP_WORKERS,
+                        help="worker processes; more than one runs without reload")
+    args = parser.parse_args()
+    # Worker processes import app afresh; per-worker pool shares are sized from this
+    os.environ["APP_WORKERS"] = str(args.workers)
     try:
-        uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True, reload_excludes=["b64audio.txt", "logs.txt", "server_logs.txt", "saved_server_logs.txt", "saved_logs.txt", "*."])
+        if args.workers > 1:
+            # Production mode: sessions and call caps are shared through the session registry
+            uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers)
+        else:
+            uvicorn.run("app:app", host=args.host, port=args.port, reload=True, reload_excludes=["b64audio.txt", "logs.txt", "server_logs.txt", "saved_server_logs.txt", "saved_logs.txt", "*."])
     except Exception as e:
         print(e)
         #log(e, LOG_FILENAME)
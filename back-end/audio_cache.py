@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from audio_codec import SAMPLE_RATE, BYTES_PER_SAMPLE, decode_pcm16
+from rag import get_retrieval_service, normalize_text
+from semantic_cache import INDEX_GENERATION_PATH, SEMANTIC_CACHE_THRESHOLD, read_index_generation
+
+load_dotenv()
+
+# Serve the phrases rendered by `python audio_cache.py warm`
+REPLY_AUDIO_CACHE_ENABLED = os.environ.get("REPLY_AUDIO_CACHE_ENABLED", "1") == "1"
+# Opt-in: also record live replies and serve them to later near-duplicate questions. One
+# model answer then stands in for every similar question until the index is rebuilt
+REPLY_AUDIO_CACHE_LEARN = os.environ.get("REPLY_AUDIO_CACHE_LEARN", "0") == "1"
+REPLY_AUDIO_CACHE_DIR = os.environ.get("REPLY_AUDIO_CACHE_DIR", "./data/audio_cache")
+REPLY_AUDIO_CACHE_MAX_BYTES = int(os.environ.get("REPLY_AUDIO_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+# Replies longer than this are not recorded for the cache
+REPLY_AUDIO_CACHE_MAX_CLIP_SECONDS = float(os.environ.get("REPLY_AUDIO_CACHE_MAX_CLIP_SECONDS", "30"))
+# Question -> answer entries kept in the cache directory; compacted to the newest this many
+REPLY_AUDIO_CACHE_MAX_ANSWERS = int(os.environ.get("REPLY_AUDIO_CACHE_MAX_ANSWERS", "1024"))
+# One phrase per line, optionally preceded by the caller questions that get it:
+#   hello; hi; good morning => Hello! Welcome to Greenview Medical Centre.
+# Rendered, and its questions added to the answer index, by `python audio_cache.py warm`
+CACHED_PHRASES_PATH = os.environ.get("CACHED_PHRASES_PATH", "./data/cached_phrases.txt")
+
+ANSWER_INDEX_NAME = "answers.jsonl"
+
+# (caller questions, phrase). The fallback has no fixed questions; live replies that
+# end up with its exact text are recorded against the warmed clip instead.
+DEFAULT_PHRASES = [
+    (["hello", "hi", "hey", "hello there", "good morning", "good afternoon", "good evening"],
+     "Hello! Welcome to Greenview Medical Centre. How can I help you today?"),
+    (["can you check that for me", "could you look that up", "can you look that up for me",
+      "can you find out for me"],
+     "Please hold for a moment while I look that up."),
+    ([], "I'm sorry, but I don't have that specific information about Greenview Medical Centre in my current data."),
+]
+
+MAX_CLIP_BYTES = int(REPLY_AUDIO_CACHE_MAX_CLIP_SECONDS * SAMPLE_RATE) * BYTES_PER_SAMPLE
+
+def parse_phrase(line):
+    if "=>" not in line:
+        return [], line.strip()
+    questions, phrase = line.split("=>", 1)
+    return [question.strip() for question in questions.split(";") if question.strip()], phrase.strip()
+
+def load_phrases(path=CACHED_PHRASES_PATH):
+    """Return the warm list as (questions, phrase) pairs."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            phrases = [parse_phrase(line) for line in file if line.strip() and not line.startswith("#")]
+    except FileNotFoundError:
+        return list(DEFAULT_PHRASES)
+    return phrases or list(DEFAULT_PHRASES)
+
+def unit_vector(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class SpokenAnswerIndex:
+    """
+    Caller question -> spoken answer text, used to find a cached clip.
+
+    Entries are appended to answers.jsonl next to the clips, so the map
+    survives restarts and every worker picks up the others' entries on its
+    next lookup. A lookup tries the normalized question first, then the
+    stored question embedding most similar to it, at or above `threshold`.
+    Entries recorded from live replies carry the index generation and are
+    removed once the knowledge base is rebuilt (bump_index_generation);
+    entries seeded by `warm` do not depend on it and are kept.
+    """
+
+    def __init__(self, path, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=REPLY_AUDIO_CACHE_MAX_ANSWERS,
+                 generation_path=INDEX_GENERATION_PATH):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.generation_path = generation_path
+        self.lock = threading.Lock()
+        self.generation = None
+        self.file_id = None
+        self.offset = 0
+        self.lines = 0
+        self.stale = 0
+        self.entries = {}
+        self.vectors = {}
+        self.matrix = None
+        self.matrix_keys = []
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _reset(self):
+        self.offset = 0
+        self.lines = 0
+        self.stale = 0
+        self.entries = {}
+        self.vectors = {}
+        self.matrix = None
+
+    def _load(self, entry):
+        if entry.get("generation") not in (None, self.generation):
+            self.stale += 1
+            return
+        key = entry["question"]
+        # Re-inserted so the dict stays ordered oldest to newest for compaction
+        self.entries.pop(key, None)
+        self.entries[key] = entry
+        self.vectors.pop(key, None)
+        if entry.get("vector"):
+            self.vectors[key] = unit_vector(np.frombuffer(base64.b64decode(entry["vector"]), dtype=np.float32))
+        self.matrix = None
+
+    def _refresh(self):
+        """Read entries appended since the last call, by this or any other process."""
+        generation = read_index_generation(self.generation_path)
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        file_id = (stat.st_dev, stat.st_ino) if stat else None
+        if generation != self.generation or file_id != self.file_id or (stat and stat.st_size < self.offset):
+            # Knowledge base rebuilt, or the file compacted by another worker
+            self.generation = generation
+            self.file_id = file_id
+            self._reset()
+        if stat is None or stat.st_size == self.offset:
+            return
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            data = file.read()
+        # A line still being written by another worker is picked up next time
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                self._load(json.loads(line))
+            except (ValueError, KeyError):
+                continue
+            self.lines += 1
+        self.offset += end
+        if self.stale:
+            # Drop the learned answers of an older knowledge base from the file, not just from memory
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the file with the newest live entries; appends racing with this may be lost."""
+        keep = list(self.entries.values())[-self.max_entries:]
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            for entry in keep:
+                file.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+        self.file_id = None
+        self._refresh()
+
+    def lookup(self, question, embed=None):
+        """
+        Answer text for `question`, or None. embed(question) is only called
+        when there is no exact match and some entry has an embedding.
+        """
+        key = normalize_text(question)
+        with self.lock:
+            self._refresh()
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.exact_hits += 1
+                return entry["answer"]
+            if embed is None or not self.vectors:
+                self.misses += 1
+                return None
+        vector = unit_vector(embed(question))
+        with self.lock:
+            if self.matrix is None and self.vectors:
+                self.matrix_keys = list(self.vectors)
+                self.matrix = np.vstack([self.vectors[key] for key in self.matrix_keys])
+            if self.matrix is not None:
+                similarities = self.matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold and self.matrix_keys[best] in self.entries:
+                    self.similar_hits += 1
+                    return self.entries[self.matrix_keys[best]]["answer"]
+            self.misses += 1
+            return None
+
+    def add(self, question, answer, vector=None, seeded=False):
+        """Record that `question` was answered with `answer`; returns False when already known."""
+        key = normalize_text(question)
+        entry = {
+            "question": key,
+            "answer": answer,
+            "vector": base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+            if vector is not None else None,
+            "generation": None if seeded else read_index_generation(self.generation_path)
+        }
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with self.lock:
+            self._refresh()
+            known = self.entries.get(key)
+            if known is not None and known["answer"] == answer and (vector is None or key in self.vectors) \
+                    and (known.get("generation") is None or not seeded):
+                return False
+            # One O_APPEND write per entry, so lines from several workers do not interleave
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+            self._refresh()
+            if self.lines > 2 * self.max_entries:
+                self._compact()
+        return True
+
+    def stats(self):
+        with self.lock:
+            total = self.exact_hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.similar_hits) / total if total else 0.0
+            }
+
+class ReplyAudioCache:
+    """
+    Finished reply audio stored as raw PCM16 files, one per (answer text, voice).
+
+    Keys use the normalized answer text, so punctuation and casing
+    differences share a clip. Reads refresh a file's mtime and the least
+    recently used clips are deleted once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, directory=REPLY_AUDIO_CACHE_DIR, max_bytes=REPLY_AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.answers = SpokenAnswerIndex(os.path.join(directory, ANSWER_INDEX_NAME))
+        self.total_bytes = sum(entry.stat().st_size for entry in os.scandir(directory)
+                               if entry.name.endswith(".pcm"))
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text, voice):
+        return hashlib.sha256(f"{voice}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def path(self, text, voice):
+        return os.path.join(self.directory, self.key(text, voice) + ".pcm")
+
+    def get(self, text, voice):
+        path = self.path(text, voice)
+        try:
+            with open(path, "rb") as file:
+                pcm_bytes = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return pcm_bytes
+
+    def put(self, text, voice, pcm_bytes, replace=True):
+        """Store a clip; with replace=False an existing clip for the same text is kept."""
+        if not pcm_bytes or len(pcm_bytes) > MAX_CLIP_BYTES:
+            return False
+        path = self.path(text, voice)
+        with self.lock:
+            if not replace and os.path.exists(path):
+                return False
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(pcm_bytes)
+            os.replace(tmp_path, path)
+            self.total_bytes += len(pcm_bytes) - previous
+            self.stores += 1
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+        return True
+
+    def evict(self):
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith(".pcm")),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "answers": self.answers.stats()
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_reply_audio_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None and REPLY_AUDIO_CACHE_ENABLED:
+            _cache = ReplyAudioCache()
+        return _cache
+
+async def render_phrase(ws, text):
+    """Have the realtime session speak `text` and return the PCM16 audio."""
+    await ws.send(json.dumps({
+        "type": "response.create",
+        "response": {
+            "conversation": "none",
+            "metadata": {"topic": "warmup"},
+            "modalities": ["text", "audio"],
+            "instructions": f"Say exactly the following text and nothing else: {text}",
+            "input": []
+        }
+    }))
+    chunks = []
+    while True:
+        data = json.loads(await ws.recv())
+        if data['type'] == "response.audio.delta":
+            chunks.append(decode_pcm16(data['delta']))
+        elif data['type'] == "response.done":
+            return b"".join(chunks)
+        elif data['type'] == "error":
+            raise RuntimeError(f"Realtime error while rendering phrase: {data.get('error')}")
+
+async def warm(phrases, voice):
+    """Render every phrase that has no clip yet and map its caller questions to it."""
+    # Imported here so the cache itself does not depend on the websocket client
+    from realtime_session import open_realtime_session
+    cache = get_reply_audio_cache() or ReplyAudioCache()
+    service = get_retrieval_service()
+    ws = await open_realtime_session()
+    try:
+        for questions, text in phrases:
+            if cache.get(text, voice) is not None:
+                print(f"Cached already: {text}")
+            else:
+                pcm_bytes = await render_phrase(ws, text)
+                cache.put(text, voice, pcm_bytes)
+                print(f"Rendered {len(pcm_bytes) / (SAMPLE_RATE * BYTES_PER_SAMPLE):.1f}s: {text}")
+            for question in questions:
+                cache.answers.add(question, text, service.embed_query(question), seeded=True)
+    finally:
+        await ws.close()
+
+if __name__ == "__main__":
+    from realtime_session import SESSION_CONFIG
+    parser = argparse.ArgumentParser(description="Manage the pre-synthesized reply audio cache")
+    parser.add_argument("command", choices=["warm", "stats"])
+    parser.add_argument("--phrases", default=CACHED_PHRASES_PATH, help="file with one phrase per line")
+    parser.add_argument("--voice", default=SESSION_CONFIG["voice"])
+    args = parser.parse_args()
+    if args.command == "warm":
+        asyncio.run(warm(load_phrases(args.phrases), args.voice))
+    else:
+        print(json.dumps((get_reply_audio_cache() or ReplyAudioCache()).stats(), indent=2))
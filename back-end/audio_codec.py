@@ -0,0 +1,63 @@
+import base64
+import binascii
+import numpy as np
+
+# The realtime API streams and accepts mono 16-bit little-endian PCM at 24 kHz.
+SAMPLE_RATE = 24000
+PCM16_SCALE = 32767.0
+BYTES_PER_SAMPLE = 2
+
+def float_to_pcm16(float32_array):
+    """
+    Convert float samples in [-1.0, 1.0] to int16 PCM.
+    Samples are clipped first and then scaled by 32767 with rounding, so
+    pcm16_to_float followed by float_to_pcm16 gives back the original samples.
+    """
+    samples = np.asarray(float32_array, dtype=np.float32)
+    clipped = np.clip(samples, -1.0, 1.0)
+    return np.rint(clipped * PCM16_SCALE).astype('<i2')
+
+def pcm16_to_float(pcm16):
+    """Convert int16 PCM (array or raw little-endian bytes) to float32 samples."""
+    if isinstance(pcm16, (bytes, bytearray, memoryview)):
+        pcm16 = np.frombuffer(pcm16, dtype='<i2')
+    return pcm16.astype(np.float32) / PCM16_SCALE
+
+def float_to_pcm16_bytes(float32_array):
+    return float_to_pcm16(float32_array).tobytes()
+
+def encode_pcm16(pcm16):
+    """Base64 encode int16 PCM given either as an array or as raw bytes."""
+    if isinstance(pcm16, np.ndarray):
+        pcm16 = pcm16.astype('<i2', copy=False).tobytes()
+    return base64.b64encode(pcm16).decode('ascii')
+
+def decode_pcm16(encoded_str):
+    """Decode a base64 PCM16 payload (str, bytes or memoryview) into raw little-endian bytes."""
+    # a2b_base64 reads buffers in place; b64decode would copy a memoryview first
+    return binascii.a2b_base64(encoded_str)
+
+def encode_float(float32_array):
+    """Clip, scale and base64 encode float samples as PCM16."""
+    return encode_pcm16(float_to_pcm16_bytes(float32_array))
+
+def decode_float(encoded_str):
+    """Decode a base64 PCM16 payload into float32 samples."""
+    return pcm16_to_float(decode_pcm16(encoded_str))
+
+def join_pcm16(encoded_chunks):
+    """
+    Int16 pass-through: decode base64 PCM16 chunks and join the raw bytes.
+    The upstream deltas are already PCM16, so no float conversion is needed.
+    """
+    return b"".join(binascii.a2b_base64(chunk) for chunk in encoded_chunks)
+
+def join_pcm16_base64(encoded_chunks):
+    """Join base64 PCM16 chunks into a single base64 PCM16 payload."""
+    pcm_bytes = join_pcm16(encoded_chunks)
+    if not pcm_bytes:
+        return ""
+    return encode_pcm16(pcm_bytes)
+
+def pcm16_duration_ms(num_bytes, sample_rate=SAMPLE_RATE):
+    return 1000.0 * num_bytes / (BYTES_PER_SAMPLE * sample_rate)
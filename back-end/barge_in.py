@@ -0,0 +1,94 @@
+import os
+from dotenv import load_dotenv
+from metrics import ABANDONED_WORK, BARGE_INS, CANCELLED_AUDIO_BYTES, CANCELLED_WORK
+from session_limits import BoundedSet
+
+load_dotenv()
+
+# Opt-in: cancel pending retrieval and reply audio when the caller starts speaking again
+BARGE_IN = os.environ.get("BARGE_IN", "0") == "1"
+
+class BargeIn:
+    """
+    Barge-in bookkeeping for one session.
+
+    Replies are out-of-band responses, so server VAD never interrupts them
+    and each one has to be cancelled by id. This tracks replies from the
+    response.create (by turn id) through response.created to response.done.
+    When the caller starts speaking, interrupt() marks every reply still in
+    flight as cancelled, including ones whose response.created has not
+    arrived yet. Utterances still waiting for their transcript have no reply
+    yet and are answered as usual.
+    """
+
+    def __init__(self):
+        self.requested_turns = BoundedSet()
+        self.cancelled_turns = BoundedSet()
+        self.active_responses = BoundedSet()
+        self.cancelled_responses = BoundedSet()
+
+        self.barge_ins = 0
+        self.cancelled = {kind: 0 for kind in CANCELLED_WORK}
+        self.abandoned = {kind: 0 for kind in ABANDONED_WORK}
+        self.dropped_audio_bytes = 0
+
+    def on_response_requested(self, turn_id):
+        self.requested_turns.add(turn_id)
+
+    def on_response_created(self, response_id, turn_id):
+        """Returns True when the response belongs to a turn the caller already interrupted."""
+        self.requested_turns.discard(turn_id)
+        if turn_id in self.cancelled_turns:
+            self.cancelled_turns.discard(turn_id)
+            self.cancelled_responses.add(response_id)
+            return True
+        self.active_responses.add(response_id)
+        return False
+
+    def on_response_done(self, response_id):
+        self.active_responses.discard(response_id)
+
+    def is_cancelled(self, response_id):
+        return response_id in self.cancelled_responses
+
+    def interrupt(self):
+        """The caller started speaking; returns the ids of responses to cancel upstream."""
+        for turn_id in self.requested_turns:
+            self.cancelled_turns.add(turn_id)
+            self.count("response")
+        self.requested_turns.clear()
+        responses = list(self.active_responses)
+        for response_id in responses:
+            self.cancelled_responses.add(response_id)
+            self.count("response")
+        self.active_responses.clear()
+        return responses
+
+    def count(self, kind, amount=1):
+        if amount:
+            self.cancelled[kind] += amount
+            CANCELLED_WORK[kind].inc(amount)
+
+    def count_abandoned(self, kind, amount=1):
+        if amount:
+            self.abandoned[kind] += amount
+            ABANDONED_WORK[kind].inc(amount)
+
+    def record(self, cancelled_any):
+        if cancelled_any:
+            self.barge_ins += 1
+            BARGE_INS.inc()
+
+    def drop_audio(self, byte_count):
+        if byte_count:
+            self.dropped_audio_bytes += byte_count
+            CANCELLED_AUDIO_BYTES.inc(byte_count)
+
+    def stats(self):
+        return {
+            "barge_ins": self.barge_ins,
+            "cancelled": dict(self.cancelled),
+            "abandoned": dict(self.abandoned),
+            "dropped_audio_bytes": self.dropped_audio_bytes,
+            "active_responses": len(self.active_responses)
+        }
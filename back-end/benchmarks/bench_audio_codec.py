@@ -0,0 +1,77 @@
+"""
+Micro-benchmark for the PCM16/base64 audio codec.
+
+Compares the original per-sample struct.pack encoder and the
+decode -> float32 -> re-encode reply path against audio_codec.
+
+Run from the back-end directory:
+    python benchmarks/bench_audio_codec.py --seconds 5
+"""
+import argparse
+import base64
+import os
+import struct
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_codec import SAMPLE_RATE, encode_float, encode_pcm16, join_pcm16_base64
+
+# Original utils.py implementation, kept here as the baseline
+def legacy_float_to_16bit_pcm(float32_array):
+    clipped = [max(-1.0, min(1.0, x)) for x in float32_array]
+    pcm16 = b''.join(struct.pack('<h', int(x * 32767)) for x in clipped)
+    return pcm16
+
+def legacy_base64_encode_audio(float32_array):
+    pcm_bytes = legacy_float_to_16bit_pcm(float32_array)
+    return base64.b64encode(pcm_bytes).decode('ascii')
+
+# Original response.audio.done path: reconstruct_audio + utils.base64_encode_audio
+def legacy_reply_path(deltas):
+    decoded = [np.frombuffer(base64.b64decode(d), dtype=np.int16).astype(np.float32) / 32767.0
+               for d in deltas]
+    return legacy_base64_encode_audio(np.concatenate(decoded))
+
+def vectorized_reply_path(deltas):
+    decoded = [np.frombuffer(base64.b64decode(d), dtype=np.int16).astype(np.float32) / 32767.0
+               for d in deltas]
+    return encode_float(np.concatenate(decoded))
+
+def make_deltas(samples, delta_ms=50):
+    pcm = (np.random.default_rng(0).standard_normal(samples) * 4000).astype('<i2')
+    step = SAMPLE_RATE * delta_ms // 1000
+    return [encode_pcm16(pcm[i:i + step]) for i in range(0, samples, step)]
+
+def bench(label, fn, repeat, audio_seconds):
+    best = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f"{label:<40} {best * 1000:9.2f} ms  ({best * 1000 / audio_seconds:7.3f} ms per audio second)")
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0, help="seconds of 24 kHz audio")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = int(SAMPLE_RATE * args.seconds)
+    float_audio = np.random.default_rng(1).uniform(-1.2, 1.2, samples).astype(np.float32)
+    deltas = make_deltas(samples)
+
+    print(f"{args.seconds:g} s of audio, {samples} samples, {len(deltas)} deltas\n")
+    print("Float32 -> base64 PCM16 encode")
+    legacy = bench("  utils.base64_encode_audio (struct.pack)", lambda: legacy_base64_encode_audio(float_audio), args.repeat, args.seconds)
+    new = bench("  audio_codec.encode_float", lambda: encode_float(float_audio), args.repeat, args.seconds)
+    print(f"  speedup: {legacy / new:.1f}x\n")
+
+    print("response.audio.done reply path")
+    legacy = bench("  decode -> float32 -> struct.pack", lambda: legacy_reply_path(deltas), args.repeat, args.seconds)
+    vec = bench("  decode -> float32 -> vectorized", lambda: vectorized_reply_path(deltas), args.repeat, args.seconds)
+    new = bench("  audio_codec.join_pcm16_base64", lambda: join_pcm16_base64(deltas), args.repeat, args.seconds)
+    print(f"  speedup: {legacy / vec:.1f}x vectorized, {legacy / new:.1f}x pass-through")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Micro-benchmark for the reply audio codecs negotiated on /ws.
+
+Encodes synthetic speech-like audio the way the streaming reply path
+does (one call per STREAM_MIN_CHUNK_MS chunk) and as whole clips, and
+reports encode cost per second of audio, bytes on the wire per second
+of audio, and the signal-to-noise ratio after decoding.
+
+Run from the back-end directory:
+    python benchmarks/bench_output_codecs.py --seconds 5
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_codec import BYTES_PER_SAMPLE, SAMPLE_RATE
+from output_codecs import CODEC_ADPCM, CODEC_MULAW, CODEC_PCM16, DECODERS, encode_reply_audio
+from reply_stream import STREAM_MIN_CHUNK_MS
+
+def make_speech(samples):
+    """Harmonics of a wandering pitch under a syllable-rate envelope, plus a little noise."""
+    rng = np.random.default_rng(0)
+    t = np.arange(samples) / SAMPLE_RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    audio = 6000 * voice * envelope + rng.standard_normal(samples) * 150
+    return np.clip(audio, -32768, 32767).astype('<i2')
+
+def snr_db(reference, decoded):
+    reference = reference.astype(np.float64)
+    noise = reference - decoded.astype(np.float64)
+    return 10 * np.log10(np.sum(reference ** 2) / max(np.sum(noise ** 2), 1e-9))
+
+def base64_size(size):
+    return (size + 2) // 3 * 4
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0, help="seconds of 24 kHz audio")
+    parser.add_argument("--chunk-ms", type=int, default=STREAM_MIN_CHUNK_MS, help="streamed reply chunk length")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = int(SAMPLE_RATE * args.seconds)
+    pcm = make_speech(samples)
+    step = SAMPLE_RATE * args.chunk_ms // 1000
+    chunks = [pcm[i:i + step].tobytes() for i in range(0, samples, step)]
+    clip = pcm.tobytes()
+
+    print(f"{args.seconds:g} s of audio, {len(chunks)} chunks of {args.chunk_ms} ms\n")
+    print(f"{'codec':<8} {'chunked ms/s':>13} {'clip ms/s':>10} {'bytes/s':>9} {'base64/s':>9} "
+          f"{'ratio':>6} {'saved':>6} {'SNR dB':>7}")
+    raw_per_second = SAMPLE_RATE * BYTES_PER_SAMPLE
+    for codec in (CODEC_PCM16, CODEC_MULAW, CODEC_ADPCM):
+        chunked = min(timeit.repeat(lambda: [encode_reply_audio(codec, chunk) for chunk in chunks],
+                                    number=1, repeat=args.repeat))
+        whole = min(timeit.repeat(lambda: encode_reply_audio(codec, clip), number=1, repeat=args.repeat))
+        encoded = [encode_reply_audio(codec, chunk) for chunk in chunks]
+        size = sum(len(data) for data in encoded) / args.seconds
+        wire = sum(base64_size(len(data)) for data in encoded) / args.seconds
+        if codec in DECODERS:
+            decoded = np.frombuffer(b"".join(DECODERS[codec](data) for data in encoded), dtype='<i2')
+            quality = f"{snr_db(pcm, decoded):7.1f}"
+        else:
+            quality = f"{'exact':>7}"
+        print(f"{codec:<8} {chunked * 1000 / args.seconds:13.2f} {whole * 1000 / args.seconds:10.2f} "
+              f"{size:9.0f} {wire:9.0f} {raw_per_second / size:6.2f} {1 - size / raw_per_second:6.0%} {quality}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Micro-benchmark for upstream event handling in OpenAITranscriber.
+
+Feeds recorded-shape realtime events (a reply made of audio deltas plus
+the transcript and lifecycle events around it) straight into
+on_openai_message with a stub client, and reports events per second on
+one core. Frames are given as text (the websockets default) or as raw
+bytes (recv(decode=False)), which is what the audio delta fast path reads.
+The legacy line is the original on_openai_message kept as a baseline:
+json.loads on text, asyncio.get_event_loop() and an if/elif chain on
+every event; its reply audio is joined with audio_codec so that only the
+dispatch differs. The parse-only lines time turning frames into events,
+without the base64 decoding and client sends that follow.
+
+Run from the back-end directory:
+    python benchmarks/bench_upstream_dispatch.py --replies 200
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Nothing here talks to OpenAI, but importing the RAG module builds its clients
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("REPLY_AUDIO_CACHE_MAX_BYTES", "0")
+
+from audio_codec import SAMPLE_RATE, join_pcm16_base64
+from client_protocol import PROTOCOL_BINARY
+from transcription import OpenAITranscriber
+from upstream_events import JSON_BACKEND, parse_event
+
+class NullWebSocket:
+    async def send_json(self, message):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+def reply_events(response_id, deltas, delta_ms):
+    """One spoken reply as the realtime API sends it, in compact JSON."""
+    samples = SAMPLE_RATE * delta_ms // 1000
+    audio = base64.b64encode((np.random.default_rng(0).standard_normal(samples) * 3000).astype('<i2').tobytes()).decode()
+    common = {"response_id": response_id, "item_id": "item_" + response_id, "output_index": 0, "content_index": 0}
+    events = [{"type": "response.created", "event_id": "event_a", "response": {
+        "object": "realtime.response", "id": response_id, "status": "in_progress", "metadata": None, "output": []}}]
+    for index in range(deltas):
+        events.append({"type": "response.audio.delta", "event_id": f"event_d{index}", **common, "delta": audio})
+        events.append({"type": "response.audio_transcript.delta", "event_id": f"event_t{index}", **common,
+                       "delta": " word"})
+    events.append({"type": "response.audio.done", "event_id": "event_b", **common})
+    events.append({"type": "response.audio_transcript.done", "event_id": "event_c", **common,
+                   "transcript": "A simulated answer."})
+    events.append({"type": "response.done", "event_id": "event_e", "response": {
+        "object": "realtime.response", "id": response_id, "status": "completed", "metadata": None, "output": []}})
+    return [json.dumps(event, separators=(",", ":")) for event in events]
+
+# Original transcription.py dispatch, minus the session.created and transcript branches the events never hit
+class LegacyDispatcher:
+    def __init__(self, client_websocket):
+        self.client_websocket = client_websocket
+        self.current_audio = []
+
+    async def on_openai_message(self, message):
+        data = json.loads(message)
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+        if(data['type'] == "response.text.delta"):
+            pass
+        elif(data['type'] == "response.audio.delta"):
+            self.current_audio.append(data['delta'])
+        elif(data['type'] == "response.audio.done"):
+            if(len(self.current_audio) >= 0):
+                base_64_audio = join_pcm16_base64(self.current_audio)
+                if base_64_audio:
+                    await self.client_websocket.send_json({"event_type": "audio_response_transmitting",
+                                                           "event_data": base_64_audio})
+                self.current_audio = []
+        elif(data['type'] == "response.done"):
+            try:
+                if(data['metadata']['topic'] == "rag"):
+                    rag_response = data['response']['output']['content']['text']
+            except:
+                pass
+        else:
+            pass
+
+async def run_legacy(frames):
+    dispatcher = LegacyDispatcher(NullWebSocket())
+    started_cpu = time.process_time()
+    for frame in frames:
+        await dispatcher.on_openai_message(frame)
+    return time.process_time() - started_cpu
+
+async def run(frames):
+    transcriber = OpenAITranscriber(NullWebSocket())
+    transcriber.loop = asyncio.get_running_loop()
+    # Binary clients get the PCM as is, so the numbers are not dominated by re-encoding for the browser
+    transcriber.client.protocol = PROTOCOL_BINARY
+    started_cpu = time.process_time()
+    for frame in frames:
+        await transcriber.on_openai_message(frame)
+    return time.process_time() - started_cpu
+
+def parse_only(frames, parse):
+    started_cpu = time.process_time()
+    for frame in frames:
+        parse(frame)
+    return time.process_time() - started_cpu
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--replies", type=int, default=200)
+    parser.add_argument("--deltas", type=int, default=20, help="audio deltas per reply")
+    parser.add_argument("--delta-ms", type=int, default=100, help="audio per delta")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text_frames = [frame for index in range(args.replies)
+                   for frame in reply_events(f"resp_{index}", args.deltas, args.delta_ms)]
+    byte_frames = [frame.encode() for frame in text_frames]
+    deltas = args.replies * args.deltas
+    print(f"{len(text_frames)} events, {deltas} audio deltas of {args.delta_ms} ms "
+          f"({len(text_frames[1])} bytes each), JSON backend {JSON_BACKEND}\n")
+    legacy = None
+    for label, frames, runner in (("legacy if/elif", text_frames, run_legacy),
+                                  ("text frames", text_frames, run),
+                                  ("byte frames", byte_frames, run)):
+        try:
+            best = min(asyncio.run(runner(frames)) for _ in range(args.repeat))
+        except TypeError as e:
+            print(f"{label:<14} unsupported ({e})")
+            continue
+        legacy = legacy or best
+        print(f"{label:<14} {len(frames) / best:10.0f} events/s per core  "
+              f"{1e6 * best / len(frames):6.2f} us/event  "
+              f"{1000 * best / (deltas * args.delta_ms / 1000):6.2f} ms CPU per audio second  "
+              f"{legacy / best:4.1f}x")
+
+    print()
+    for label, frames, parse in (
+            ("parse only, json.loads on text", text_frames, json.loads),
+            ("parse only, full parse", byte_frames, lambda frame: parse_event(frame, fast_path=False)),
+            ("parse only, delta fast path", byte_frames, lambda frame: parse_event(frame, fast_path=True))):
+        best = min(parse_only(frames, parse) for _ in range(args.repeat))
+        print(f"{label:<32} {len(frames) / best:10.0f} events/s per core  {1e6 * best / len(frames):6.2f} us/event")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Local stand-ins for the embedding API and the vector store, for load testing.
+
+FakeEmbeddingServer answers POST /v1/embeddings with deterministic
+hashed bag-of-words vectors after a configurable delay; point
+OPENAI_BASE_URL (and OPENAI_API_BASE for langchain) at it.
+Instead of a fake Qdrant, build_synthetic_index writes a local index
+snapshot from generated chunks so the app can run with RAG_BACKEND=local.
+
+Run standalone from the back-end directory:
+    python benchmarks/fake_embeddings.py --port 8766 --index ./data/loadtest_index
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_index import export_local_index
+
+EMBEDDING_DIMENSIONS = 1536
+
+TOPICS = ["visiting hours", "parking", "appointments", "pharmacy", "emergency department",
+          "medical records", "insurance", "cardiology", "radiology", "billing"]
+
+def fake_embedding(item, dimensions=EMBEDDING_DIMENSIONS):
+    """Hashed bag-of-words vector; `item` is a string or a list of token ids."""
+    tokens = item.lower().split() if isinstance(item, str) else item
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in tokens:
+        vector[zlib.crc32(str(token).encode("utf-8")) % dimensions] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class FakeEmbeddingServer:
+    def __init__(self, host="127.0.0.1", port=8766, latency_ms=50, dimensions=EMBEDDING_DIMENSIONS):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.dimensions = dimensions
+        self.requests = 0
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def embed_response(self, body):
+        inputs = body["input"]
+        # A single string or a single token list is one input
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        as_base64 = body.get("encoding_format") == "base64"
+        data = []
+        for index, item in enumerate(inputs):
+            vector = fake_embedding(item, self.dimensions)
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii") if as_base64 else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        return {"object": "list", "data": data, "model": body.get("model", "fake"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/embeddings"):
+                    self.send_error(404)
+                    return
+                server.requests += 1
+                time.sleep(server.latency_ms / 1000)
+                payload = json.dumps(server.embed_response(body)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+def build_synthetic_index(path, chunks=2000, dimensions=EMBEDDING_DIMENSIONS):
+    """Write a local index snapshot of generated hospital-information chunks."""
+    texts = []
+    for i in range(chunks):
+        topic = TOPICS[i % len(TOPICS)]
+        texts.append(f"Greenview Medical Centre information about {topic}, section {i}. "
+                     f"Patients asking about {topic} should contact the front desk or see notice {i}.")
+    vectors = np.stack([fake_embedding(text, dimensions) for text in texts])
+    metadatas = [{"source": "synthetic", "page": i} for i in range(chunks)]
+    export_local_index(texts, metadatas, vectors, path)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake embedding API and synthetic local index")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency-ms", type=int, default=50)
+    parser.add_argument("--index", help="write a synthetic local index snapshot to this path first")
+    parser.add_argument("--chunks", type=int, default=2000)
+    args = parser.parse_args()
+    if args.index:
+        build_synthetic_index(args.index, args.chunks)
+        print(f"Wrote {args.chunks} synthetic chunks to {args.index}")
+    embedding_server = FakeEmbeddingServer(args.host, args.port, args.latency_ms).start()
+    print(f"Fake embedding API at {embedding_server.base_url}")
+    try:
+        embedding_server.thread.join()
+    except KeyboardInterrupt:
+        embedding_server.close()
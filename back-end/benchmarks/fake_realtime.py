@@ -0,0 +1,202 @@
+"""
+Local stand-in for the OpenAI realtime websocket, for load testing.
+
+Speaks just enough of the protocol for transcription.py: the
+session.created / session.update / session.updated handshake,
+server-VAD style speech_started / speech_stopped events driven by the
+loudness of appended audio, transcription deltas and completion (word
+by word, or as one delta when the session asks for whisper-1), and
+response.create answered with a stream of audio deltas that
+response.cancel can stop. Every delay is
+configurable so upstream latency can be modelled without paying for it.
+
+Run standalone from the back-end directory:
+    python benchmarks/fake_realtime.py --port 8765
+and point the app at it with OPENAI_REALTIME_URL=ws://127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+from dataclasses import dataclass
+
+import numpy as np
+from websockets.asyncio.server import serve
+
+QUESTIONS = [
+    "What are the visiting hours for the general ward?",
+    "Where can I park my car at the hospital?",
+    "How do I book an appointment with a cardiologist?",
+    "Is the pharmacy open on Sundays?",
+    "What should I bring for my first appointment?",
+    "Do you have an emergency department open at night?",
+    "How can I get a copy of my medical records?",
+    "Which insurance plans does the hospital accept?",
+]
+
+@dataclass
+class FakeRealtimeTimings:
+    # Mean absolute sample value above which an appended chunk counts as speech
+    speech_level: int = 500
+    # Used when session.update does not carry turn_detection.silence_duration_ms
+    silence_ms: int = 500
+    # speech_stopped -> transcription.completed
+    transcribe_ms: int = 150
+    # response.create -> response.created and the first audio delta
+    first_audio_ms: int = 300
+    # Length of every spoken reply and of each delta within it
+    reply_ms: int = 2000
+    delta_ms: int = 100
+    # Pause between deltas; upstream sends audio faster than real time
+    delta_interval_ms: int = 20
+    sample_rate: int = 24000
+
+class FakeRealtimeSession:
+    def __init__(self, ws, timings, session_number):
+        self.ws = ws
+        self.timings = timings
+        self.silence_ms = timings.silence_ms
+        self.transcription_model = None
+        self.speaking = False
+        self.item_counter = itertools.count(1)
+        self.response_counter = itertools.count(1)
+        self.question_counter = itertools.count(session_number)
+        self.item_id = None
+        self.stop_task = None
+        self.tasks = set()
+        self.responses = {}
+        samples = timings.sample_rate * timings.delta_ms // 1000
+        tone = (np.sin(np.arange(samples) * 2 * np.pi * 220 / timings.sample_rate) * 3000).astype('<i2')
+        self.delta = base64.b64encode(tone.tobytes()).decode('ascii')
+
+    async def send(self, event):
+        # Compact, like the realtime API, so the audio delta fast path is exercised
+        await self.ws.send(json.dumps(event, separators=(",", ":")))
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def run(self):
+        await self.send({"type": "session.created", "session": {"id": "sess_fake"}})
+        try:
+            async for message in self.ws:
+                await self.on_event(json.loads(message))
+        finally:
+            for task in list(self.tasks):
+                task.cancel()
+
+    async def on_event(self, event):
+        if event["type"] == "session.update":
+            turn_detection = event["session"].get("turn_detection") or {}
+            self.silence_ms = turn_detection.get("silence_duration_ms", self.silence_ms)
+            self.transcription_model = (event["session"].get("input_audio_transcription") or {}).get("model")
+            await self.send({"type": "session.updated", "session": event["session"]})
+        elif event["type"] == "input_audio_buffer.append":
+            await self.on_audio(event["audio"])
+        elif event["type"] == "response.create":
+            response_id = f"resp_{next(self.response_counter)}"
+            self.responses[response_id] = self.spawn(self.respond(event["response"], response_id))
+        elif event["type"] == "response.cancel":
+            task = self.responses.pop(event.get("response_id"), None)
+            if task:
+                task.cancel()
+                await self.send({"type": "response.done", "response": {"id": event["response_id"], "status": "cancelled"}})
+
+    async def on_audio(self, audio):
+        samples = np.frombuffer(base64.b64decode(audio), dtype='<i2')
+        if not samples.size or np.abs(samples.astype(np.int32)).mean() < self.timings.speech_level:
+            return
+        if not self.speaking:
+            self.speaking = True
+            self.item_id = f"item_{next(self.item_counter)}"
+            await self.send({"type": "input_audio_buffer.speech_started", "item_id": self.item_id})
+        # Speech ends once no loud audio has arrived for silence_ms, however the silence is delivered
+        if self.stop_task:
+            self.stop_task.cancel()
+        self.stop_task = asyncio.create_task(self.end_of_speech(self.item_id))
+
+    async def end_of_speech(self, item_id):
+        await asyncio.sleep(self.silence_ms / 1000)
+        self.speaking = False
+        self.stop_task = None
+        await self.send({"type": "input_audio_buffer.speech_stopped", "item_id": item_id})
+        self.spawn(self.transcribe(item_id))
+
+    async def transcribe(self, item_id):
+        transcript = QUESTIONS[next(self.question_counter) % len(QUESTIONS)]
+        # whisper-1 does not stream: the whole transcript arrives as one delta just before completion
+        words = [transcript] if self.transcription_model == "whisper-1" else transcript.split(" ")
+        step = self.timings.transcribe_ms / 1000 / len(words)
+        for index, word in enumerate(words):
+            await asyncio.sleep(step)
+            await self.send({"type": "conversation.item.input_audio_transcription.delta",
+                             "item_id": item_id, "delta": word if index == 0 else " " + word})
+        await self.send({"type": "conversation.item.input_audio_transcription.completed",
+                         "item_id": item_id, "transcript": transcript})
+
+    async def respond(self, response, response_id):
+        timings = self.timings
+        await asyncio.sleep(timings.first_audio_ms / 1000)
+        await self.send({"type": "response.created",
+                         "response": {"id": response_id, "metadata": response.get("metadata")}})
+        for _ in range(max(1, timings.reply_ms // timings.delta_ms)):
+            await self.send({"type": "response.audio.delta", "response_id": response_id, "delta": self.delta})
+            await asyncio.sleep(timings.delta_interval_ms / 1000)
+        await self.send({"type": "response.audio_transcript.done", "response_id": response_id,
+                         "transcript": "This is a simulated answer from the fake realtime server."})
+        await self.send({"type": "response.audio.done", "response_id": response_id})
+        self.responses.pop(response_id, None)
+        await self.send({"type": "response.done", "response": {"id": response_id, "status": "completed"}})
+
+class FakeRealtimeServer:
+    def __init__(self, host="127.0.0.1", port=8765, timings=None):
+        self.host = host
+        self.port = port
+        self.timings = timings or FakeRealtimeTimings()
+        self.server = None
+        self.sessions = 0
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    async def handler(self, ws):
+        self.sessions += 1
+        await FakeRealtimeSession(ws, self.timings, self.sessions).run()
+
+    async def start(self):
+        self.server = await serve(self.handler, self.host, self.port, max_size=None)
+        return self
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+def add_timing_arguments(parser):
+    defaults = FakeRealtimeTimings()
+    for name in ("speech_level", "silence_ms", "transcribe_ms", "first_audio_ms",
+                 "reply_ms", "delta_ms", "delta_interval_ms"):
+        parser.add_argument("--" + name.replace("_", "-"), type=int, default=getattr(defaults, name))
+
+def timings_from_arguments(args):
+    return FakeRealtimeTimings(**{name: getattr(args, name) for name in (
+        "speech_level", "silence_ms", "transcribe_ms", "first_audio_ms",
+        "reply_ms", "delta_ms", "delta_interval_ms")})
+
+async def main(args):
+    server = await FakeRealtimeServer(args.host, args.port, timings_from_arguments(args)).start()
+    print(f"Fake realtime server listening on {server.url}")
+    await asyncio.Future()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI realtime websocket server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_timing_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
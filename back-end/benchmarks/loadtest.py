@@ -0,0 +1,294 @@
+"""
+Load test for one app.py worker against local stand-ins.
+
+Starts the fake realtime server and the fake embedding API in this
+process, writes a synthetic local index, launches the app under uvicorn
+as a subprocess pointed at them, then opens N simulated browser clients
+on /ws for each concurrency level. Every client streams
+audio_input_transmitting PCM16 in real time: a loud utterance, then
+silence until the reply has arrived, for the requested number of turns.
+
+Reported per level: turn latency percentiles (last speech chunk sent to
+first reply audio received, and to the end of the reply), CPU and memory
+per session of the app process, and failed turns. The maximum sustainable
+concurrency is the highest level whose p95 stays within --slo-ms with no
+failed turns.
+
+Nothing leaves the machine, except that langchain's embedding client
+tokenizes with tiktoken, whose encoding files must already be cached.
+
+Run from the back-end directory:
+    python benchmarks/loadtest.py --levels 1,10,25,50 --turns 3
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+from websockets.asyncio.client import connect
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from client_protocol import FRAME_AUDIO_CHUNK, FRAME_AUDIO_CLIP, FRAME_AUDIO_INPUT, decode_frame, encode_frame
+from fake_embeddings import FakeEmbeddingServer, build_synthetic_index
+from fake_realtime import FakeRealtimeServer, add_timing_arguments, timings_from_arguments
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def single_process_usage(pid):
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu_seconds, rss, int(fields[1])
+
+def process_usage(pid):
+    """Return (cpu_seconds, rss_bytes) summed over a process and its children (uvicorn workers)."""
+    if psutil:
+        root = psutil.Process(pid)
+        cpu_seconds, rss = 0.0, 0
+        for process in [root, *root.children(recursive=True)]:
+            times = process.cpu_times()
+            cpu_seconds += times.user + times.system
+            rss += process.memory_info().rss
+        return cpu_seconds, rss
+    usage = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                usage[int(entry)] = single_process_usage(entry)
+            except (OSError, IndexError, ValueError):
+                pass
+    tree = {pid}
+    changed = True
+    while changed:
+        children = {child for child, (_, _, parent) in usage.items() if parent in tree}
+        changed = not children <= tree
+        tree |= children
+    return (sum(usage[p][0] for p in tree if p in usage),
+            sum(usage[p][1] for p in tree if p in usage))
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else float("nan")
+
+def audio_chunks(args):
+    samples = args.chunk_samples
+    t = np.arange(samples) / args.input_rate
+    speech = (np.sin(2 * np.pi * 220 * t) * 8000).astype('<i2')
+    silence = np.zeros(samples, dtype='<i2')
+    if args.binary:
+        return speech.tobytes(), silence.tobytes()
+    return (base64.b64encode(speech.tobytes()).decode('ascii'),
+            base64.b64encode(silence.tobytes()).decode('ascii'))
+
+async def run_client(url, args, speech, silence, results):
+    """One simulated caller; appends per-turn latencies (or None for a failed turn) to results."""
+    chunk_seconds = args.chunk_samples / args.input_rate
+    speech_chunks = max(1, round(args.speech_ms / 1000 / chunk_seconds))
+    async with connect(url, max_size=None) as ws:
+        first_audio = asyncio.Event()
+        reply_done = asyncio.Event()
+        negotiated = asyncio.Event()
+        received = {"first": None, "done": None}
+
+        async def reader():
+            async for message in ws:
+                if isinstance(message, bytes):
+                    frame_type = decode_frame(message)[0]
+                    event_type = {FRAME_AUDIO_CHUNK: "audio_response_chunk",
+                                  FRAME_AUDIO_CLIP: "audio_response_transmitting"}.get(frame_type)
+                else:
+                    data = json.loads(message)
+                    event_type = data.get("event_type")
+                    if event_type == "hello":
+                        negotiated.set()
+                if event_type in ("audio_response_chunk", "audio_response_transmitting") and not first_audio.is_set():
+                    received["first"] = time.monotonic()
+                    first_audio.set()
+                if event_type in ("audio_response_end", "audio_response_transmitting"):
+                    received["done"] = time.monotonic()
+                    reply_done.set()
+
+        reader_task = asyncio.create_task(reader())
+        if args.binary:
+            await ws.send(json.dumps({"event_type": "hello", "protocol": "binary", "version": 1}))
+            await asyncio.wait_for(negotiated.wait(), args.turn_timeout)
+        next_send = time.monotonic()
+        seq = 0
+
+        async def send_chunk(data):
+            nonlocal next_send, seq
+            if args.binary:
+                await ws.send(encode_frame(FRAME_AUDIO_INPUT, data, seq=seq))
+                seq += 1
+            else:
+                await ws.send(json.dumps({"event_type": "audio_input_transmitting", "event_data": data}))
+            # Real-time pacing, like the browser's ScriptProcessor callbacks
+            next_send += chunk_seconds
+            await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+
+        try:
+            for _ in range(args.turns):
+                first_audio.clear()
+                reply_done.clear()
+                for _ in range(speech_chunks):
+                    await send_chunk(speech)
+                speech_end = time.monotonic()
+                deadline = speech_end + args.turn_timeout
+                while not reply_done.is_set() and time.monotonic() < deadline:
+                    await send_chunk(silence)
+                if reply_done.is_set():
+                    results.append((received["first"] - speech_end, received["done"] - speech_end))
+                else:
+                    results.append(None)
+        finally:
+            reader_task.cancel()
+
+async def run_level(url, clients, args, app_pid):
+    speech, silence = audio_chunks(args)
+    results = []
+    cpu_before, rss_before = process_usage(app_pid)
+    peak_rss = rss_before
+    started = time.monotonic()
+
+    async def client(index):
+        await asyncio.sleep(index * args.ramp_ms / 1000)
+        turns = []
+        try:
+            await run_client(url, args, speech, silence, turns)
+        except Exception as e:
+            print(f"client {index} failed: {e}")
+            turns.extend([None] * (args.turns - len(turns)))
+        results.extend(turns)
+
+    tasks = [asyncio.create_task(client(i)) for i in range(clients)]
+    while not all(task.done() for task in tasks):
+        await asyncio.sleep(0.25)
+        peak_rss = max(peak_rss, process_usage(app_pid)[1])
+    wall = time.monotonic() - started
+    cpu_after, _ = process_usage(app_pid)
+
+    ok = [r for r in results if r is not None]
+    first = [r[0] * 1000 for r in ok]
+    done = [r[1] * 1000 for r in ok]
+    return {
+        "clients": clients,
+        "turns": len(results),
+        "failed": len(results) - len(ok),
+        "p50_ms": percentile(first, 50),
+        "p95_ms": percentile(first, 95),
+        "p99_ms": percentile(first, 99),
+        "reply_p95_ms": percentile(done, 95),
+        "cpu_per_session": (cpu_after - cpu_before) / wall / clients,
+        "mem_per_session_mb": (peak_rss - rss_before) / clients / (1024 * 1024),
+        "rss_mb": peak_rss / (1024 * 1024),
+    }
+
+def wait_for_app(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1)
+            return True
+        except Exception:
+            time.sleep(0.25)
+    return False
+
+def print_row(row):
+    print(f"{row['clients']:>7} {row['turns']:>6} {row['failed']:>6} "
+          f"{row['p50_ms']:>8.0f} {row['p95_ms']:>8.0f} {row['p99_ms']:>8.0f} {row['reply_p95_ms']:>10.0f} "
+          f"{row['cpu_per_session'] * 100:>8.1f}% {row['mem_per_session_mb']:>9.2f} {row['rss_mb']:>8.1f}")
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    index_path = os.path.join(workdir, "index")
+    build_synthetic_index(index_path, args.chunks)
+
+    realtime = await FakeRealtimeServer(port=args.realtime_port, timings=timings_from_arguments(args)).start()
+    embeddings = FakeEmbeddingServer(port=args.embedding_port, latency_ms=args.embedding_latency_ms).start()
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "sk-loadtest"),
+        "OPENAI_REALTIME_URL": realtime.url,
+        "OPENAI_BASE_URL": embeddings.base_url,
+        "OPENAI_API_BASE": embeddings.base_url,
+        "RAG_BACKEND": "local",
+        "LOCAL_INDEX_PATH": index_path,
+        "INDEX_GENERATION_PATH": os.path.join(workdir, "index_generation"),
+        "REPLY_AUDIO_CACHE_DIR": os.path.join(workdir, "audio_cache"),
+        "REPLY_AUDIO_CACHE_ENABLED": "1" if args.reply_cache else "0",
+        "SESSION_REGISTRY_PATH": os.path.join(workdir, "sessions.sqlite3"),
+        # Call caps would hide the concurrency limit being measured
+        "MAX_SESSIONS_PER_WORKER": env.get("MAX_SESSIONS_PER_WORKER", "0"),
+        "MAX_SESSIONS_GLOBAL": env.get("MAX_SESSIONS_GLOBAL", "0"),
+    })
+    log_path = os.path.join(workdir, "app.log")
+    with open(log_path, "w") as log_file:
+        app = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(args.app_port),
+             "--workers", str(args.workers)],
+            cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    try:
+        if not await asyncio.get_running_loop().run_in_executor(None, wait_for_app, args.app_port):
+            raise SystemExit(f"app did not start; see {log_path}")
+        url = f"ws://127.0.0.1:{args.app_port}/ws"
+        print(f"App pid {app.pid}, log at {log_path}")
+        print(f"{'clients':>7} {'turns':>6} {'failed':>6} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} "
+              f"{'reply_p95':>10} {'cpu/sess':>9} {'mb/sess':>9} {'rss_mb':>8}")
+        rows = []
+        for clients in [int(level) for level in args.levels.split(",")]:
+            row = await run_level(url, clients, args, app.pid)
+            rows.append(row)
+            print_row(row)
+            if row["failed"] or row["p95_ms"] > args.slo_ms:
+                if not args.keep_going:
+                    break
+        sustainable = [row["clients"] for row in rows if not row["failed"] and row["p95_ms"] <= args.slo_ms]
+        print(f"Max sustainable concurrency (p95 <= {args.slo_ms} ms, no failed turns): "
+              f"{max(sustainable) if sustainable else 0}")
+        print(f"Embedding requests served: {embeddings.requests}, upstream sessions opened: {realtime.sessions}")
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(rows, file, indent=2)
+    finally:
+        app.terminate()
+        app.wait(timeout=10)
+        await realtime.close()
+        embeddings.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test app.py against fake upstream services")
+    parser.add_argument("--levels", default="1,5,10,25,50", help="comma-separated client counts")
+    parser.add_argument("--turns", type=int, default=3, help="turns per client")
+    parser.add_argument("--slo-ms", type=float, default=1500, help="p95 first-audio latency budget")
+    parser.add_argument("--keep-going", action="store_true", help="run every level even after the SLO is missed")
+    parser.add_argument("--speech-ms", type=int, default=1500)
+    parser.add_argument("--turn-timeout", type=float, default=15.0)
+    parser.add_argument("--chunk-samples", type=int, default=4096, help="samples per client message")
+    parser.add_argument("--input-rate", type=int, default=16000, help="sample rate used to pace client audio")
+    parser.add_argument("--ramp-ms", type=int, default=20, help="delay between client connections")
+    parser.add_argument("--chunks", type=int, default=2000, help="synthetic index size")
+    parser.add_argument("--embedding-latency-ms", type=int, default=50)
+    parser.add_argument("--binary", action="store_true", help="negotiate binary PCM frames on /ws")
+    parser.add_argument("--reply-cache", action="store_true", help="leave the reply audio cache enabled")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="uvicorn worker processes; CPU and memory are summed across them")
+    parser.add_argument("--app-port", type=int, default=8800)
+    parser.add_argument("--realtime-port", type=int, default=8765)
+    parser.add_argument("--embedding-port", type=int, default=8766)
+    parser.add_argument("--json", help="also write the per-level results to this file")
+    add_timing_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
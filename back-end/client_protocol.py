@@ -0,0 +1,116 @@
+import struct
+from audio_codec import encode_pcm16
+from output_codecs import CODEC_IDS, CODEC_PCM16, choose_codec, encode_reply_audio
+from reply_stream import REPLY_AUDIO_MODE
+
+# Wire format negotiated on /ws. Clients that never send a hello keep the
+# original JSON messages with base64 audio.
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "binary"
+BINARY_PROTOCOL_VERSION = 1
+
+# Binary frames: message type, reply codec id, utterance id, sequence number, then the audio
+FRAME_HEADER = struct.Struct("<BBHI")
+FRAME_AUDIO_INPUT = 1
+FRAME_AUDIO_CHUNK = 2
+FRAME_AUDIO_CLIP = 3
+
+# JSON audio messages and the binary frame type each one maps to
+AUDIO_FRAME_TYPES = {
+    "audio_input_transmitting": FRAME_AUDIO_INPUT,
+    "audio_response_chunk": FRAME_AUDIO_CHUNK,
+    "audio_response_transmitting": FRAME_AUDIO_CLIP,
+}
+FRAME_EVENT_TYPES = {frame_type: event_type for event_type, frame_type in AUDIO_FRAME_TYPES.items()}
+# Only reply audio is re-encoded; microphone audio stays PCM16
+REPLY_FRAME_TYPES = {FRAME_AUDIO_CHUNK, FRAME_AUDIO_CLIP}
+
+def encode_frame(frame_type, pcm_bytes, utterance_id=0, seq=0, codec_id=0):
+    return FRAME_HEADER.pack(frame_type, codec_id, utterance_id & 0xFFFF, seq & 0xFFFFFFFF) + bytes(pcm_bytes)
+
+def decode_frame(data):
+    """Return (frame_type, utterance_id, seq, payload) for a binary frame; the payload is a memoryview."""
+    if len(data) < FRAME_HEADER.size:
+        raise ValueError(f"Binary frame of {len(data)} bytes is shorter than its header")
+    frame_type, _, utterance_id, seq = FRAME_HEADER.unpack_from(data)
+    return frame_type, utterance_id, seq, memoryview(data)[FRAME_HEADER.size:]
+
+def hello_reply(message):
+    """
+    The hello a server answers with; binary is accepted when the client
+    offers it, the reply codec is the client's first choice from "codecs"
+    that the server allows, and reply audio is streamed in chunks when
+    the client asks for "reply_audio": "stream".
+    """
+    requested = message.get("protocol", PROTOCOL_JSON)
+    protocol = PROTOCOL_BINARY if requested == PROTOCOL_BINARY else PROTOCOL_JSON
+    reply_audio = message.get("reply_audio")
+    if reply_audio not in ("stream", "buffered"):
+        reply_audio = REPLY_AUDIO_MODE
+    return {"event_type": "hello", "protocol": protocol, "version": BINARY_PROTOCOL_VERSION,
+            "codec": choose_codec(message.get("codecs")), "reply_audio": reply_audio}
+
+class ClientChannel:
+    """
+    Messages to one browser client in whichever wire format it negotiated.
+
+    Audio messages carry raw PCM16 bytes in event_data. Reply audio is
+    first encoded with the negotiated codec. Binary clients get audio as
+    frames; JSON clients get the original message with the audio
+    base64-encoded (plus a "codec" key when it is not PCM16). Everything
+    else is sent as JSON either way.
+    """
+
+    def __init__(self, websocket, protocol=PROTOCOL_JSON, codec=CODEC_PCM16):
+        self.websocket = websocket
+        self.protocol = protocol
+        self.codec = codec
+        self.frames_sent = 0
+        self.json_sent = 0
+        self.bytes_sent = 0
+        self.reply_bytes_raw = 0
+        self.reply_bytes_encoded = 0
+
+    def negotiate(self, message):
+        reply = hello_reply(message)
+        self.protocol = reply["protocol"]
+        self.codec = reply["codec"]
+        return reply
+
+    async def send(self, message):
+        data = message.get("event_data")
+        frame_type = AUDIO_FRAME_TYPES.get(message.get("event_type"))
+        if frame_type is None or not isinstance(data, (bytes, bytearray, memoryview)):
+            await self.send_json(message)
+            return
+        codec = self.codec if frame_type in REPLY_FRAME_TYPES else CODEC_PCM16
+        if codec != CODEC_PCM16:
+            self.reply_bytes_raw += len(data)
+            data = encode_reply_audio(codec, data)
+            self.reply_bytes_encoded += len(data)
+        if self.protocol == PROTOCOL_BINARY:
+            frame = encode_frame(frame_type, data, message.get("utterance_id", 0), message.get("seq", 0),
+                                 CODEC_IDS[codec])
+            await self.websocket.send_bytes(frame)
+            self.frames_sent += 1
+            self.bytes_sent += len(frame)
+        elif codec != CODEC_PCM16:
+            await self.send_json({**message, "event_data": encode_pcm16(data), "codec": codec})
+        else:
+            await self.send_json({**message, "event_data": encode_pcm16(data)})
+
+    async def send_json(self, message):
+        await self.websocket.send_json(message)
+        self.json_sent += 1
+
+    def stats(self):
+        return {
+            "protocol": self.protocol,
+            "codec": self.codec,
+            "frames_sent": self.frames_sent,
+            "json_sent": self.json_sent,
+            "frame_bytes_sent": self.bytes_sent,
+            # Reply audio before and after the negotiated codec (PCM16 replies are not counted)
+            "reply_bytes_raw": self.reply_bytes_raw,
+            "reply_bytes_encoded": self.reply_bytes_encoded
+        }
@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Token budget for the retrieved context pasted into the instructions
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "400"))
+# Shortest suffix/prefix overlap (in characters) treated as chunks being adjacent
+MIN_MERGE_OVERLAP = 20
+# Share of a chunk's word trigrams already present in a better-ranked chunk above which it is dropped
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+logger = logging.getLogger("context-packing")
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+_encoding_unavailable = tiktoken is None
+_encoding_lock = threading.Lock()
+
+def get_encoding():
+    """
+    The tokenizer, loaded on first use rather than at import because
+    tiktoken downloads it when it is not cached; None when it cannot be had.
+    """
+    global _encoding, _encoding_unavailable
+    if _encoding is None and not _encoding_unavailable:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_unavailable:
+                try:
+                    _encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    _encoding_unavailable = True
+                    logger.warning(f"Token counts are estimated, tiktoken encoding unavailable: {e}")
+    return _encoding
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        # Roughly four characters per token for English text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+def overlap_length(left, right, min_overlap=MIN_MERGE_OVERLAP):
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    longest = min(len(left), len(right))
+    for size in range(longest, min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def shingles(text, size=3):
+    words = text.lower().split()
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def containment(part, whole):
+    """Fraction of `part`'s shingles that also occur in `whole`."""
+    if not part:
+        return 1.0
+    return len(part & whole) / len(part)
+
+def merge_overlapping(texts, min_overlap=MIN_MERGE_OVERLAP):
+    """
+    Merge chunks that contain one another or overlap end-to-start, which is
+    what the splitter's chunk_overlap produces for neighbouring chunks.
+    The merged text keeps the rank of its best-ranked part.
+    """
+    merged = [text.strip() for text in texts if text.strip()]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(len(merged)):
+                if i == j:
+                    continue
+                left, right = merged[i], merged[j]
+                if right in left:
+                    combined = left
+                else:
+                    size = overlap_length(left, right, min_overlap)
+                    if not size:
+                        continue
+                    combined = left + right[size:]
+                keep, drop = min(i, j), max(i, j)
+                merged[keep] = combined
+                del merged[drop]
+                changed = True
+                break
+            if changed:
+                break
+    return merged
+
+def drop_near_duplicates(texts, threshold=NEAR_DUPLICATE_THRESHOLD):
+    kept, kept_shingles = [], []
+    for text in texts:
+        text_shingles = shingles(text)
+        if any(containment(text_shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(text)
+        kept_shingles.append(text_shingles)
+    return kept
+
+def truncate_to_tokens(text, budget):
+    if count_tokens(text) <= budget:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    # Binary search for the longest word prefix within the budget
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle])) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low])
+
+def format_contexts(texts):
+    return "\n\n".join(f"Context {i+1}: {text}" for i, text in enumerate(texts))
+
+def pack_contexts(texts, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Assemble retrieved chunk texts (best first) into the context block.
+    Returns (context_text, report) where report compares token counts
+    against pasting every chunk verbatim.
+    """
+    raw_text = format_contexts(texts)
+    packed = drop_near_duplicates(merge_overlapping(texts))
+
+    fitted = []
+    remaining = budget
+    for text in packed:
+        # "Context N: " and the blank line between contexts cost a few tokens
+        cost = count_tokens(text) + 6
+        if cost <= remaining:
+            fitted.append(text)
+            remaining -= cost
+            continue
+        truncated = truncate_to_tokens(text, remaining - 6)
+        if truncated:
+            fitted.append(truncated)
+        break
+
+    context_text = format_contexts(fitted)
+    raw_tokens = count_tokens(raw_text)
+    packed_tokens = count_tokens(context_text)
+    report = {
+        "chunks_in": len(texts),
+        "chunks_out": len(fitted),
+        "raw_tokens": raw_tokens,
+        "packed_tokens": packed_tokens,
+        "saved_tokens": raw_tokens - packed_tokens
+    }
+    return context_text, report
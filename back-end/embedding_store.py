@@ -0,0 +1,65 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite3")
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingDiskCache:
+    """
+    Chunk embeddings persisted in SQLite, keyed by content hash and model name,
+    so re-ingesting an unchanged chunk never calls the embedding API again.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Embedding batches finish on worker threads, so the connection is shared under a lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash))"
+            )
+            self.connection.commit()
+
+    def get_many(self, model, hashes):
+        """Return {hash: vector} for the hashes that are cached."""
+        found = {}
+        hashes = list(hashes)
+        with self.lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *batch]
+                )
+                for chunk_hash, blob in rows:
+                    found[chunk_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model, vectors_by_hash):
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, chunk_hash, np.asarray(vector, dtype=np.float32).tobytes())
+                 for chunk_hash, vector in vectors_by_hash.items()]
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
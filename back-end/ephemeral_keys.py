@@ -0,0 +1,94 @@
+import math
+import os
+import time
+import httpx
+from dotenv import load_dotenv
+from refill_pool import RefillPool
+
+load_dotenv()
+
+# Realtime sessions endpoint that mints ephemeral client keys; point it at a local stub for tests
+OPENAI_REALTIME_SESSIONS_URL = os.environ.get(
+    "OPENAI_REALTIME_SESSIONS_URL", "https://api.openai.com/v1/realtime/sessions")
+EPHEMERAL_KEY_MODEL = os.environ.get("EPHEMERAL_KEY_MODEL", "gpt-4o-realtime-preview-2024-12-17")
+EPHEMERAL_KEY_VOICE = os.environ.get("EPHEMERAL_KEY_VOICE", "verse")
+# Opt-in: keys minted ahead of time so /getEphemeralKey answers from memory (0 mints on
+# every request). The total for the deployment; each of the APP_WORKERS worker processes
+# holds its share, so unused keys do not expire in every worker
+EPHEMERAL_KEY_POOL_SIZE_TOTAL = int(os.environ.get("EPHEMERAL_KEY_POOL_SIZE", "0"))
+EPHEMERAL_KEY_POOL_SIZE = math.ceil(EPHEMERAL_KEY_POOL_SIZE_TOTAL / max(1, int(os.environ.get("APP_WORKERS", "1"))))
+# A pooled key is only handed out, and kept, while it has at least this many seconds left
+EPHEMERAL_KEY_MIN_TTL = float(os.environ.get("EPHEMERAL_KEY_MIN_TTL", "30"))
+EPHEMERAL_KEY_TIMEOUT = float(os.environ.get("EPHEMERAL_KEY_TIMEOUT", "10"))
+# Keys live about a minute upstream; used when the response carries no expires_at
+EPHEMERAL_KEY_DEFAULT_TTL = 60.0
+
+class EphemeralKeyPool(RefillPool):
+    """
+    Mints ephemeral realtime keys through one shared, connection-pooled
+    async HTTP client. With a non-zero size it keeps that many keys ready;
+    a background task replaces keys that are handed out or get within
+    min_ttl of their expiry, so acquire() normally returns without a
+    network round trip.
+    """
+
+    kind = "ephemeral key"
+
+    def __init__(self, size=EPHEMERAL_KEY_POOL_SIZE, min_ttl=EPHEMERAL_KEY_MIN_TTL,
+                 url=OPENAI_REALTIME_SESSIONS_URL, api_key=None, timeout=EPHEMERAL_KEY_TIMEOUT):
+        super().__init__(size)
+        self.min_ttl = min_ttl
+        self.url = url
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.timeout = timeout
+        self.payload = {"model": EPHEMERAL_KEY_MODEL, "voice": EPHEMERAL_KEY_VOICE}
+        self.client = None
+
+    async def start(self):
+        if not self.api_key:
+            raise ValueError("Missing OPENAI_API_KEY")
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+                "OpenAI-Beta": "realtime=v1"
+            },
+            limits=httpx.Limits(max_connections=max(4, self.size * 2), max_keepalive_connections=max(2, self.size))
+        )
+        self.start_refill()
+
+    async def create(self):
+        """Mint a new key; returns (value, expires_at as a unix timestamp)."""
+        response = await self.client.post(self.url, json=self.payload)
+        response.raise_for_status()
+        secret = response.json()["client_secret"]
+        return secret["value"], secret.get("expires_at") or time.time() + EPHEMERAL_KEY_DEFAULT_TTL
+
+    def is_usable(self, value, expires_at):
+        return expires_at - time.time() >= self.min_ttl
+
+    def next_check_in(self):
+        """Seconds until the oldest pooled key stops being fresh."""
+        if not self.ready:
+            return self.min_ttl
+        # At least a second, so a min_ttl longer than the upstream lifetime cannot spin
+        return max(1.0, min(expires_at for _, expires_at in self.ready) - self.min_ttl - time.time())
+
+    async def close(self):
+        await super().close()
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    def stats(self):
+        return {
+            "size": len(self.ready),
+            "target": self.size,
+            "minting": self.creating,
+            "hits": self.hits,
+            "misses": self.misses,
+            "minted": self.created,
+            "failures": self.failures,
+            "expired": self.expired
+        }
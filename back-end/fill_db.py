@@ -1,27 +1,67 @@
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import argparse
 import os
+import queue
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
+from embedding_store import EmbeddingDiskCache, content_hash
+from local_index import LOCAL_INDEX_PATH, export_local_index
+from semantic_cache import bump_index_generation
 
-def fill_db(collection_name="hospital_db", file_path="./data/hospital_data.pdf"):
-    # Load environment variables (for API keys)
-    load_dotenv()
-    
-    # Check for required environment variables
-    openai_api_key = os.environ.get("OPENAI_API_KEY")
-    qdrant_url = os.environ.get("QDRANT_URL")
-    qdrant_api_key = os.environ.get("QDRANT_API_KEY")
-    
-    if not all([openai_api_key, qdrant_url, qdrant_api_key]):
-        raise ValueError("Missing required environment variables: OPENAI_API_KEY, QDRANT_URL, or QDRANT_API_KEY")
-    
-    # Initialize OpenAI embedding model
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    
+load_dotenv()
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Chunks per embedding request and embedding requests in flight at once
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "128"))
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "4"))
+UPSERT_BATCH_SIZE = 256
+# Parser processes for directory mode and parsed documents allowed to wait for embedding
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "8"))
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+def export_collection(client, collection_name="hospital_db", path=LOCAL_INDEX_PATH, batch_size=256):
+    """Copy every point of a Qdrant collection into a local index snapshot."""
+    texts, metadatas, vectors = [], [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        for point in points:
+            texts.append(point.payload.get("page_content", ""))
+            metadatas.append(point.payload.get("metadata") or {})
+            vectors.append(point.vector)
+        if offset is None:
+            break
+    return export_local_index(texts, metadatas, vectors, path)
+
+def point_id(chunk_hash):
+    # Qdrant ids must be integers or UUIDs; the hash prefix makes a stable UUID
+    return str(uuid.UUID(chunk_hash[:32]))
+
+def load_chunks(file_path, root=None):
+    """
+    Load and split one document. Runs in a worker process in directory mode,
+    so it only returns picklable values: the chunks and the page count.
+    """
     # Load document
-    loader = PyPDFLoader(file_path=file_path)
+    if file_path.lower().endswith(".pdf"):
+        loader = PyPDFLoader(file_path=file_path)
+    else:
+        loader = TextLoader(file_path=file_path, encoding="utf-8")
     raw_documents = loader.load()
     
     # Split document
@@ -33,20 +73,276 @@ def fill_db(collection_name="hospital_db", file_path="./data/hospital_data.pdf")
     )
     chunks = text_splitter.split_documents(raw_documents)
     
-    # Create or update Qdrant collection with embeddings
-    # If collection exists, it will add to it; to recreate, you'd need to delete it from Qdrant dashboard
-    vector_store = QdrantVectorStore.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        url=qdrant_url,
-        api_key=qdrant_api_key,
-        collection_name=collection_name,
-        force_recreate=True  # Set to True to recreate collection if it exists
+    # Tag every chunk with the document it came from
+    document_name = os.path.relpath(file_path, root) if root else os.path.basename(file_path)
+    for chunk in chunks:
+        chunk.metadata["source"] = file_path
+        chunk.metadata["document"] = document_name
+    return chunks, len(raw_documents)
+
+def find_documents(directory):
+    paths = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)
+
+def ingest_directory(sync, directory, workers=INGEST_WORKERS, queue_size=INGEST_QUEUE_SIZE):
+    """
+    Parse and split every supported document under `directory` in a process
+    pool and stream the chunks into `sync` through a bounded queue, so
+    embedding and upserting overlap with parsing.
+    Returns (documents, pages, chunks).
+    """
+    paths = find_documents(directory)
+    parsed = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        # Give up if the consumer has failed instead of blocking forever
+        while not stop.is_set():
+            try:
+                parsed.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        try:
+            with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+                futures = [pool.submit(load_chunks, path, directory) for path in paths]
+                for future in as_completed(futures):
+                    if stop.is_set():
+                        for pending in futures:
+                            pending.cancel()
+                        break
+                    put(future.result())
+        except Exception as e:
+            put(e)
+        finally:
+            put(None)
+
+    producer = threading.Thread(target=produce, name="ingest-parser", daemon=True)
+    producer.start()
+    pages = chunk_count = 0
+    try:
+        while True:
+            item = parsed.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            chunks, page_count = item
+            sync.add(chunks)
+            pages += page_count
+            chunk_count += len(chunks)
+    finally:
+        stop.set()
+        producer.join()
+    return len(paths), pages, chunk_count
+
+def existing_point_ids(client, collection_name, batch_size=1000):
+    ids = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False
+        )
+        ids.update(str(point.id) for point in points)
+        if offset is None:
+            return ids
+
+def embed_chunks(texts_by_hash, embeddings, cache, model=EMBEDDING_MODEL,
+                 batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY):
+    """
+    Return {hash: vector} for every chunk, embedding only hashes missing from the
+    disk cache. Missing chunks are sent in batches of batch_size with up to
+    concurrency requests in flight; each finished batch is cached immediately.
+    """
+    vectors = cache.get_many(model, texts_by_hash.keys())
+    reused = len(vectors)
+    missing = [chunk_hash for chunk_hash in texts_by_hash if chunk_hash not in vectors]
+    batches = [missing[start:start + batch_size] for start in range(0, len(missing), batch_size)]
+
+    def embed_batch(batch):
+        return batch, embeddings.embed_documents([texts_by_hash[chunk_hash] for chunk_hash in batch])
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for future in as_completed([executor.submit(embed_batch, batch) for batch in batches]):
+            batch, batch_vectors = future.result()
+            embedded = dict(zip(batch, batch_vectors))
+            cache.put_many(model, embedded)
+            vectors.update(embedded)
+    return vectors, len(missing), reused
+
+class CollectionSync:
+    """
+    Brings a Qdrant collection in line with a stream of chunks without taking it offline.
+
+    Chunks are passed to add() as they become available; new or changed
+    ones are embedded (or taken from the cache) and upserted straight away.
+    finish() then deletes the points whose content was not seen and
+    returns a report dict.
+    """
+
+    def __init__(self, client, collection_name, embeddings, cache, recreate=False):
+        self.client = client
+        self.collection_name = collection_name
+        self.embeddings = embeddings
+        self.cache = cache
+        self.started = time.monotonic()
+
+        if recreate and client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+        self.exists = client.collection_exists(collection_name)
+        self.current = existing_point_ids(client, collection_name) if self.exists else set()
+        self.seen = set()
+
+        self.embedded = 0
+        self.reused = 0
+        self.upserted = 0
+
+    def ensure_collection(self, dimension):
+        if not self.exists:
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE)
+            )
+            self.exists = True
+
+    def add(self, chunks):
+        new_chunks = {}
+        for chunk in chunks:
+            # Embeddings are keyed on the text alone; point ids also include the
+            # document so identical text in two documents keeps both sources
+            text_hash = content_hash(chunk.page_content)
+            pid = point_id(content_hash(chunk.metadata.get("document", "") + "\0" + chunk.page_content))
+            if pid in self.seen:
+                continue
+            self.seen.add(pid)
+            if pid not in self.current:
+                new_chunks[pid] = (text_hash, chunk)
+        if not new_chunks:
+            return
+
+        texts_by_hash = {text_hash: chunk.page_content for text_hash, chunk in new_chunks.values()}
+        vectors, embedded, reused = embed_chunks(texts_by_hash, self.embeddings, self.cache)
+        self.embedded += embedded
+        self.reused += reused
+        self.ensure_collection(len(next(iter(vectors.values()))))
+
+        # Payload layout matches QdrantVectorStore so rag.py reads these points unchanged
+        points = [
+            models.PointStruct(
+                id=pid,
+                vector=vectors[text_hash],
+                payload={
+                    "page_content": chunk.page_content,
+                    "metadata": {**chunk.metadata, "content_hash": text_hash}
+                }
+            )
+            for pid, (text_hash, chunk) in new_chunks.items()
+        ]
+        for start in range(0, len(points), UPSERT_BATCH_SIZE):
+            self.client.upsert(collection_name=self.collection_name, points=points[start:start + UPSERT_BATCH_SIZE])
+        self.upserted += len(points)
+
+    def finish(self):
+        removed = [pid for pid in self.current if pid not in self.seen]
+        if removed:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=removed)
+            )
+        return {
+            "chunks": len(self.seen),
+            "unchanged": len(self.seen) - self.upserted,
+            "embedded": self.embedded,
+            "reused": self.reused,
+            "upserted": self.upserted,
+            "deleted": len(removed),
+            "seconds": time.monotonic() - self.started
+        }
+
+def sync_collection(client, collection_name, chunks, embeddings, cache, recreate=False):
+    """Sync a collection with a complete list of chunks; see CollectionSync."""
+    sync = CollectionSync(client, collection_name, embeddings, cache, recreate=recreate)
+    sync.add(chunks)
+    return sync.finish()
+
+def print_report(report, collection_name):
+    print(
+        f"Synced {report['chunks']} chunks into '{collection_name}' in {report['seconds']:.2f}s: "
+        f"{report['embedded']} embedded, {report['reused']} reused from cache, "
+        f"{report['unchanged']} unchanged, {report['deleted']} deleted"
+    )
+    seconds = max(report["seconds"], 1e-9)
+    print(
+        f"Throughput: {report['documents']} documents, {report['pages'] / seconds:.1f} pages/s, "
+        f"{report['split_chunks'] / seconds:.1f} chunks/s"
     )
+
+def fill_db(collection_name="hospital_db", file_path="./data/hospital_data.pdf",
+            export_local=False, recreate=False, directory=None, workers=INGEST_WORKERS):
+    """
+    Sync the collection with one document, or with every document under
+    `directory` when it is given (parsed by `workers` processes).
+    """
+    # Check for required environment variables
+    openai_api_key = os.environ.get("OPENAI_API_KEY")
+    qdrant_url = os.environ.get("QDRANT_URL")
+    qdrant_api_key = os.environ.get("QDRANT_API_KEY")
+    
+    if not all([openai_api_key, qdrant_url, qdrant_api_key]):
+        raise ValueError("Missing required environment variables: OPENAI_API_KEY, QDRANT_URL, or QDRANT_API_KEY")
+    
+    # Initialize OpenAI embedding model
+    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+    cache = EmbeddingDiskCache()
+    
+    try:
+        sync = CollectionSync(client, collection_name, embeddings, cache, recreate=recreate)
+        if directory:
+            documents, pages, split_chunks = ingest_directory(sync, directory, workers=workers)
+        else:
+            chunks, pages = load_chunks(file_path)
+            sync.add(chunks)
+            documents, split_chunks = 1, len(chunks)
+        report = sync.finish()
+    finally:
+        cache.close()
+    report.update(documents=documents, pages=pages, split_chunks=split_chunks)
+    
+    if export_local:
+        exported = export_collection(client, collection_name)
+        print(f"Exported {exported} chunks to local index at '{LOCAL_INDEX_PATH}'")
+    
+    # Cached answers were built from the old collection
+    if report["upserted"] or report["deleted"]:
+        bump_index_generation()
     
-    print(f"Added {len(chunks)} documents to Qdrant collection '{collection_name}' with OpenAI embeddings")
+    print_report(report, collection_name)
     
-    return vector_store
+    return QdrantVectorStore(client=client, collection_name=collection_name, embedding=embeddings)
 
 if __name__ == "__main__":
-    fill_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load hospital documents into the vector store")
+    parser.add_argument("--collection", default="hospital_db")
+    parser.add_argument("--file", default="./data/hospital_data.pdf")
+    parser.add_argument("--dir", dest="directory",
+                        help="ingest every .pdf/.txt/.md file under this directory instead of --file")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="parser processes for --dir")
+    parser.add_argument("--export-local", action="store_true",
+                        help="also write a local index snapshot for RAG_BACKEND=local")
+    parser.add_argument("--recreate", action="store_true",
+                        help="drop the collection first instead of syncing it incrementally")
+    args = parser.parse_args()
+    fill_db(collection_name=args.collection, file_path=args.file, export_local=args.export_local,
+            recreate=args.recreate, directory=args.directory, workers=args.workers)
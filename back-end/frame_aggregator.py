@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+from audio_codec import BYTES_PER_SAMPLE, SAMPLE_RATE, encode_pcm16
+
+load_dotenv()
+
+# Microphone audio is appended upstream in frames of at least this length (0, the default, forwards
+# every chunk). Only worth enabling for clients that send chunks shorter than a frame, e.g. an
+# AudioWorklet posting 128-sample quanta; the bundled page sends 4096-sample chunks, already longer.
+UPSTREAM_FRAME_MS = int(os.environ.get("UPSTREAM_FRAME_MS", "0"))
+# Longest a partial frame waits for more audio before it is sent anyway
+UPSTREAM_FRAME_MAX_WAIT_MS = int(os.environ.get("UPSTREAM_FRAME_MAX_WAIT_MS", str(UPSTREAM_FRAME_MS)))
+
+class FrameAggregator:
+    """
+    Coalesces one session's microphone chunks into fixed-duration frames.
+
+    Chunks are buffered as raw PCM16 and sent as a single
+    input_audio_buffer.append once frame_ms of audio is pending, once the
+    oldest buffered audio has waited max_wait_ms, or when flush() is
+    called at the end of speech. A chunk already a frame long that arrives
+    with nothing pending goes straight out without arming the timer.
+    """
+
+    def __init__(self, send, frame_ms=UPSTREAM_FRAME_MS, max_wait_ms=UPSTREAM_FRAME_MAX_WAIT_MS,
+                 sample_rate=SAMPLE_RATE):
+        self.send = send
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * BYTES_PER_SAMPLE
+        self.max_wait = max_wait_ms / 1000
+        self.pending = []
+        self.pending_bytes = 0
+        self.first_at = None
+        self.timer = None
+
+        self.messages_in = 0
+        self.messages_out = 0
+        self.flushes = {"size": 0, "timer": 0, "speech_end": 0}
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    async def add(self, pcm_bytes):
+        """Buffer a chunk; returns False if a frame it completed could not be queued upstream."""
+        if not pcm_bytes:
+            return True
+        self.messages_in += 1
+        if not self.pending and len(pcm_bytes) >= self.frame_bytes:
+            self.messages_out += 1
+            self.flushes["size"] += 1
+            return await self.send(encode_pcm16(pcm_bytes))
+        if not self.pending:
+            self.first_at = time.monotonic()
+            self.timer = asyncio.get_running_loop().call_later(
+                self.max_wait, lambda: asyncio.ensure_future(self.flush("timer")))
+        self.pending.append(bytes(pcm_bytes))
+        self.pending_bytes += len(pcm_bytes)
+        if self.pending_bytes >= self.frame_bytes:
+            return await self.flush("size")
+        return True
+
+    async def flush(self, reason="speech_end"):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return True
+        frame = b"".join(self.pending)
+        waited = time.monotonic() - self.first_at
+        self.pending = []
+        self.pending_bytes = 0
+        self.first_at = None
+        self.messages_out += 1
+        self.flushes[reason] += 1
+        self.total_wait += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        return await self.send(encode_pcm16(frame))
+
+    def close(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.pending = []
+        self.pending_bytes = 0
+
+    def stats(self):
+        return {
+            "messages_in": self.messages_in,
+            "messages_out": self.messages_out,
+            "coalescing_ratio": self.messages_in / self.messages_out if self.messages_out else 0.0,
+            "flushes": dict(self.flushes),
+            # Time the oldest audio of each frame spent waiting in the aggregator
+            "mean_added_latency_ms": 1000 * self.total_wait / self.messages_out if self.messages_out else 0.0,
+            "max_added_latency_ms": 1000 * self.max_wait_seen
+        }
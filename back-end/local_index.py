@@ -0,0 +1,122 @@
+import json
+import os
+import struct
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+load_dotenv()
+
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", "./data/local_index")
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.bin"
+CHUNKS_MAGIC = b"HCHK"
+# Header: magic, format version, record count
+CHUNKS_HEADER = struct.Struct("<4sII")
+CHUNKS_VERSION = 1
+
+def export_local_index(texts, metadatas, vectors, path=LOCAL_INDEX_PATH):
+    """
+    Write a snapshot that LocalVectorIndex can memory-map.
+
+    vectors.npy holds the unit-normalized float32 embedding matrix.
+    chunks.bin holds a header, a uint64 offset table and the UTF-8 JSON
+    record ({"page_content", "metadata"}) of every row, back to back.
+    """
+    os.makedirs(path, exist_ok=True)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2 or len(matrix) != len(texts):
+        raise ValueError("Expected one embedding vector per chunk")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+
+    records = [
+        json.dumps({"page_content": text, "metadata": metadata or {}}, ensure_ascii=False).encode("utf-8")
+        for text, metadata in zip(texts, metadatas)
+    ]
+    offsets = np.zeros(len(records) + 1, dtype="<u8")
+    offsets[1:] = np.cumsum([len(record) for record in records])
+
+    # Chunks are written first: a reader keys its reload on the vectors file
+    chunks_path = os.path.join(path, CHUNKS_FILE)
+    with open(chunks_path + ".tmp", "wb") as file:
+        file.write(CHUNKS_HEADER.pack(CHUNKS_MAGIC, CHUNKS_VERSION, len(records)))
+        file.write(offsets.tobytes())
+        for record in records:
+            file.write(record)
+    os.replace(chunks_path + ".tmp", chunks_path)
+
+    vectors_path = os.path.join(path, VECTORS_FILE)
+    with open(vectors_path + ".tmp", "wb") as file:
+        np.save(file, matrix)
+    os.replace(vectors_path + ".tmp", vectors_path)
+    return len(records)
+
+class LocalVectorIndex:
+    """
+    Brute-force cosine search over a memory-mapped snapshot.
+    A knowledge base of a few thousand chunks is searched with one
+    matrix-vector product, so no remote vector store is needed.
+    """
+
+    def __init__(self, path=LOCAL_INDEX_PATH):
+        self.path = path
+        self.vectors_path = os.path.join(path, VECTORS_FILE)
+        self.chunks_path = os.path.join(path, CHUNKS_FILE)
+        self.loaded_mtime = None
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        vectors = np.load(self.vectors_path, mmap_mode="r")
+        with open(self.chunks_path, "rb") as file:
+            chunks = file.read()
+        magic, version, count = CHUNKS_HEADER.unpack_from(chunks, 0)
+        if magic != CHUNKS_MAGIC or version != CHUNKS_VERSION:
+            raise ValueError(f"{self.chunks_path} is not a version {CHUNKS_VERSION} chunk file")
+        if count != len(vectors):
+            raise ValueError(f"{self.chunks_path} has {count} chunks for {len(vectors)} vectors")
+        offsets = np.frombuffer(chunks, dtype="<u8", count=count + 1, offset=CHUNKS_HEADER.size)
+        # Swapped in one assignment so a concurrent search never mixes two snapshots
+        self.snapshot = (vectors, chunks, offsets, CHUNKS_HEADER.size + offsets.nbytes)
+        self.loaded_mtime = os.stat(self.vectors_path).st_mtime_ns
+
+    def reload_if_changed(self):
+        mtime = os.stat(self.vectors_path).st_mtime_ns
+        if mtime != self.loaded_mtime:
+            with self.lock:
+                if mtime != self.loaded_mtime:
+                    try:
+                        self.load()
+                    except ValueError:
+                        # Caught mid-export; keep serving the old snapshot and retry next search
+                        pass
+
+    @staticmethod
+    def document(snapshot, row):
+        _, chunks, offsets, data_start = snapshot
+        start = data_start + int(offsets[row])
+        end = data_start + int(offsets[row + 1])
+        record = json.loads(chunks[start:end])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def search(self, vector, k=3):
+        """Return the k most similar chunks as Documents, best first."""
+        self.reload_if_changed()
+        snapshot = self.snapshot
+        vectors = snapshot[0]
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = vectors @ query
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self.document(snapshot, int(row)) for row in top]
+
+    def __len__(self):
+        return len(self.snapshot[0])
@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+# Log one JSON line per finished turn with every stage offset
+METRICS_LOG_TURNS = os.environ.get("METRICS_LOG_TURNS", "0") == "1"
+
+# Turn stages in pipeline order; offsets are measured from the first one recorded
+TURN_STAGES = (
+    "speech_end",
+    "transcript_completed",
+    "retrieval_start",
+    "retrieval_end",
+    "response_create_sent",
+    "first_audio_delta",
+    "audio_done",
+    "client_send_complete",
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("metrics")
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labels=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels or {}
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def render(self, include_header=True):
+        label_text = ",".join(f'{key}="{value}"' for key, value in self.labels.items())
+        prefix = label_text + "," if label_text else ""
+        lines = []
+        if include_header:
+            lines += [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.name}_sum{suffix} {self.total}")
+            lines.append(f"{self.name}_count{suffix} {self.count}")
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text, labels=None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels or {}
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self, include_header=True):
+        label_text = ",".join(f'{key}="{value}"' for key, value in self.labels.items())
+        suffix = f"{{{label_text}}}" if label_text else ""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"] if include_header else []
+        return lines + [f"{self.name}{suffix} {self.value}"]
+
+STAGE_HISTOGRAMS = {
+    stage: Histogram("receptionist_turn_stage_seconds",
+                     "Seconds from the start of a turn (usually speech end) to each stage",
+                     labels={"stage": stage})
+    for stage in TURN_STAGES[1:]
+}
+TURN_TOTAL = Histogram("receptionist_turn_seconds",
+                       "Seconds from the start of a turn to the reply reaching the client")
+TURNS_FINISHED = Counter("receptionist_turns_total", "Turns whose reply reached the client")
+
+# Barge-in: caller speech that interrupted pending work, and the work it abandoned
+BARGE_INS = Counter("receptionist_barge_ins_total", "Caller speech starts that cancelled pending work")
+CANCELLED_WORK_KINDS = ("retrieval", "speculation", "response")
+CANCELLED_WORK = {
+    kind: Counter("receptionist_cancelled_work_total", "Work stopped before it ran because the caller barged in",
+                  labels={"kind": kind})
+    for kind in CANCELLED_WORK_KINDS
+}
+# Retrievals already running on the pool when cancelled; they finish and their result is discarded
+ABANDONED_WORK = {
+    kind: Counter("receptionist_abandoned_work_total",
+                  "Work already running when the caller barged in, left to finish and discarded",
+                  labels={"kind": kind})
+    for kind in ("retrieval", "speculation")
+}
+CANCELLED_AUDIO_BYTES = Counter("receptionist_cancelled_audio_bytes_total",
+                                "Reply audio (PCM16 bytes) dropped instead of being sent after a barge-in")
+
+# Transcripts discarded because too many were already waiting for retrieval in their session
+DROPPED_TRANSCRIPTS = Counter("receptionist_dropped_transcripts_total",
+                              "Caller transcripts dropped because the session's retrieval queue was full")
+
+class TurnTimeline:
+    """Monotonic timestamps for one question-and-reply turn."""
+
+    def __init__(self, session_id=None, speech_end=None):
+        self.session_id = session_id
+        self.marks = {}
+        if speech_end is not None:
+            self.marks["speech_end"] = speech_end
+
+    def mark(self, stage, at=None):
+        # Only the first occurrence counts (e.g. first_audio_delta)
+        if stage not in self.marks:
+            self.marks[stage] = time.monotonic() if at is None else at
+
+    def finish(self):
+        """Record the turn into the histograms; returns stage offsets in seconds."""
+        self.mark("client_send_complete")
+        start = min(self.marks.values())
+        offsets = {stage: self.marks[stage] - start for stage in TURN_STAGES if stage in self.marks}
+        for stage, offset in offsets.items():
+            if stage in STAGE_HISTOGRAMS:
+                STAGE_HISTOGRAMS[stage].observe(offset)
+        TURN_TOTAL.observe(offsets["client_send_complete"])
+        TURNS_FINISHED.inc()
+        if METRICS_LOG_TURNS:
+            logger.info(json.dumps({"event": "turn", "session": self.session_id,
+                                    "offsets": {stage: round(value, 4) for stage, value in offsets.items()}}))
+        return offsets
+
+def new_turn(session_id=None, speech_end=None):
+    """Start a timeline, or return None when metrics are disabled so callers skip all marks."""
+    if not METRICS_ENABLED:
+        return None
+    return TurnTimeline(session_id, speech_end)
+
+def gauge_lines(name, help_text, value, labels=None):
+    label_text = ",".join(f'{key}="{val}"' for key, val in (labels or {}).items())
+    suffix = f"{{{label_text}}}" if label_text else ""
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name}{suffix} {value}"]
+
+def render_prometheus(gauges=()):
+    """
+    Prometheus text exposition of the turn histograms plus the given gauges,
+    each a (name, help, value) or (name, help, value, labels) tuple. Labelled
+    gauges of one name go next to each other and share a header.
+    """
+    lines = []
+    first = True
+    for histogram in STAGE_HISTOGRAMS.values():
+        lines += histogram.render(include_header=first)
+        first = False
+    lines += TURN_TOTAL.render()
+    lines += TURNS_FINISHED.render()
+    lines += BARGE_INS.render()
+    first = True
+    for counter in CANCELLED_WORK.values():
+        lines += counter.render(include_header=first)
+        first = False
+    first = True
+    for counter in ABANDONED_WORK.values():
+        lines += counter.render(include_header=first)
+        first = False
+    lines += CANCELLED_AUDIO_BYTES.render()
+    lines += DROPPED_TRANSCRIPTS.render()
+    previous = None
+    for name, help_text, value, *labels in gauges:
+        gauge = gauge_lines(name, help_text, value, labels[0] if labels else None)
+        lines += gauge if name != previous else gauge[2:]
+        previous = name
+    return "\n".join(lines) + "\n"
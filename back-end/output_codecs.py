@@ -0,0 +1,169 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Reply audio codecs a client can negotiate on /ws. Ids travel in the
+# reserved byte of binary frames; JSON messages name the codec instead.
+CODEC_PCM16 = "pcm16"
+CODEC_MULAW = "mulaw"
+CODEC_ADPCM = "adpcm"
+CODEC_IDS = {CODEC_PCM16: 0, CODEC_MULAW: 1, CODEC_ADPCM: 2}
+
+# Codecs this server will agree to; pcm16 is always available as the fallback.
+# adpcm is opt-in: it encodes on the event loop at ~35-40 ms CPU per second of
+# streamed audio, against under 1 ms for mulaw, which stalls every session on
+# the worker once many calls use it
+REPLY_AUDIO_CODECS = [codec.strip() for codec in
+                      os.environ.get("REPLY_AUDIO_CODECS", "mulaw,pcm16").split(",")
+                      if codec.strip() in CODEC_IDS]
+
+# G.711 mu-law, computed on 14-bit samples like the ITU reference coder
+MULAW_BIAS = 0x84
+MULAW_CLIP = 8159
+
+def mulaw_encode(pcm16):
+    """Encode int16 PCM (array or bytes) as G.711 mu-law, one byte per sample."""
+    samples = np.frombuffer(pcm16, dtype='<i2') if isinstance(pcm16, (bytes, bytearray, memoryview)) else pcm16
+    samples = samples.astype(np.int32) >> 2
+    negative = samples < 0
+    magnitude = np.minimum(np.where(negative, -samples, samples), MULAW_CLIP) + (MULAW_BIAS >> 2)
+    # Position of the highest set bit gives the segment; past the last one the code saturates
+    exponent = np.maximum(np.frexp(magnitude)[1] - 6, 0)
+    mantissa = (magnitude >> (exponent + 1)) & 0x0F
+    code = np.where(exponent > 7, 0x7F, (exponent << 4) | mantissa)
+    return np.where(negative, code ^ 0x7F, code ^ 0xFF).astype(np.uint8).tobytes()
+
+def _mulaw_table():
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + MULAW_BIAS) << exponent) - MULAW_BIAS
+    return np.where(codes & 0x80, -magnitude, magnitude).astype('<i2')
+
+MULAW_DECODE_TABLE = _mulaw_table()
+
+def mulaw_decode(data):
+    return MULAW_DECODE_TABLE[np.frombuffer(data, dtype=np.uint8)].tobytes()
+
+# IMA-ADPCM in blocks: int16 first sample, uint8 step index, uint8 flag
+# (1 when the last nibble is padding), then 4-bit codes, low nibble first.
+# Short blocks cost a little ratio but keep the per-sample loop short.
+ADPCM_BLOCK_SAMPLES = 129
+ADPCM_HEADER_BYTES = 4
+
+ADPCM_STEP_TABLE = np.array([
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487,
+    12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767
+], dtype=np.int32)
+ADPCM_INDEX_TABLE = np.array([-1, -1, -1, -1, 2, 4, 6, 8] * 2, dtype=np.int32)
+
+def _adpcm_tables():
+    magnitude = np.arange(8)
+    step = ADPCM_STEP_TABLE[:, np.newaxis]
+    # Exactly what the decoder adds for each (step index, 3-bit magnitude)
+    delta = (step >> 3) + step * ((magnitude >> 2) & 1) + (step >> 1) * ((magnitude >> 1) & 1) \
+        + (step >> 2) * (magnitude & 1)
+    next_index = np.clip(np.arange(89)[:, np.newaxis] + ADPCM_INDEX_TABLE[np.newaxis, :8], 0, 88)
+    return delta.astype(np.int32), next_index.astype(np.int32)
+
+ADPCM_DELTA_TABLE, ADPCM_NEXT_INDEX = _adpcm_tables()
+
+def _adpcm_encode_blocks(blocks):
+    """
+    Encode equal-length blocks, one per row, in lock step: the loop runs
+    over sample positions and every operation covers all blocks at once.
+    Returns (first samples, step indexes, codes of shape (blocks, length - 1)).
+    """
+    blocks = blocks.astype(np.int32)
+    predictor = blocks[:, 0].copy()
+    # Start each block at the step size that fits its opening differences,
+    # so blocks do not depend on the state their predecessors ended in
+    opening = np.abs(np.diff(blocks[:, :9], axis=1)).mean(axis=1) if blocks.shape[1] > 1 else np.zeros(len(blocks))
+    index = np.clip(np.searchsorted(ADPCM_STEP_TABLE, opening), 0, 88).astype(np.int32)
+    first_index = index.copy()
+    codes = np.empty((blocks.shape[0], blocks.shape[1] - 1), dtype=np.uint8)
+    for position in range(1, blocks.shape[1]):
+        diff = blocks[:, position] - predictor
+        negative = diff < 0
+        # Quantize |diff| to quarter steps; any code is valid since decoding is table driven
+        magnitude = np.minimum((np.abs(diff) << 2) // ADPCM_STEP_TABLE[index], 7)
+        delta = ADPCM_DELTA_TABLE[index, magnitude]
+        predictor = np.clip(np.where(negative, predictor - delta, predictor + delta), -32768, 32767)
+        index = ADPCM_NEXT_INDEX[index, magnitude]
+        codes[:, position - 1] = magnitude | (negative << 3)
+    return blocks[:, 0], first_index, codes
+
+def _pack_blocks(first, index, codes, padded):
+    if codes.shape[1] % 2:
+        codes = np.concatenate([codes, np.zeros((codes.shape[0], 1), dtype=np.uint8)], axis=1)
+    header = np.empty((codes.shape[0], ADPCM_HEADER_BYTES), dtype=np.uint8)
+    header[:, 0:2] = first.astype('<i2').view(np.uint8).reshape(-1, 2)
+    header[:, 2] = index
+    header[:, 3] = padded
+    packed = codes[:, 0::2] | (codes[:, 1::2] << 4)
+    return np.concatenate([header, packed], axis=1).tobytes()
+
+def adpcm_encode(pcm16, block_samples=ADPCM_BLOCK_SAMPLES):
+    """Encode int16 PCM (array or bytes) as IMA-ADPCM blocks, about 3.8:1."""
+    samples = np.frombuffer(pcm16, dtype='<i2') if isinstance(pcm16, (bytes, bytearray, memoryview)) else pcm16
+    if not len(samples):
+        return b""
+    count = -(-len(samples) // block_samples)
+    tail = len(samples) - (count - 1) * block_samples
+    # The short last block rides along in the same pass, padded with its final sample
+    blocks = np.pad(samples, (0, count * block_samples - len(samples)), mode="edge").reshape(count, block_samples)
+    first, index, codes = _adpcm_encode_blocks(blocks)
+    if tail == block_samples:
+        return _pack_blocks(first, index, codes, (block_samples - 1) % 2)
+    encoded = _pack_blocks(first[:-1], index[:-1], codes[:-1], (block_samples - 1) % 2) if count > 1 else b""
+    return encoded + _pack_blocks(first[-1:], index[-1:], codes[-1:, :tail - 1], (tail - 1) % 2)
+
+def adpcm_decode(data, block_samples=ADPCM_BLOCK_SAMPLES):
+    """Reference decoder (the browser has its own); returns int16 PCM bytes."""
+    block_bytes = ADPCM_HEADER_BYTES + block_samples // 2
+    output = []
+    for start in range(0, len(data), block_bytes):
+        block = np.frombuffer(data[start:start + block_bytes], dtype=np.uint8)
+        predictor = int(block[0:2].view('<i2')[0])
+        index = int(block[2])
+        packed = block[ADPCM_HEADER_BYTES:]
+        codes = np.empty(len(packed) * 2, dtype=np.int32)
+        codes[0::2] = packed & 0x0F
+        codes[1::2] = packed >> 4
+        if block[3]:
+            codes = codes[:-1]
+        samples = [predictor]
+        for code in codes:
+            step = int(ADPCM_STEP_TABLE[index])
+            delta = step >> 3
+            if code & 4:
+                delta += step
+            if code & 2:
+                delta += step >> 1
+            if code & 1:
+                delta += step >> 2
+            predictor = max(-32768, min(32767, predictor - delta if code & 8 else predictor + delta))
+            index = max(0, min(88, index + int(ADPCM_INDEX_TABLE[code])))
+            samples.append(predictor)
+        output.append(np.array(samples, dtype='<i2').tobytes())
+    return b"".join(output)
+
+ENCODERS = {CODEC_MULAW: mulaw_encode, CODEC_ADPCM: adpcm_encode}
+DECODERS = {CODEC_MULAW: mulaw_decode, CODEC_ADPCM: adpcm_decode}
+
+def choose_codec(offered, allowed=REPLY_AUDIO_CODECS):
+    """First codec in the client's preference list that the server allows, else pcm16."""
+    for codec in offered or []:
+        if codec in allowed:
+            return codec
+    return CODEC_PCM16
+
+def encode_reply_audio(codec, pcm_bytes):
+    encoder = ENCODERS.get(codec)
+    return encoder(pcm_bytes) if encoder else bytes(pcm_bytes)
@@ -1,8 +1,17 @@
 from openai import OpenAI
 from dotenv import load_dotenv
+import logging
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from langchain_openai import OpenAIEmbeddings
 from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient
+from context_packing import pack_contexts
+from local_index import LOCAL_INDEX_PATH, LocalVectorIndex
+from semantic_cache import SEMANTIC_CACHE_ENABLED, SemanticAnswerCache
 
 load_dotenv()
 
@@ -11,139 +20,273 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 QDRANT_URL = os.environ.get("QDRANT_URL")
 QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY")
 DATA_PATH = "./data/hospital_data.pdf"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# "qdrant" searches QDRANT_URL, "local" searches the snapshot exported by fill_db --export-local
+RAG_BACKEND = os.environ.get("RAG_BACKEND", "qdrant")
+# Query embedding cache bounds
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL = float(os.environ.get("EMBEDDING_CACHE_TTL", "3600"))
+
+logger = logging.getLogger("rag")
 
 # Initialize OpenAI embedding model - same as used in fill_db.py
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
 
-def rag(question, collection_name="hospital_db"):
+POLICY_PROMPT = """You are a friendly and helpful virtual assistant for Greenview Medical Centre.
+
+Your behavior should follow these guidelines:
+
+1. For greetings and general conversation (like "Hello", "How are you?", etc.):
+- Respond in a warm, friendly manner as a helpful receptionist would
+- Engage naturally without referencing any specific medical centre data
+- Do not tell me about requesting translation services
+
+2. For questions specifically about Greenview Medical Centre:
+- Answer ONLY using the information provided in the context data
+- Do not make up or infer information not present in the provided data
+- If the context doesn't contain the answer, politely acknowledge your limitations with: "I'm sorry, but I don't have that specific information about Greenview Medical Centre in my current data."
+
+3. For questions unrelated to Greenview Medical Centre:
+- Respond conversationally as a helpful assistant
+- Do not reference or use the Greenview Medical Centre data
+- Treat these as general inquiries requiring friendly assistance
+- Do not tell me about requesting translation services
+"""
+
+# Static policy prefixes, built once; only the retrieved context changes per turn
+ANSWER_PROMPT_PREFIX = POLICY_PROMPT + "\nContext data about Greenview Medical Centre:\n"
+EVENT_PROMPT_PREFIX = POLICY_PROMPT + "\n#Context: "
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace so trivially different transcripts share a key."""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+class EmbeddingCache:
     """
-    RAG function using Qdrant as vector store.
-    Returns a text response directly.
+    Bounded LRU cache of query embeddings with a time-to-live.
+    Shared by the retrieval threads, so every access takes the lock.
     """
-    # Initialize the Qdrant vector store
-    vector_store = QdrantVectorStore.from_existing_collection(
-        url=QDRANT_URL, 
-        api_key=QDRANT_API_KEY,
-        collection_name=collection_name,
-        embedding=embeddings
-    )
-    
-    print("Querying collection with:", question)
-    
-    # Search for relevant documents
-    retriever = vector_store.as_retriever(search_kwargs={"k": 3})
-    contexts = retriever.invoke(question)
-    
-    # Format the retrieved contexts
-    formatted_contexts = []
-    for i, doc in enumerate(contexts):
-        formatted_contexts.append(f"Context {i+1}: {doc.page_content}")
-    
-    context_text = "\n\n".join(formatted_contexts)
-    
-    client = OpenAI()
-    
-    system_prompt = f"""You are a friendly and helpful virtual assistant for Greenview Medical Centre. 
 
-    Your behavior should follow these guidelines:
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
-    1. For greetings and general conversation (like "Hello", "How are you?", etc.):
-    - Respond in a warm, friendly manner as a helpful receptionist would
-    - Engage naturally without referencing any specific medical centre data
-    - Do not tell me about requesting translation services
-    
-    2. For questions specifically about Greenview Medical Centre:
-    - Answer ONLY using the information provided in the context data
-    - Do not make up or infer information not present in the provided data
-    - If the context doesn't contain the answer, politely acknowledge your limitations with: "I'm sorry, but I don't have that specific information about Greenview Medical Centre in my current data."
-
-    3. For questions unrelated to Greenview Medical Centre:
-    - Respond conversationally as a helpful assistant
-    - Do not reference or use the Greenview Medical Centre data
-    - Treat these as general inquiries requiring friendly assistance
-    - Do not tell me about requesting translation services
-    
-    Context data about Greenview Medical Centre:
-    {context_text}
-    """    
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "system", "content": system_prompt},
-                  {"role": "user", "content": question}]
-    )
-    
-    return response.choices[0].message.content
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
 
+    def put(self, key, vector):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), vector)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
 
-def rag2(question, collection_name="hospital_db"):
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+class RetrievalService:
     """
-    RAG function using Qdrant as vector store.
-    Returns an event structure for out-of-band response handling.
+    Long-lived retrieval state for one collection: a single Qdrant client
+    (and its pooled HTTP connections), one OpenAI client and a cache of
+    query embeddings. Use get_retrieval_service() rather than building one per turn.
     """
-    # Initialize the Qdrant vector store
-    vector_store = QdrantVectorStore.from_existing_collection(
-        url=QDRANT_URL, 
-        api_key=QDRANT_API_KEY,
-        collection_name=collection_name,
-        embedding=embeddings
-    )
-    
-    print("Querying collection with:", question)
-    
-    # Search for relevant documents
-    retriever = vector_store.as_retriever(search_kwargs={"k": 3})
-    contexts = retriever.invoke(question)
-    
-    # Format the retrieved contexts
-    formatted_contexts = []
-    for i, doc in enumerate(contexts):
-        formatted_contexts.append(f"Context {i+1}: {doc.page_content}")
-    
-    context_text = "\n\n".join(formatted_contexts)
-    
-    system_prompt = f"""You are a friendly and helpful virtual assistant for Greenview Medical Centre. 
 
-    Your behavior should follow these guidelines:
+    def __init__(self, collection_name="hospital_db", backend=RAG_BACKEND):
+        if backend not in ("qdrant", "local"):
+            raise ValueError(f"Unknown RAG_BACKEND: {backend}")
+        self.collection_name = collection_name
+        self.backend = backend
+        self.embeddings = embeddings
+        self.embedding_cache = EmbeddingCache()
+        # Near-duplicate questions reuse earlier answers without a new retrieval
+        self.text_answer_cache = SemanticAnswerCache() if SEMANTIC_CACHE_ENABLED else None
+        self.event_answer_cache = SemanticAnswerCache() if SEMANTIC_CACHE_ENABLED else None
+        self._vector_store = None
+        self._local_index = None
+        self._llm = None
+        self._lock = threading.Lock()
+        self.packed_turns = 0
+        self.raw_context_tokens = 0
+        self.packed_context_tokens = 0
 
-    1. For greetings and general conversation (like "Hello", "How are you?", etc.):
-    - Respond in a warm, friendly manner as a helpful receptionist would
-    - Engage naturally without referencing any specific medical centre data
-    - Do not tell me about requesting translation services
-    
-    2. For questions specifically about Greenview Medical Centre:
-    - Answer ONLY using the information provided in the context data
-    - Do not make up or infer information not present in the provided data
-    - If the context doesn't contain the answer, politely acknowledge your limitations with: "I'm sorry, but I don't have that specific information about Greenview Medical Centre in my current data."
-
-    3. For questions unrelated to Greenview Medical Centre:
-    - Respond conversationally as a helpful assistant
-    - Do not reference or use the Greenview Medical Centre data
-    - Treat these as general inquiries requiring friendly assistance
-    - Do not tell me about requesting translation services
-    
-    #Context: {context_text}
-    """
+    @property
+    def vector_store(self):
+        # Created on first use; the collection check then happens once per process
+        if self._vector_store is None:
+            with self._lock:
+                if self._vector_store is None:
+                    client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+                    self._vector_store = QdrantVectorStore(
+                        client=client,
+                        collection_name=self.collection_name,
+                        embedding=self.embeddings
+                    )
+        return self._vector_store
+
+    @property
+    def local_index(self):
+        if self._local_index is None:
+            with self._lock:
+                if self._local_index is None:
+                    self._local_index = LocalVectorIndex(LOCAL_INDEX_PATH)
+        return self._local_index
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    self._llm = OpenAI()
+        return self._llm
+
+    def embed_query(self, question):
+        key = normalize_text(question)
+        vector = self.embedding_cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(question)
+            self.embedding_cache.put(key, vector)
+        return vector
+
+    def retrieve(self, question, k=3, vector=None):
+        logger.debug("Querying collection with: %s", question)
+        if vector is None:
+            vector = self.embed_query(question)
+        if self.backend == "local":
+            return self.local_index.search(vector, k=k)
+        return self.vector_store.similarity_search_by_vector(vector, k=k)
+
+    def format_contexts(self, contexts):
+        """Merge, deduplicate and fit the retrieved chunks to CONTEXT_TOKEN_BUDGET."""
+        context_text, report = pack_contexts([doc.page_content for doc in contexts])
+        with self._lock:
+            self.packed_turns += 1
+            self.raw_context_tokens += report["raw_tokens"]
+            self.packed_context_tokens += report["packed_tokens"]
+        logger.debug("Packed %d contexts into %d: %d -> %d tokens", report["chunks_in"], report["chunks_out"],
+                     report["raw_tokens"], report["packed_tokens"])
+        return context_text
+
+    def answer(self, question):
+        """Retrieve context and return a text answer from the chat model."""
+        vector = self.embed_query(question)
+        if self.text_answer_cache:
+            cached, _ = self.text_answer_cache.lookup(vector)
+            if cached is not None:
+                return cached
+        context_text = self.format_contexts(self.retrieve(question, vector=vector))
+        
+        system_prompt = ANSWER_PROMPT_PREFIX + context_text
+        response = self.llm.chat.completions.create(
+            model="gpt-4o",
+            messages=[{"role": "system", "content": system_prompt},
+                      {"role": "user", "content": question}]
+        )
+        
+        answer = response.choices[0].message.content
+        if self.text_answer_cache:
+            self.text_answer_cache.store(vector, answer)
+        return answer
+
+    def response_event(self, question):
+        """Retrieve context and return a response.create event for out-of-band response handling."""
+        vector = self.embed_query(question)
+        if self.event_answer_cache:
+            cached, _ = self.event_answer_cache.lookup(vector)
+            if cached is not None:
+                return cached
+        context_text = self.format_contexts(self.retrieve(question, vector=vector))
+        
+        system_prompt = EVENT_PROMPT_PREFIX + context_text
     
-    event = {
-        "type": "response.create",
-        "response": {
-            # Setting to "none" indicates the response is out of band,
-            # and will not be added to the default conversation
-            "conversation": "none",
+        event = {
+            "type": "response.create",
+            "response": {
+                # Setting to "none" indicates the response is out of band,
+                # and will not be added to the default conversation
+                "conversation": "none",
             
-            # Set metadata to help identify responses sent back from the model
-            "metadata": { "topic": "rag" },
+                # Set metadata to help identify responses sent back from the model
+                "metadata": { "topic": "rag" },
             
-            # Set any other available response fields
-            "modalities": [ "text", "audio"],
-            "instructions": system_prompt,
-            "input": []
-        },
-    }
+                # Set any other available response fields
+                "modalities": [ "text", "audio"],
+                "instructions": system_prompt,
+                "input": []
+            },
+        }
     
-    return event
+        if self.event_answer_cache:
+            self.event_answer_cache.store(vector, event)
+        return event
+
+    def stats(self):
+        stats = {
+            "collection": self.collection_name,
+            "backend": self.backend,
+            "embedding_cache": self.embedding_cache.stats(),
+            "context_packing": {
+                "turns": self.packed_turns,
+                "raw_tokens": self.raw_context_tokens,
+                "packed_tokens": self.packed_context_tokens,
+                "saved_tokens": self.raw_context_tokens - self.packed_context_tokens
+            }
+        }
+        if SEMANTIC_CACHE_ENABLED:
+            stats["text_answer_cache"] = self.text_answer_cache.stats()
+            stats["event_answer_cache"] = self.event_answer_cache.stats()
+        return stats
+
+_services = {}
+_services_lock = threading.Lock()
+
+def get_retrieval_service(collection_name="hospital_db"):
+    with _services_lock:
+        if collection_name not in _services:
+            _services[collection_name] = RetrievalService(collection_name)
+        return _services[collection_name]
+
+def rag(question, collection_name="hospital_db"):
+    """
+    RAG function using the configured vector store (Qdrant or the local snapshot).
+    Returns a text response directly.
+    """
+    return get_retrieval_service(collection_name).answer(question)
+
+
+def rag2(question, collection_name="hospital_db"):
+    """
+    RAG function using the configured vector store (Qdrant or the local snapshot).
+    Returns an event structure for out-of-band response handling.
+    """
+    return get_retrieval_service(collection_name).response_event(question)
 
 
 if __name__ == "__main__":
     response = rag("Where is Greenview medical centre located?")
-    print(response)
\ No newline at end of file
+    print(response)
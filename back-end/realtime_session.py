@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+import time
+from dotenv import load_dotenv
+from refill_pool import RefillPool
+from speculative_retrieval import SPECULATIVE_RETRIEVAL
+from websockets.asyncio.client import connect
+from websockets.protocol import State
+
+load_dotenv()
+
+OPENAI_REALTIME_URL = os.environ.get(
+    "OPENAI_REALTIME_URL",
+    "wss://api.openai.com/v1/realtime?model=gpt-4o-mini-realtime-preview"
+)
+# Seconds to wait for session.created and session.updated before giving up
+SESSION_READY_TIMEOUT = float(os.environ.get("SESSION_READY_TIMEOUT", "10"))
+# Number of configured sessions kept ready for new callers (0 disables the pool)
+REALTIME_POOL_SIZE = int(os.environ.get("REALTIME_POOL_SIZE", "0"))
+# Pooled sessions older than this are replaced; upstream sessions expire after 30 minutes
+REALTIME_POOL_MAX_AGE = float(os.environ.get("REALTIME_POOL_MAX_AGE", "1200"))
+
+# Caller transcription model. Speculative retrieval needs partial transcripts while the
+# caller's words are being transcribed, which whisper-1 does not stream (it sends the
+# whole transcript as one delta), so a streaming model is the default when it is on
+INPUT_TRANSCRIPTION_MODEL = os.environ.get(
+    "INPUT_TRANSCRIPTION_MODEL",
+    "gpt-4o-mini-transcribe" if SPECULATIVE_RETRIEVAL else "whisper-1"
+)
+
+SESSION_CONFIG = {
+    "instructions": "Your job is to transcript audio you're given, and create speech of text you're given.",
+    "input_audio_transcription": {
+        "model": INPUT_TRANSCRIPTION_MODEL,
+        "language": "en"
+    },
+    "turn_detection": {
+        "type": "server_vad",
+        "threshold": 0.5,
+        "prefix_padding_ms": 300,
+        "silence_duration_ms": 500,
+        "create_response": False,
+        "interrupt_response": False
+    },
+    "voice": "ballad"
+}
+
+async def wait_for_event(ws, event_type):
+    """Read upstream events until one of event_type arrives; errors are raised."""
+    while True:
+        data = json.loads(await ws.recv())
+        if data['type'] == event_type:
+            return data
+        if data['type'] == "error":
+            raise RuntimeError(f"Realtime session setup failed: {data.get('error')}")
+
+async def open_realtime_session(timeout=SESSION_READY_TIMEOUT):
+    """
+    Open a realtime connection and configure it.
+    Returns once session.created has been answered with a session.update
+    and the matching session.updated has arrived, so the socket is ready for audio.
+    """
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+    if not OPENAI_API_KEY:
+        raise ValueError("Missing OPENAI_API_KEY")
+
+    headers = {
+        "Authorization": "Bearer " + OPENAI_API_KEY,
+        "OpenAI-Beta": "realtime=v1"
+    }
+
+    # Reply audio deltas can exceed the default 1 MiB frame limit
+    ws = await connect(OPENAI_REALTIME_URL, additional_headers=headers, max_size=None,
+                       open_timeout=timeout)
+    try:
+        async with asyncio.timeout(timeout):
+            await wait_for_event(ws, "session.created")
+            await ws.send(json.dumps({"type": "session.update", "session": SESSION_CONFIG}))
+            await wait_for_event(ws, "session.updated")
+    except BaseException:
+        await ws.close()
+        raise
+    return ws
+
+class RealtimeSessionPool(RefillPool):
+    """
+    Keeps up to `size` configured realtime sessions open so a new caller
+    can take one immediately. Taken or expired sessions are replaced by a
+    background task.
+    """
+
+    kind = "realtime session"
+
+    def __init__(self, size=REALTIME_POOL_SIZE, max_age=REALTIME_POOL_MAX_AGE):
+        super().__init__(size)
+        self.max_age = max_age
+
+    async def start(self):
+        self.start_refill()
+
+    async def create(self):
+        return await open_realtime_session(), time.monotonic()
+
+    def is_usable(self, ws, opened_at):
+        return ws.state is State.OPEN and time.monotonic() - opened_at < self.max_age
+
+    async def discard(self, ws):
+        await ws.close()
+
+    def next_check_in(self):
+        # Wake up periodically as well, so aged sessions get replaced
+        return self.max_age / 4
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "idle": len(self.ready),
+            "opening": self.creating,
+            "hits": self.hits,
+            "misses": self.misses,
+            "opened": self.created,
+            "failures": self.failures,
+            "expired": self.expired
+        }
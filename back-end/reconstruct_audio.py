@@ -1,12 +1,9 @@
-import base64
 import numpy as np
+from audio_codec import decode_float, encode_float, join_pcm16
 
 def base64_decode_audio(encoded_str):
     try:
-        pcm_bytes = base64.b64decode(encoded_str)
-        int16_array = np.frombuffer(pcm_bytes, dtype=np.int16)
-        float32_array = int16_array.astype(np.float32) / 32767.0
-        return float32_array
+        return decode_float(encoded_str)
     except Exception as e:
         print(f"Error decoding audio: {e}")
         return np.array([], dtype=np.float32)
@@ -33,6 +30,16 @@ def reconstruct_audio(audio_chunks):
     full_audio = np.concatenate(decoded_chunks)
     return full_audio
 
+def reconstruct_pcm16(audio_chunks):
+    """Join base64 PCM16 chunks into raw PCM16 bytes without a float round trip."""
+    if not audio_chunks:
+        return b""
+    try:
+        return join_pcm16(audio_chunks)
+    except Exception as e:
+        print(f"Error decoding chunk: {e}")
+        return b""
+
 # Add this function for the transcription.py file
 def base64_encode_audio(float32_array):
     if len(float32_array) == 0:
@@ -40,19 +47,7 @@ def base64_encode_audio(float32_array):
         return ""
         
     try:
-        # Ensure the audio is properly clipped
-        clipped = np.clip(float32_array, -1.0, 1.0)
-        
-        # Convert to int16 (PCM format)
-        int16_data = np.int16(clipped * 32767)
-        
-        # Convert to bytes
-        pcm_bytes = int16_data.tobytes()
-        
-        # Encode to base64
-        encoded = base64.b64encode(pcm_bytes).decode('ascii')
-        
-        return encoded
+        return encode_float(float32_array)
     except Exception as e:
         print(f"Error encoding audio: {e}")
-        return ""
\ No newline at end of file
+        return ""
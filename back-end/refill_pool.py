@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger("refill-pool")
+
+class RefillPool:
+    """
+    Keeps up to `size` ready items, each stored with a stamp (open time,
+    expiry, ...). A background task replaces items that are taken or stop
+    being usable, with exponential backoff while creating them fails.
+
+    Subclasses implement create() -> (item, stamp) and is_usable(item, stamp),
+    and may override discard(item) and next_check_in().
+    """
+
+    kind = "item"
+
+    def __init__(self, size):
+        self.size = size
+        self.ready = deque()
+        self.creating = 0
+        self.refill_needed = asyncio.Event()
+        self.task = None
+
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.failures = 0
+        self.expired = 0
+
+    async def create(self):
+        raise NotImplementedError
+
+    def is_usable(self, item, stamp):
+        raise NotImplementedError
+
+    async def discard(self, item):
+        pass
+
+    def next_check_in(self):
+        """Seconds until the refill task wakes up on its own to drop stale items."""
+        return 60.0
+
+    def start_refill(self):
+        if self.size > 0:
+            self.refill_needed.set()
+            self.task = asyncio.create_task(self.refill_loop())
+
+    async def acquire(self):
+        """Return a usable ready item, creating one directly if none is ready."""
+        while self.ready:
+            item, stamp = self.ready.popleft()
+            if self.is_usable(item, stamp):
+                self.hits += 1
+                self.refill_needed.set()
+                return item
+            self.expired += 1
+            asyncio.create_task(self.discard(item))
+        self.misses += 1
+        self.refill_needed.set()
+        item, _ = await self.create()
+        return item
+
+    async def create_one(self):
+        self.creating += 1
+        try:
+            self.ready.append(await self.create())
+            self.created += 1
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Failed to pre-create {self.kind}: {e}")
+            raise
+        finally:
+            self.creating -= 1
+
+    async def drop_stale(self):
+        for _ in range(len(self.ready)):
+            item, stamp = self.ready.popleft()
+            if self.is_usable(item, stamp):
+                self.ready.append((item, stamp))
+            else:
+                self.expired += 1
+                await self.discard(item)
+
+    async def refill_loop(self):
+        backoff = 1.0
+        while True:
+            # asyncio.timeout rather than wait_for, which can swallow the cancel from close() on 3.11
+            try:
+                async with asyncio.timeout(self.next_check_in()):
+                    await self.refill_needed.wait()
+            except TimeoutError:
+                pass
+            self.refill_needed.clear()
+            await self.drop_stale()
+
+            missing = self.size - len(self.ready) - self.creating
+            if missing <= 0:
+                continue
+            results = await asyncio.gather(*(self.create_one() for _ in range(missing)),
+                                           return_exceptions=True)
+            if any(isinstance(result, Exception) for result in results):
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+                self.refill_needed.set()
+            else:
+                backoff = 1.0
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        while self.ready:
+            item, _ = self.ready.popleft()
+            await self.discard(item)
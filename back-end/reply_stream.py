@@ -0,0 +1,100 @@
+import os
+from dotenv import load_dotenv
+from audio_codec import BYTES_PER_SAMPLE, SAMPLE_RATE, join_pcm16
+
+load_dotenv()
+
+# "stream" forwards reply audio as it arrives, "buffered" sends one clip on response.audio.done.
+# Clients that ask for "stream" in their hello get it regardless; older clients only
+# understand audio_response_transmitting, so the default stays buffered
+REPLY_AUDIO_MODE = os.environ.get("REPLY_AUDIO_MODE", "buffered")
+# Deltas are coalesced until at least this much audio is pending (0 forwards every delta)
+STREAM_MIN_CHUNK_MS = int(os.environ.get("STREAM_MIN_CHUNK_MS", "100"))
+
+class ReplyAudioStream:
+    """
+    Turns response.audio.delta payloads into numbered client messages.
+
+    Every reply gets an utterance id, every chunk inside it a sequence
+    number, and the reply is closed with an audio_response_end marker
+    carrying the number of chunks sent so the player can detect gaps.
+    Chunk messages hold raw PCM16; the client channel encodes them for
+    the wire.
+    """
+
+    def __init__(self, min_chunk_ms=STREAM_MIN_CHUNK_MS, sample_rate=SAMPLE_RATE):
+        self.min_chunk_bytes = int(sample_rate * min_chunk_ms / 1000) * BYTES_PER_SAMPLE
+        self.utterance_id = 0
+        self.seq = 0
+        self.pending = []
+        self.pending_bytes = 0
+        self.open = False
+
+    def _chunk_message(self, pcm_bytes):
+        message = {
+            "event_type": "audio_response_chunk",
+            "event_data": pcm_bytes,
+            "utterance_id": self.utterance_id,
+            "seq": self.seq
+        }
+        self.seq += 1
+        return message
+
+    def add(self, delta):
+        """Queue a base64 delta; returns a message once enough audio is pending, else None."""
+        if not self.open:
+            self.open = True
+            self.utterance_id += 1
+            self.seq = 0
+        self.pending.append(delta)
+        # base64 length * 3/4 is the decoded size, close enough for coalescing
+        self.pending_bytes += len(delta) * 3 // 4
+        if self.pending_bytes < self.min_chunk_bytes:
+            return None
+        return self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return None
+        pcm_bytes = join_pcm16(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        if not pcm_bytes:
+            return None
+        return self._chunk_message(pcm_bytes)
+
+    def clip_messages(self, pcm_bytes):
+        """Messages for a complete PCM16 clip, split like a streamed reply and closed with an end marker."""
+        # Close any reply still streaming so the clip gets its own utterance
+        messages = self.finish()
+        self.open = True
+        self.utterance_id += 1
+        self.seq = 0
+        step = max(self.min_chunk_bytes, BYTES_PER_SAMPLE)
+        messages += [self._chunk_message(pcm_bytes[start:start + step])
+                     for start in range(0, len(pcm_bytes), step)]
+        return messages + self.finish()
+
+    def cancel(self):
+        """Drop audio not yet sent and close the utterance without an end marker; returns the bytes dropped."""
+        dropped = self.pending_bytes
+        self.pending = []
+        self.pending_bytes = 0
+        self.open = False
+        return dropped
+
+    def finish(self):
+        """Flush what is left and close the utterance; returns the messages to send."""
+        if not self.open:
+            return []
+        messages = []
+        last = self.flush()
+        if last:
+            messages.append(last)
+        messages.append({
+            "event_type": "audio_response_end",
+            "utterance_id": self.utterance_id,
+            "seq": self.seq
+        })
+        self.open = False
+        return messages
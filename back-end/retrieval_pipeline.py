@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from metrics import DROPPED_TRANSCRIPTS
+
+load_dotenv()
+
+# Maximum retrievals running at once across every session in the process
+RAG_MAX_CONCURRENCY = int(os.environ.get("RAG_MAX_CONCURRENCY", "8"))
+# Maximum transcripts waiting for retrieval in one session
+RAG_SESSION_QUEUE_SIZE = int(os.environ.get("RAG_SESSION_QUEUE_SIZE", "4"))
+
+logger = logging.getLogger("retrieval-pipeline")
+
+# Retrieval is blocking network I/O (embedding + vector search), so it runs on a
+# shared worker pool whose size is the process-wide concurrency cap
+_executor = ThreadPoolExecutor(max_workers=RAG_MAX_CONCURRENCY, thread_name_prefix="rag")
+
+class RetrievalPipeline:
+    """
+    Retrieval stage for one session.
+
+    Finished transcripts are submitted without waiting; their retrievals
+    run concurrently on the shared pool, and a single sender task awaits
+    them in submission order, so response.create events for a session go
+    upstream in the order the caller asked. When more than max_pending
+    transcripts are waiting the oldest one is cancelled. A retrieval that a
+    worker has already picked up cannot be stopped; cancelling it only
+    discards its result, and it is counted as abandoned. An optional turn
+    timeline travels with each retrieval and is handed to send(); a send
+    that fails is logged and counted, and the sender carries on.
+    """
+
+    def __init__(self, retrieve, send, max_pending=RAG_SESSION_QUEUE_SIZE, executor=None):
+        self.retrieve = retrieve
+        self.send = send
+        self.executor = executor or _executor
+        self.pending = asyncio.Queue()
+        self.max_pending = max_pending
+        self.task = None
+        # The retrieval the sender is waiting on; it has left the queue but is not sent yet
+        self.current = None
+        # Pool work behind each retrieval future that has not finished yet
+        self.work = {}
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.send_failed = 0
+        self.cancelled = 0
+        self.abandoned = 0
+        self.dropped = 0
+        self.total_seconds = 0.0
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def start_retrieval(self, transcript):
+        """Start a retrieval on the shared pool without queuing its result for sending."""
+        work = self.executor.submit(self.retrieve, transcript)
+        future = asyncio.wrap_future(work)
+        self.work[future] = work
+        future.add_done_callback(lambda done: self.work.pop(done, None))
+        return future
+
+    def cancel(self, future):
+        """Cancel a retrieval; returns True only if it had not started on the pool, so no work was done."""
+        work = self.work.pop(future, None)
+        stopped = work is not None and work.cancel()
+        if not future.done():
+            if not stopped:
+                self.abandoned += 1
+            future.cancel()
+        return stopped
+
+    def enqueue(self, future, started_at=None, turn=None):
+        """Queue a started retrieval; its event is sent after those queued before it."""
+        while self.pending.qsize() >= self.max_pending:
+            dropped, _, _ = self.pending.get_nowait()
+            self.cancel(dropped)
+            self.dropped += 1
+            DROPPED_TRANSCRIPTS.inc()
+            logger.warning(f"Dropped the oldest of {self.max_pending} transcripts waiting for retrieval")
+        started_at = started_at or time.monotonic()
+        if turn is not None:
+            turn.mark("retrieval_start", started_at)
+            future.add_done_callback(lambda _: turn.mark("retrieval_end"))
+        self.pending.put_nowait((future, started_at, turn))
+        self.submitted += 1
+        return future
+
+    def submit(self, transcript, turn=None):
+        return self.enqueue(self.start_retrieval(transcript), turn=turn)
+
+    def cancel_pending(self):
+        """
+        Cancel every retrieval that has not been sent yet; returns how many
+        were stopped before running and how many were left running.
+        """
+        futures = [self.current] if self.current is not None and not self.current.done() else []
+        while not self.pending.empty():
+            future, _, _ = self.pending.get_nowait()
+            if not future.done():
+                futures.append(future)
+        stopped = sum(self.cancel(future) for future in futures)
+        self.cancelled += stopped
+        return stopped, len(futures) - stopped
+
+    async def run(self):
+        while True:
+            future, submitted_at, turn = await self.pending.get()
+            self.current = future
+            # wait() does not raise if the retrieval itself was cancelled
+            await asyncio.wait([future])
+            self.current = None
+            if future.cancelled():
+                continue
+            if future.exception() is not None:
+                self.failed += 1
+                logger.error(f"Retrieval failed: {future.exception()}")
+                continue
+            self.completed += 1
+            self.total_seconds += time.monotonic() - submitted_at
+            try:
+                await self.send(future.result(), turn)
+            except Exception as e:
+                # e.g. the upstream socket closed; later turns may still go through a new one
+                self.send_failed += 1
+                logger.error(f"Failed to send retrieval result: {e}")
+
+    async def close(self):
+        self.cancel_pending()
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def stats(self):
+        return {
+            "depth": self.pending.qsize(),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "send_failed": self.send_failed,
+            "cancelled": self.cancelled,
+            "abandoned": self.abandoned,
+            "dropped": self.dropped,
+            "mean_seconds": self.total_seconds / self.completed if self.completed else 0.0
+        }
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Minimum cosine similarity for two transcripts to count as the same question
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.environ.get("SEMANTIC_CACHE_SIZE", "256"))
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "1") == "1"
+# fill_db() touches this file after rebuilding the collection; caches built before that are dropped
+INDEX_GENERATION_PATH = os.environ.get("INDEX_GENERATION_PATH", "./data/index_generation")
+
+def read_index_generation(path=INDEX_GENERATION_PATH):
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return ""
+
+def bump_index_generation(path=INDEX_GENERATION_PATH):
+    """Record that the knowledge base changed so every answer cache is invalidated."""
+    generation = str(time.time_ns())
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        file.write(generation)
+    os.replace(tmp_path, path)
+    return generation
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by query embedding rather than exact text.
+
+    A lookup returns the stored value of the most similar entry whose
+    cosine similarity is at least `threshold`. Entries expire after `ttl`
+    seconds, the least recently used entry is evicted beyond `max_size`,
+    and everything is dropped when the index generation changes.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_size=SEMANTIC_CACHE_SIZE,
+                 ttl=SEMANTIC_CACHE_TTL, generation_path=INDEX_GENERATION_PATH):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation_path = generation_path
+        self.generation = read_index_generation(generation_path)
+        self.vectors = None
+        self.values = []
+        self.created = []
+        self.last_used = []
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_generation(self):
+        generation = read_index_generation(self.generation_path)
+        if generation != self.generation:
+            self.generation = generation
+            self._clear()
+            self.invalidations += 1
+
+    def _clear(self):
+        self.vectors = None
+        self.values = []
+        self.created = []
+        self.last_used = []
+
+    def _remove(self, indices):
+        removed = set(indices)
+        keep = [i for i in range(len(self.values)) if i not in removed]
+        self.vectors = self.vectors[keep] if keep else None
+        self.values = [self.values[i] for i in keep]
+        self.created = [self.created[i] for i in keep]
+        self.last_used = [self.last_used[i] for i in keep]
+
+    def _expire(self, now):
+        expired = [i for i, created in enumerate(self.created) if now - created > self.ttl]
+        if expired:
+            self.evictions += len(expired)
+            self._remove(expired)
+
+    def lookup(self, vector):
+        """Return (value, similarity) for the closest fresh entry above the threshold, else (None, best)."""
+        with self.lock:
+            self._check_generation()
+            now = time.monotonic()
+            self._expire(now)
+            if self.vectors is None:
+                self.misses += 1
+                return None, 0.0
+            similarities = self.vectors @ self._unit(vector)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, similarity
+            self.last_used[best] = now
+            self.hits += 1
+            return self.values[best], similarity
+
+    def store(self, vector, value):
+        with self.lock:
+            self._check_generation()
+            now = time.monotonic()
+            self._expire(now)
+            if len(self.values) >= self.max_size:
+                self.evictions += 1
+                self._remove([int(np.argmin(self.last_used))])
+            unit = self._unit(vector)[None, :]
+            self.vectors = unit if self.vectors is None else np.vstack([self.vectors, unit])
+            self.values.append(value)
+            self.created.append(now)
+            self.last_used.append(now)
+
+    def invalidate(self):
+        with self.lock:
+            self._clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.values),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
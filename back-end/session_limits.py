@@ -0,0 +1,54 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Buffered reply audio kept per session before it is sent to the client early (bytes of PCM16)
+SESSION_MAX_REPLY_AUDIO_BYTES = int(os.environ.get("SESSION_MAX_REPLY_AUDIO_BYTES", str(2 * 1024 * 1024)))
+# Entries kept in each per-session id set or map; the oldest are forgotten first
+SESSION_MAX_TRACKED_IDS = int(os.environ.get("SESSION_MAX_TRACKED_IDS", "256"))
+# Sessions with no client or upstream traffic for this long are closed (0 disables)
+SESSION_IDLE_TIMEOUT = float(os.environ.get("SESSION_IDLE_TIMEOUT", "300"))
+SESSION_REAPER_INTERVAL = float(os.environ.get("SESSION_REAPER_INTERVAL", "30"))
+
+class BoundedDict(dict):
+    """A dict that forgets its oldest insertion once it holds `limit` keys."""
+
+    def __init__(self, limit=SESSION_MAX_TRACKED_IDS):
+        super().__init__()
+        self.limit = limit
+        self.evicted = 0
+
+    def __setitem__(self, key, value):
+        if key not in self and len(self) >= self.limit:
+            del self[next(iter(self))]
+            self.evicted += 1
+        super().__setitem__(key, value)
+
+class BoundedSet:
+    """An insertion-ordered set that forgets its oldest member once it holds `limit`."""
+
+    def __init__(self, limit=SESSION_MAX_TRACKED_IDS):
+        self.items = BoundedDict(limit)
+
+    def add(self, item):
+        self.items[item] = None
+
+    def discard(self, item):
+        self.items.pop(item, None)
+
+    def clear(self):
+        self.items.clear()
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    @property
+    def evicted(self):
+        return self.items.evicted
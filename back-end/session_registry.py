@@ -0,0 +1,165 @@
+import json
+import os
+import resource
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Shared by every worker process on the host
+SESSION_REGISTRY_PATH = os.environ.get("SESSION_REGISTRY_PATH", "./data/sessions.sqlite3")
+# Concurrent call caps; 0 disables a cap
+MAX_SESSIONS_PER_WORKER = int(os.environ.get("MAX_SESSIONS_PER_WORKER", "50"))
+MAX_SESSIONS_GLOBAL = int(os.environ.get("MAX_SESSIONS_GLOBAL", "200"))
+SESSION_HEARTBEAT_SECONDS = float(os.environ.get("SESSION_HEARTBEAT_SECONDS", "5"))
+# Rows not refreshed for this long belong to a worker that died and are removed
+SESSION_STALE_SECONDS = float(os.environ.get("SESSION_STALE_SECONDS", "30"))
+
+def worker_usage():
+    """CPU seconds, resident memory and thread count of this process."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    rss = usage.ru_maxrss * 1024
+    try:
+        with open("/proc/self/statm") as file:
+            rss = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    return {
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+        "rss_bytes": rss,
+        "threads": threading.active_count()
+    }
+
+class SessionRegistry:
+    """
+    Live /ws sessions of every worker, kept in one SQLite database.
+
+    admit() checks the per-worker and global caps and inserts the session
+    in a single write transaction, so concurrent workers cannot overshoot
+    the global cap. Each worker refreshes its rows with heartbeat(); rows
+    of workers that stop heartbeating are treated as gone.
+    """
+
+    def __init__(self, path=SESSION_REGISTRY_PATH, worker_id=None,
+                 max_per_worker=MAX_SESSIONS_PER_WORKER, max_global=MAX_SESSIONS_GLOBAL,
+                 stale_seconds=SESSION_STALE_SECONDS):
+        self.path = path
+        self.worker_id = worker_id or os.getpid()
+        self.max_per_worker = max_per_worker
+        self.max_global = max_global
+        self.stale_seconds = stale_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Called from executor threads, so the connection is shared under a lock
+        self.connection = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.rejected = 0
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, worker_id INTEGER NOT NULL, client TEXT, "
+                "started_at REAL NOT NULL, heartbeat_at REAL NOT NULL, usage TEXT)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                "worker_id INTEGER PRIMARY KEY, started_at REAL NOT NULL, heartbeat_at REAL NOT NULL, usage TEXT)"
+            )
+
+    def register_worker(self):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, started_at, heartbeat_at, usage) VALUES (?, ?, ?, ?)",
+                (self.worker_id, now, now, json.dumps(worker_usage()))
+            )
+            # A reused pid must not inherit sessions from the process that had it before
+            self.connection.execute("DELETE FROM sessions WHERE worker_id = ?", (self.worker_id,))
+
+    def admit(self, session_id, client=None):
+        """Insert the session if both caps allow it; returns True when admitted."""
+        now = time.time()
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cutoff = now - self.stale_seconds
+                cursor.execute("DELETE FROM sessions WHERE heartbeat_at < ?", (cutoff,))
+                cursor.execute("DELETE FROM workers WHERE heartbeat_at < ?", (cutoff,))
+                total = cursor.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+                local = cursor.execute("SELECT COUNT(*) FROM sessions WHERE worker_id = ?",
+                                       (self.worker_id,)).fetchone()[0]
+                if (self.max_global and total >= self.max_global) or \
+                        (self.max_per_worker and local >= self.max_per_worker):
+                    cursor.execute("ROLLBACK")
+                    self.rejected += 1
+                    return False
+                cursor.execute(
+                    "INSERT INTO sessions (session_id, worker_id, client, started_at, heartbeat_at, usage) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, self.worker_id, client, now, now, "{}")
+                )
+                cursor.execute("COMMIT")
+                return True
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def release(self, session_id):
+        with self.lock:
+            self.connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def heartbeat(self, session_usage):
+        """Refresh this worker and its sessions; session_usage maps session id to a usage dict."""
+        now = time.time()
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cursor.execute("UPDATE workers SET heartbeat_at = ?, usage = ? WHERE worker_id = ?",
+                               (now, json.dumps(worker_usage()), self.worker_id))
+                cursor.executemany(
+                    "UPDATE sessions SET heartbeat_at = ?, usage = ? WHERE session_id = ? AND worker_id = ?",
+                    [(now, json.dumps(usage), session_id, self.worker_id)
+                     for session_id, usage in session_usage.items()]
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def list_sessions(self):
+        cutoff = time.time() - self.stale_seconds
+        with self.lock:
+            sessions = self.connection.execute(
+                "SELECT session_id, worker_id, client, started_at, heartbeat_at, usage FROM sessions "
+                "WHERE heartbeat_at >= ? ORDER BY started_at", (cutoff,)
+            ).fetchall()
+            workers = self.connection.execute(
+                "SELECT worker_id, started_at, heartbeat_at, usage FROM workers WHERE heartbeat_at >= ?",
+                (cutoff,)
+            ).fetchall()
+        now = time.time()
+        return {
+            "workers": [{"worker_id": worker_id, "uptime_seconds": round(now - started_at, 1),
+                         "heartbeat_age_seconds": round(now - heartbeat_at, 1), **json.loads(usage or "{}")}
+                        for worker_id, started_at, heartbeat_at, usage in workers],
+            "sessions": [{"session_id": session_id, "worker_id": worker_id, "client": client,
+                          "duration_seconds": round(now - started_at, 1),
+                          "heartbeat_age_seconds": round(now - heartbeat_at, 1), "usage": json.loads(usage or "{}")}
+                         for session_id, worker_id, client, started_at, heartbeat_at, usage in sessions],
+            "limits": {"max_per_worker": self.max_per_worker, "max_global": self.max_global}
+        }
+
+    def close(self):
+        """Remove this worker and its sessions from the registry."""
+        with self.lock:
+            self.connection.execute("DELETE FROM sessions WHERE worker_id = ?", (self.worker_id,))
+            self.connection.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+            self.connection.close()
+
+    def stats(self):
+        return {"worker_id": self.worker_id, "rejected": self.rejected}
@@ -0,0 +1,137 @@
+import os
+from collections import deque
+import numpy as np
+from dotenv import load_dotenv
+from audio_codec import BYTES_PER_SAMPLE, SAMPLE_RATE, pcm16_duration_ms
+from realtime_session import SESSION_CONFIG
+
+load_dotenv()
+
+_turn_detection = SESSION_CONFIG.get("turn_detection") or {}
+
+# Opt-in: drop microphone chunks confirmed as silence instead of appending them upstream
+SILENCE_GATE = os.environ.get("SILENCE_GATE", "0") == "1"
+# Windows at or above this RMS level (dBFS) are speech
+SILENCE_GATE_SPEECH_DBFS = float(os.environ.get("SILENCE_GATE_SPEECH_DBFS", "-45"))
+# Quieter windows still count as speech when they cross zero this often (unvoiced consonants)
+SILENCE_GATE_WEAK_DBFS = float(os.environ.get("SILENCE_GATE_WEAK_DBFS", "-55"))
+SILENCE_GATE_MIN_ZCR = float(os.environ.get("SILENCE_GATE_MIN_ZCR", "0.25"))
+SILENCE_GATE_WINDOW_MS = int(os.environ.get("SILENCE_GATE_WINDOW_MS", "20"))
+# Silence kept after speech so server VAD still sees silence_duration_ms and ends the turn
+SILENCE_GATE_HANGOVER_MS = int(os.environ.get(
+    "SILENCE_GATE_HANGOVER_MS", str(_turn_detection.get("silence_duration_ms", 500) + 300)))
+# Dropped audio replayed ahead of the next speech so prefix_padding_ms still has audio to use
+SILENCE_GATE_PREROLL_MS = int(os.environ.get(
+    "SILENCE_GATE_PREROLL_MS", str(_turn_detection.get("prefix_padding_ms", 300))))
+# Forward one silent chunk at least this often while gated (0 drops all of them)
+SILENCE_GATE_KEEPALIVE_MS = int(os.environ.get("SILENCE_GATE_KEEPALIVE_MS", "0"))
+
+def dbfs_to_rms(dbfs):
+    return 32767.0 * 10 ** (dbfs / 20)
+
+class SilenceGate:
+    """
+    Energy / zero-crossing gate for one session's microphone audio.
+
+    Each chunk is split into short windows and classified in one vectorized
+    pass. A chunk with any speech window is forwarded together with the
+    buffered pre-roll; silence right after speech is forwarded until the
+    hangover runs out, and later silence is dropped (or thinned to one
+    chunk per keepalive_ms) while the last preroll_ms of it is kept.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, speech_dbfs=SILENCE_GATE_SPEECH_DBFS,
+                 weak_dbfs=SILENCE_GATE_WEAK_DBFS, min_zcr=SILENCE_GATE_MIN_ZCR,
+                 window_ms=SILENCE_GATE_WINDOW_MS, hangover_ms=SILENCE_GATE_HANGOVER_MS,
+                 preroll_ms=SILENCE_GATE_PREROLL_MS, keepalive_ms=SILENCE_GATE_KEEPALIVE_MS):
+        self.sample_rate = sample_rate
+        self.speech_rms = dbfs_to_rms(speech_dbfs)
+        self.weak_rms = dbfs_to_rms(weak_dbfs)
+        self.min_zcr = min_zcr
+        self.window = max(1, sample_rate * window_ms // 1000)
+        self.hangover_ms = hangover_ms
+        self.preroll_bytes = int(sample_rate * preroll_ms / 1000) * BYTES_PER_SAMPLE
+        self.keepalive_ms = keepalive_ms
+        self.hangover_left = 0.0
+        self.gated_ms = 0.0
+        self.preroll = deque()
+        self.preroll_size = 0
+
+        self.chunks_in = 0
+        self.chunks_forwarded = 0
+        self.chunks_dropped = 0
+        self.bytes_in = 0
+        self.bytes_saved = 0
+
+    def is_speech(self, samples):
+        count = len(samples) // self.window * self.window
+        if count == 0:
+            windows = samples.astype(np.float32)[np.newaxis, :]
+        else:
+            windows = samples[:count].astype(np.float32).reshape(-1, self.window)
+        if windows.shape[1] == 0:
+            return False
+        rms = np.sqrt(np.mean(windows * windows, axis=1))
+        signs = np.signbit(windows)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / windows.shape[1]
+        speech = (rms >= self.speech_rms) | ((rms >= self.weak_rms) & (zcr >= self.min_zcr))
+        return bool(speech.any())
+
+    def _buffer(self, pcm_bytes):
+        self.preroll.append(pcm_bytes)
+        self.preroll_size += len(pcm_bytes)
+        while self.preroll and self.preroll_size - len(self.preroll[0]) >= self.preroll_bytes:
+            self.preroll_size -= len(self.preroll.popleft())
+
+    def _take_preroll(self):
+        joined = b"".join(self.preroll)
+        self.preroll.clear()
+        self.preroll_size = 0
+        # Keep only the newest preroll_bytes, cut on a sample boundary
+        return joined[-self.preroll_bytes:] if self.preroll_bytes else b""
+
+    def process(self, pcm_bytes):
+        """Return the list of PCM16 chunks to forward upstream for this microphone chunk."""
+        pcm_bytes = bytes(pcm_bytes)
+        duration_ms = pcm16_duration_ms(len(pcm_bytes), self.sample_rate)
+        self.chunks_in += 1
+        self.bytes_in += len(pcm_bytes)
+
+        if self.is_speech(np.frombuffer(pcm_bytes, dtype='<i2', count=len(pcm_bytes) // BYTES_PER_SAMPLE)):
+            preroll = self._take_preroll()
+            self.hangover_left = self.hangover_ms
+            self.gated_ms = 0.0
+            self.chunks_forwarded += 1
+            # The replayed pre-roll was counted as saved when it was held back
+            self.bytes_saved -= len(preroll)
+            return [preroll, pcm_bytes] if preroll else [pcm_bytes]
+
+        if self.hangover_left > 0:
+            self.hangover_left -= duration_ms
+            self.chunks_forwarded += 1
+            return [pcm_bytes]
+
+        self.gated_ms += duration_ms
+        if self.keepalive_ms and self.gated_ms >= self.keepalive_ms:
+            self.gated_ms = 0.0
+            # Audio held before this chunk is older than what is being forwarded
+            self._take_preroll()
+            self.chunks_forwarded += 1
+            return [pcm_bytes]
+
+        self._buffer(pcm_bytes)
+        self.chunks_dropped += 1
+        self.bytes_saved += len(pcm_bytes)
+        return []
+
+    def stats(self):
+        return {
+            "chunks_in": self.chunks_in,
+            "chunks_forwarded": self.chunks_forwarded,
+            "chunks_dropped": self.chunks_dropped,
+            "bytes_in": self.bytes_in,
+            "bytes_saved": self.bytes_saved,
+            # What the dropped audio would have cost as base64 in input_audio_buffer.append
+            "upstream_bytes_saved": (self.bytes_saved + 2) // 3 * 4,
+            "saved_ratio": self.bytes_saved / self.bytes_in if self.bytes_in else 0.0
+        }
@@ -0,0 +1,141 @@
+import os
+import time
+from difflib import SequenceMatcher
+from dotenv import load_dotenv
+from rag import normalize_text
+from session_limits import BoundedDict
+
+load_dotenv()
+
+# Opt-in: start retrieval from partial transcripts before the final one arrives
+SPECULATIVE_RETRIEVAL = os.environ.get("SPECULATIVE_RETRIEVAL", "0") == "1"
+# Words of partial transcript needed before a speculative retrieval is started
+SPECULATIVE_MIN_WORDS = int(os.environ.get("SPECULATIVE_MIN_WORDS", "4"))
+# Further words needed before a speculation is restarted with the longer text
+SPECULATIVE_STEP_WORDS = int(os.environ.get("SPECULATIVE_STEP_WORDS", "2"))
+SPECULATIVE_MAX_PER_ITEM = int(os.environ.get("SPECULATIVE_MAX_PER_ITEM", "3"))
+# Minimum word-level similarity between the final and the speculative transcript to reuse the result
+SPECULATIVE_MATCH_THRESHOLD = float(os.environ.get("SPECULATIVE_MATCH_THRESHOLD", "0.9"))
+
+def transcripts_match(final, speculative, threshold=SPECULATIVE_MATCH_THRESHOLD):
+    """
+    Whether a retrieval for `speculative` can stand in for `final`: the word
+    sequences may differ only by inserted or missing words (fillers, a
+    trailing word), never by a replaced one, and must be at least
+    `threshold` similar. "open on Sunday" never matches "open on Monday".
+    """
+    final = normalize_text(final).split()
+    speculative = normalize_text(speculative).split()
+    if final == speculative:
+        return True
+    matcher = SequenceMatcher(None, final, speculative, autojunk=False)
+    if any(tag == "replace" for tag, *_ in matcher.get_opcodes()):
+        return False
+    return matcher.ratio() >= threshold
+
+class Speculation:
+    def __init__(self, text, future):
+        self.text = text
+        self.future = future
+        self.started_at = time.monotonic()
+        self.done_at = None
+        future.add_done_callback(self.on_done)
+
+    def on_done(self, future):
+        self.done_at = time.monotonic()
+
+class SpeculativeRetrieval:
+    """
+    Speculative retrieval for one session.
+
+    Partial transcription deltas are accumulated per conversation item.
+    Once enough words have arrived a retrieval is started on the session's
+    pipeline pool. This only helps with a transcription model that streams
+    partials (gpt-4o-*-transcribe); whisper-1 sends the whole transcript as
+    one delta right before the completed event. When the final transcript
+    arrives, take() hands back the speculative result if the texts match
+    closely enough; otherwise the speculation is cancelled and discarded.
+    """
+
+    def __init__(self, pipeline, min_words=SPECULATIVE_MIN_WORDS, step_words=SPECULATIVE_STEP_WORDS,
+                 max_per_item=SPECULATIVE_MAX_PER_ITEM, threshold=SPECULATIVE_MATCH_THRESHOLD):
+        self.pipeline = pipeline
+        self.min_words = min_words
+        self.step_words = step_words
+        self.max_per_item = max_per_item
+        self.threshold = threshold
+        # Per conversation item; items whose transcript never completes are forgotten oldest first
+        self.partials = BoundedDict()
+        self.speculations = BoundedDict()
+        self.started_count = BoundedDict()
+
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.abandoned = 0
+        self.saved_seconds = 0.0
+
+    def maybe_speculate(self, item_id):
+        text = self.partials.get(item_id, "")
+        words = len(text.split())
+        if words < self.min_words:
+            return
+        current = self.speculations.get(item_id)
+        count = self.started_count.get(item_id, 0)
+        if current is not None:
+            grown = words - len(current.text.split())
+            if count >= self.max_per_item or grown < self.step_words:
+                return
+            # The longer partial supersedes the earlier guess
+            self.pipeline.cancel(current.future)
+            self.abandoned += 1
+        self.speculations[item_id] = Speculation(text, self.pipeline.start_retrieval(text))
+        self.started_count[item_id] = count + 1
+        self.started += 1
+
+    def on_delta(self, item_id, delta):
+        self.partials[item_id] = self.partials.get(item_id, "") + delta
+        self.maybe_speculate(item_id)
+
+    def take(self, item_id, transcript):
+        """Return (future, started_at) to reuse for the final transcript, or None."""
+        self.partials.pop(item_id, None)
+        self.started_count.pop(item_id, None)
+        speculation = self.speculations.pop(item_id, None)
+        if speculation is None:
+            return None
+        if speculation.future.cancelled() or not transcripts_match(transcript, speculation.text, self.threshold):
+            self.pipeline.cancel(speculation.future)
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Retrieval time already spent before the final transcript arrived
+        end = speculation.done_at if speculation.done_at is not None else time.monotonic()
+        self.saved_seconds += end - speculation.started_at
+        return speculation.future, speculation.started_at
+
+    def cancel_all(self):
+        """
+        Cancel every speculation in flight; returns how many were stopped
+        before running and how many were left running.
+        """
+        running = [speculation.future for speculation in self.speculations.values()
+                   if not speculation.future.done()]
+        self.abandoned += len(self.speculations)
+        stopped = sum(self.pipeline.cancel(future) for future in running)
+        self.speculations.clear()
+        self.partials.clear()
+        self.started_count.clear()
+        return stopped, len(running) - stopped
+
+    def stats(self):
+        decided = self.hits + self.misses
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "abandoned": self.abandoned,
+            "hit_rate": self.hits / decided if decided else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "mean_saved_seconds": self.saved_seconds / self.hits if self.hits else 0.0
+        }
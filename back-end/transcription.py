@@ -1,107 +1,139 @@
-import json
-import websocket
+import asyncio
+import logging
 import time
-import base64
-import os
-import struct
 from dotenv import load_dotenv
-import threading
-import asyncio
-from reconstruct_audio import reconstruct_audio
-from rag import rag2
-from threading import Lock
-from utils import (
-    amplify_audio,
-    base64_encode_audio,
-    float_to_16bit_pcm
-)
+from websockets.exceptions import ConnectionClosed
+from websockets.protocol import State
+from audio_codec import decode_pcm16, encode_float, encode_pcm16, join_pcm16
+from audio_cache import MAX_CLIP_BYTES, REPLY_AUDIO_CACHE_LEARN, get_reply_audio_cache
+from barge_in import BARGE_IN, BargeIn
+from client_protocol import ClientChannel
+from frame_aggregator import UPSTREAM_FRAME_MS, FrameAggregator
+from metrics import METRICS_ENABLED, new_turn
+from reply_stream import REPLY_AUDIO_MODE, ReplyAudioStream
+from rag import get_retrieval_service, rag2
+from realtime_session import SESSION_CONFIG, open_realtime_session
+from retrieval_pipeline import RetrievalPipeline
+from session_limits import SESSION_MAX_REPLY_AUDIO_BYTES, BoundedDict, BoundedSet
+from silence_gate import SILENCE_GATE, SilenceGate
+from speculative_retrieval import SPECULATIVE_RETRIEVAL, SpeculativeRetrieval
+from upstream_events import parse_event
+from upstream_writer import UpstreamWriter
+from utils import amplify_audio
+
+load_dotenv()
 
 #LOG_FILENAME = "logs.txt"
-    
+
+logger = logging.getLogger("transcription")
+
 class OpenAITranscriber:
-    openai_ws = None
-    _ws_lock = Lock()
-    openai_thread = None
-    
-    def __init__(self, client_websocket):
+    def __init__(self, client_websocket, reply_audio_mode=REPLY_AUDIO_MODE, session_pool=None):
         self.client_websocket = client_websocket
+        self.client = ClientChannel(client_websocket)
+        self.session_pool = session_pool
         self.stream_active = False
         self.sent_audio = False
         self.current_audio = []
+        self.current_audio_bytes = 0
+        self.reply_audio_mode = reply_audio_mode
+        self.reply_stream = ReplyAudioStream()
+        self.silence_gate = SilenceGate() if SILENCE_GATE else None
+        self.barge_in = BargeIn() if BARGE_IN else None
+        self.frame_aggregator = None
         self.sent_rag = False
-        self._sent_rag_lock = Lock()
         self.item_ids = []
-        self.processed_message_ids = set()
-        self.processed_transcripts = set()
-        self.processed_audio_responses = set()
+        self.processed_message_ids = BoundedSet()
+        self.processed_transcripts = BoundedSet()
+        self.processed_audio_responses = BoundedSet()
         self.last_transcript = None
-        
-
-        # file = open("logs.txt", "w")
-        # file.write("")
-        # file.close()
-        
-        load_dotenv()
-        self.initialize_websockets()
-        
+        self.loop = None
+        self.openai_ws = None
+        self.writer = None
+        self.reader_task = None
+        self.retrieval = None
+        self.speculative = None
+        self.audio_cache = get_reply_audio_cache()
+        # Record live replies into the cache as well as serving the warmed phrases
+        self.learn_replies = self.audio_cache is not None and REPLY_AUDIO_CACHE_LEARN
+        self.voice = SESSION_CONFIG["voice"]
+        # Questions by turn id, and the reply currently being recorded for the audio cache
+        self.turn_questions = BoundedDict()
+        self.next_turn = 0
+        self.recording = None
+        # Latency timelines: speech end by item id, then by turn id until the response exists
+        self.speech_stopped_at = BoundedDict()
+        self.turn_timelines = BoundedDict()
+        self.response_turns = BoundedDict()
+        # Last client or upstream traffic, for the idle session reaper
+        self.last_activity = time.monotonic()
+        self.early_reply_flushes = 0
+        # Upstream event type -> handler; on_openai_message does one lookup per event
+        self.event_handlers = {
+            "conversation.item.input_audio_transcription.completed": self.on_transcript_completed,
+            "conversation.item.input_audio_transcription.delta": self.on_transcript_delta,
+            "input_audio_buffer.speech_started": self.on_speech_started,
+            "input_audio_buffer.speech_stopped": self.on_speech_stopped,
+            "response.created": self.on_response_created,
+            "response.done": self.on_response_done,
+            "response.audio.delta": self.on_audio_delta,
+            "response.audio.done": self.on_audio_done,
+        }
+
+    async def start(self):
+        """
+        Take a configured realtime session (from the pool when there is one)
+        and start consuming its events on this loop. Returns once the
+        session is ready for audio.
+        """
+        self.loop = asyncio.get_running_loop()
+        await self.initialize_websockets()
+
     async def test(self):
         message = {
             "event_type": "checking connectivity",
             "event_data": "connection established"
         }
-        await self.client_websocket.send_json(message)
+        await self.client.send_json(message)
 
     def is_openai_connected(self):
-        return (self.openai_ws and hasattr(self.openai_ws, 'sock') 
-            and self.openai_ws.sock and self.openai_ws.sock.connected)
-        
-    def initialize_websockets(self):
+        return self.openai_ws is not None and self.openai_ws.state is State.OPEN
+
+    async def initialize_websockets(self):
+        if self.session_pool:
+            self.openai_ws = await self.session_pool.acquire()
+        else:
+            self.openai_ws = await open_realtime_session()
+        self.writer = UpstreamWriter(self.openai_ws)
+        self.writer.start()
+        if UPSTREAM_FRAME_MS > 0:
+            self.frame_aggregator = FrameAggregator(self.writer.send_audio)
+        self.retrieval = RetrievalPipeline(self.prepare_reply, self.deliver_reply)
+        self.retrieval.start()
+        if SPECULATIVE_RETRIEVAL:
+            self.speculative = SpeculativeRetrieval(self.retrieval)
+        self.reader_task = asyncio.create_task(self.read_openai_messages())
+
+    async def read_openai_messages(self):
+        """Consume upstream events for this session until the socket closes."""
         try:
-            OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-            
-            if not OPENAI_API_KEY:
-                raise ValueError("Missing OPENAI_API_KEY")
-            
-            headers = ["Authorization: Bearer " + OPENAI_API_KEY, "OpenAI-Beta: realtime=v1"]
-            
-            self.openai_ws = websocket.WebSocketApp(
-                url="wss://api.openai.com/v1/realtime?model=gpt-4o-mini-realtime-preview",
-                header=headers,
-                on_open=self.on_openai_open,
-                on_message=self.on_openai_message,
-                on_error=self.on_error,
-                on_close=self.on_openai_close
-            )
-            
-            self.openai_thread = threading.Thread(
-                target=self.openai_ws.run_forever,
-                daemon=True
-            )
-            self.openai_thread.start()
-            time.sleep(1)  # Give time for connection
-        except Exception as e:
-            pass
-            #print(f"WebSocket initialization failed: {e}")
-            #log(f"WebSocket initialization failed: {e}", LOG_FILENAME)    
-        # Add these new methods for better connection management
-    
-    def on_openai_close(self, ws, close_status_code, close_msg):
-        pass
-        #print(f"OpenAI WebSocket closed: {close_status_code} - {close_msg}")
+            while True:
+                # Raw bytes, so audio deltas can be read without decoding or parsing the whole frame
+                message = await self.openai_ws.recv(decode=False)
+                try:
+                    await self.on_openai_message(message)
+                except Exception as e:
+                    self.on_error(e)
+        except ConnectionClosed as e:
+            self.on_openai_close(e.rcvd.code if e.rcvd else None, e.rcvd.reason if e.rcvd else None)
+
+    def on_openai_close(self, close_status_code, close_msg):
+        logger.info(f"OpenAI WebSocket closed: {close_status_code} - {close_msg}")
         #log(f"OpenAI WebSocket closed: {close_status_code} - {close_msg}", LOG_FILENAME)
-        
-    def on_client_close(self, ws, close_status_code, close_msg):
-        pass
-        #print(f"Client WebSocket closed: {close_status_code} - {close_msg}")
-        #log(f"Client WebSocket closed: {close_status_code} - {close_msg}", LOG_FILENAME)
-        
-    def on_client_open(self, ws):
-        pass
-        #print("Client WebSocket connection established")
-        #log("Client WebSocket connection established", LOG_FILENAME)   
 
     def set_client_websocket(self, client_websocket):
         self.client_websocket = client_websocket
+        self.client.websocket = client_websocket
 
     def process_audio_chunk(self, indata, frames, time, status):
         if status:
@@ -110,182 +142,422 @@ class OpenAITranscriber:
             #log("Status:" + str(status), LOG_FILENAME)
         if not self.stream_active or self.openai_ws is None:
             return
-            
+
         audio_chunk = indata[:, 0]  # if mono, or pick a single channel
         amplified_chunk = amplify_audio(audio_chunk)
-            
-        self.send_audio_to_openai(amplified_chunk)
-    
-    def send_audio_to_openai(self, base64_audio):
+
+        # Audio callbacks run on their own thread, so hand the send to the session's loop
+        asyncio.run_coroutine_threadsafe(self.send_audio_to_openai(encode_float(amplified_chunk)), self.loop)
+
+    async def send_audio_to_openai(self, audio):
+        """Queue microphone audio upstream, given as base64 text or raw PCM16 bytes."""
         #log("\n>> Sending audio to openai\n\n", LOG_FILENAME)
-        with self._ws_lock:
-            try:
-                if not self.is_openai_connected():
-                    #print("OpenAI socket not connected, cannot send audio")
-                    return False
-
-                event = {
-                    "type": "input_audio_buffer.append",
-                    "audio": base64_audio
-                }
-                self.openai_ws.send(json.dumps(event))
-                return True
-                
-            except Exception as e:
-                #print(f"Error sending audio to OpenAI: {str(e)}")
-                #log(f"Error sending audio to OpenAI: {str(e)}", LOG_FILENAME)
-                return False
-                            
-    def on_openai_open(self, ws):
-        pass
-        #print("Connected to OpenAI server.")
-        #log("Connected to OpenAI server.", LOG_FILENAME)
-                
-        
-    def websocket_working(self, socket_name):
-        if(socket_name == "client"):
-            return self.client_websocket is not None and self.client_websocket.sock is not None and self.client_websocket.sock.connected
-        elif(socket_name == "openai"):
-            return self.openai_ws is not None and self.openai_ws.sock is not None and self.openai_ws.sock.connected
-        
-    def on_openai_message(self, ws, message):
-        data = json.loads(message)
-        
+        if not self.is_openai_connected():
+            #print("OpenAI socket not connected, cannot send audio")
+            return False
+        if not self.silence_gate and not self.frame_aggregator:
+            if not isinstance(audio, str):
+                # Binary clients send raw PCM16; base64 is only needed for the realtime API
+                audio = encode_pcm16(audio)
+            return await self.writer.send_audio(audio)
+        pcm_bytes = decode_pcm16(audio) if isinstance(audio, str) else audio
+        chunks = self.silence_gate.process(pcm_bytes) if self.silence_gate else [pcm_bytes]
+        sent = True
+        if self.frame_aggregator:
+            if not chunks:
+                # The gate is holding back silence, so speech has ended; don't sit on its tail
+                return await self.frame_aggregator.flush("speech_end")
+            for chunk in chunks:
+                sent = await self.frame_aggregator.add(chunk) and sent
+            return sent
+        for chunk in chunks:
+            sent = await self.writer.send_audio(encode_pcm16(chunk)) and sent
+        return sent
+
+    async def send_event_to_openai(self, event):
+        if self.is_openai_connected():
+            await self.writer.send_event(event)
+
+    def upstream_stats(self):
+        stats = self.writer.stats() if self.writer else {}
+        if self.frame_aggregator:
+            stats["frames"] = self.frame_aggregator.stats()
+        if self.silence_gate:
+            stats["silence_gate"] = self.silence_gate.stats()
+        return stats
+
+    def retrieval_stats(self):
+        stats = self.retrieval.stats() if self.retrieval else {}
+        if self.speculative:
+            stats["speculative"] = self.speculative.stats()
+        if self.barge_in:
+            stats["barge_in"] = self.barge_in.stats()
+        return stats
+
+    def usage(self):
+        """Per-session resource counters published to the session registry."""
+        upstream = self.upstream_stats()
+        retrieval = self.retrieval.stats() if self.retrieval else {}
+        return {
+            "protocol": self.client.protocol,
+            "reply_codec": self.client.codec,
+            "upstream_depth": upstream.get("depth", 0),
+            "upstream_sent": upstream.get("sent", 0),
+            "upstream_dropped": upstream.get("dropped", 0),
+            "silence_bytes_saved": self.silence_gate.bytes_saved if self.silence_gate else 0,
+            "client_messages": self.client.json_sent + self.client.frames_sent,
+            "client_frame_bytes": self.client.bytes_sent,
+            "reply_bytes_saved": self.client.reply_bytes_raw - self.client.reply_bytes_encoded,
+            "retrievals": retrieval.get("completed", 0),
+            "buffered_audio_chunks": len(self.current_audio),
+            "memory_bytes": self.memory_usage()["total_bytes"]
+        }
+
+    def memory_usage(self):
+        """Estimated bytes held by this session's buffers, and the size of its id maps."""
+        upstream_queue = sum(len(event.get("audio", "")) for is_audio, event in self.writer.queue
+                             if is_audio) if self.writer else 0
+        buffers = {
+            "reply_audio_bytes": self.current_audio_bytes,
+            "reply_stream_bytes": self.reply_stream.pending_bytes,
+            "cache_recording_bytes": self.recording["bytes"] if self.recording else 0,
+            "upstream_queue_bytes": upstream_queue,
+            "frame_buffer_bytes": self.frame_aggregator.pending_bytes if self.frame_aggregator else 0,
+            "silence_preroll_bytes": self.silence_gate.preroll_size if self.silence_gate else 0
+        }
+        tracked = [self.processed_message_ids, self.processed_transcripts, self.processed_audio_responses,
+                   self.turn_questions, self.speech_stopped_at, self.turn_timelines, self.response_turns]
+        if self.speculative:
+            tracked += [self.speculative.partials, self.speculative.speculations, self.speculative.started_count]
+        if self.barge_in:
+            tracked += [self.barge_in.requested_turns, self.barge_in.cancelled_turns, self.barge_in.active_responses,
+                        self.barge_in.cancelled_responses]
+        return {
+            **buffers,
+            "total_bytes": sum(buffers.values()),
+            "tracked_ids": sum(len(ids) for ids in tracked),
+            "evicted_ids": sum(ids.evicted for ids in tracked),
+            "early_reply_flushes": self.early_reply_flushes,
+            "idle_seconds": round(time.monotonic() - self.last_activity, 1)
+        }
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def prepare_reply(self, transcript):
+        """
+        Runs on the retrieval pool. Returns cached reply audio when a near-duplicate
+        question was answered before and its audio is cached, else the rag2 event.
+        """
+        if self.audio_cache:
+            # The embedding is cached, so rag2 below reuses it on a miss
+            answer = self.audio_cache.answers.lookup(transcript, get_retrieval_service().embed_query)
+            if answer:
+                pcm_bytes = self.audio_cache.get(answer, self.voice)
+                if pcm_bytes:
+                    return {"type": "cached_audio", "text": answer, "audio": pcm_bytes}
+        return {"type": "rag", "transcript": transcript, "event": rag2(transcript)}
+
+    async def deliver_reply(self, reply, turn=None):
+        if reply["type"] == "cached_audio":
+            # Upstream synthesis is skipped entirely
+            if turn:
+                turn.mark("first_audio_delta")
+                turn.mark("audio_done")
+            await self.send_audio_clip_to_client(reply["audio"])
+            if turn:
+                turn.finish()
+            return
+        event = reply["event"]
+        if self.learn_replies or turn or self.barge_in:
+            # Tag the response so its audio, transcript, timeline and cancellation can be matched to the question
+            self.next_turn += 1
+            turn_id = str(self.next_turn)
+            if self.learn_replies:
+                self.turn_questions[turn_id] = reply["transcript"]
+            if turn:
+                self.turn_timelines[turn_id] = turn
+            if self.barge_in:
+                self.barge_in.on_response_requested(turn_id)
+            event = {**event, "response": {**event["response"],
+                                           "metadata": {**event["response"]["metadata"], "turn": turn_id}}}
+        await self.send_event_to_openai(event)
+        if turn:
+            turn.mark("response_create_sent")
+
+    def record_reply_event(self, data):
+        """Collect a tagged reply's audio and transcript so it can be stored in the audio cache."""
+        if data['type'] == "response.created":
+            metadata = data['response'].get('metadata') or {}
+            turn = metadata.get('turn')
+            self.recording = None
+            if turn in self.turn_questions:
+                self.recording = {"response_id": data['response']['id'], "turn": turn,
+                                  "chunks": [], "bytes": 0, "text": None}
+            return
+        recording = self.recording
+        if recording is None or data.get('response_id', data.get('response', {}).get('id')) != recording["response_id"]:
+            return
+        if data['type'] == "response.audio.delta":
+            chunk = decode_pcm16(data['delta'])
+            recording["bytes"] += len(chunk)
+            if recording["bytes"] > MAX_CLIP_BYTES:
+                # Too long to be worth caching; stop holding the audio
+                self.recording = None
+                self.turn_questions.pop(recording["turn"], None)
+                return
+            recording["chunks"].append(chunk)
+        elif data['type'] == "response.audio_transcript.done":
+            recording["text"] = data['transcript']
+        elif data['type'] == "response.done":
+            self.recording = None
+            question = self.turn_questions.pop(recording["turn"], None)
+            if data['response'].get('status') == "completed" and recording["text"] and question:
+                stored = self.loop.run_in_executor(
+                    None, self.store_reply, question, recording["text"], b"".join(recording["chunks"]))
+                stored.add_done_callback(self.on_reply_stored)
+
+    def on_reply_stored(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Failed to store reply audio in the cache: {future.exception()}")
+
+    def store_reply(self, question, text, pcm_bytes):
+        # A clip already stored for this text, e.g. rendered by `audio_cache.py warm`, is kept
+        self.audio_cache.put(text, self.voice, pcm_bytes, replace=False)
+        self.audio_cache.answers.add(question, text, get_retrieval_service().embed_query(question))
+
+    async def send_audio_clip_to_client(self, pcm_bytes):
+        if self.reply_audio_mode == "stream":
+            for message in self.reply_stream.clip_messages(pcm_bytes):
+                await self.send_message_to_client(message)
+        else:
+            await self.send_to_client(pcm_bytes)
+
+    async def interrupt(self):
+        """
+        The caller started speaking: cancel retrieval and replies still in
+        flight, drop reply audio not yet sent and have the client stop playback.
+        """
+        responses = self.barge_in.interrupt()
+        for response_id in responses:
+            await self.send_event_to_openai({"type": "response.cancel", "response_id": response_id})
+        # Retrievals a pool worker already picked up can't be stopped, only discarded
+        retrievals, running_retrievals = self.retrieval.cancel_pending() if self.retrieval else (0, 0)
+        speculations, running_speculations = self.speculative.cancel_all() if self.speculative else (0, 0)
+        self.barge_in.count("retrieval", retrievals)
+        self.barge_in.count("speculation", speculations)
+        self.barge_in.count_abandoned("retrieval", running_retrievals)
+        self.barge_in.count_abandoned("speculation", running_speculations)
+        if self.reply_audio_mode == "stream":
+            dropped = self.reply_stream.cancel()
+        else:
+            dropped = self.current_audio_bytes
+            self.current_audio = []
+            self.current_audio_bytes = 0
+        self.barge_in.drop_audio(dropped)
+        self.barge_in.record(responses or retrievals or running_retrievals or speculations or running_speculations
+                             or dropped)
+        # Audio already delivered may still be playing in the browser
+        await self.send_message_to_client({"event_type": "audio_response_flush"})
+
+    async def on_openai_message(self, message):
+        data = parse_event(message)
+        self.last_activity = time.monotonic()
+
         #print("Raw message received from OpenAI")
         #log("Raw message received from OpenAI", LOG_FILENAME)
         ##print(data)
         #log(data, LOG_FILENAME)
-         # Create event loop if none exists
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        if(data['type'] == "session.created"):
-            event = {
-                "type": "session.update",
-                "session": {
-                    "instructions": "Your job is to transcript audio you're given, and create speech of text you're given.",
-                    "input_audio_transcription": {
-                        "model": "whisper-1",
-                        "language": "en"
-                    },
-                    "turn_detection": {
-                        "type": "server_vad",
-                        "threshold": 0.5,
-                        "prefix_padding_ms": 300,
-                        "silence_duration_ms": 500,
-                        "create_response": False,
-                        "interrupt_response": False
-                    },
-                    "voice": "ballad"
-                }
-            }
-            if(self.websocket_working("openai")):
-                self.openai_ws.send(json.dumps(event))
-            
-        elif(data['type'] == "conversation.item.input_audio_transcription.completed"):
-            transcript = data['transcript']
-            item_id = data['item_id']
-            event = rag2(transcript)
-            self.openai_ws.send(json.dumps(event))
-            
-        elif(data['type'] == "response.text.delta"):
-            pass
-            #print(data)
-            #log(data, LOG_FILENAME)
-            
-        elif(data['type'] == "response.audio.delta"):
-            #print(data)
-            #log(data, LOG_FILENAME)
-            self.current_audio.append(data['delta'])
-            #log("Data added into array", LOG_FILENAME)
-            
-        elif(data['type'] == "response.audio.done"): #and self.sent_audio == True):
-            if(len(self.current_audio) >= 0):
-                #log("Appropriate length", LOG_FILENAME)
-                to_send_audio = reconstruct_audio(self.current_audio)
-                #print(to_send_audio)
-                if (len(to_send_audio) > 0):
-                    #log(f"Audio data length: {len(to_send_audio)}", LOG_FILENAME)
-                    base_64_audio = base64_encode_audio(to_send_audio) #encoding before sending
-                    if base_64_audio:
-                        loop.run_until_complete(self.send_to_client(base_64_audio))
-                        #print("Message sent")
-                        #log("Message sen", LOG_FILENAME)
-                    else:
-                        pass
-                        #log("Failed to encode audio", LOG_FILENAME)
-                else:
-                    pass
-                    #log("Reconstructed audio is empty", LOG_FILENAME)
+        if self.learn_replies and (self.recording or data['type'] == "response.created"):
+            self.record_reply_event(data)
+
+        # session.created / session.updated are handled by open_realtime_session;
+        # events without a handler (text deltas, rate limits, ...) are ignored
+        handler = self.event_handlers.get(data['type'])
+        if handler:
+            await handler(data)
+        #else:
+            #print("Received event:", json.dumps(data, indent=2) + '\n')
+            #log("Received event:" + json.dumps(data, indent=2) + '\n', LOG_FILENAME)
+
+    async def on_transcript_completed(self, data):
+        transcript = data['transcript']
+        item_id = data['item_id']
+        # The pipeline sends the response.create when retrieval finishes,
+        # so the reader carries on with audio deltas and errors meanwhile
+        turn = new_turn(id(self), self.speech_stopped_at.pop(item_id, None))
+        if turn:
+            turn.mark("transcript_completed")
+        speculation = self.speculative.take(item_id, transcript) if self.speculative else None
+        if speculation:
+            self.retrieval.enqueue(*speculation, turn=turn)
+        else:
+            self.retrieval.submit(transcript, turn=turn)
+
+    async def on_transcript_delta(self, data):
+        if self.speculative:
+            self.speculative.on_delta(data['item_id'], data['delta'])
+
+    async def on_speech_started(self, data):
+        if self.barge_in:
+            await self.interrupt()
+
+    async def on_speech_stopped(self, data):
+        if self.frame_aggregator:
+            await self.frame_aggregator.flush("speech_end")
+        if METRICS_ENABLED:
+            self.speech_stopped_at[data['item_id']] = time.monotonic()
+
+    async def on_response_created(self, data):
+        turn_id = (data['response'].get('metadata') or {}).get('turn')
+        if self.barge_in and self.barge_in.on_response_created(data['response']['id'], turn_id):
+            # Requested before the caller barged in; stop it before it produces audio
+            await self.send_event_to_openai({"type": "response.cancel", "response_id": data['response']['id']})
+        if self.turn_timelines:
+            turn = self.turn_timelines.pop(turn_id, None)
+            if turn:
+                self.response_turns[data['response']['id']] = turn
+
+    async def on_response_done(self, data):
+        # Responses that never produced audio.done (cancelled, failed) leave no timeline behind
+        self.response_turns.pop(data['response']['id'], None)
+        if self.barge_in:
+            self.barge_in.on_response_done(data['response']['id'])
+
+    async def on_audio_delta(self, data):
+        """Most upstream traffic; data may come from the fast path with the delta as a memoryview."""
+        #print(data)
+        #log(data, LOG_FILENAME)
+        delta = data['delta']
+        if self.barge_in and self.barge_in.is_cancelled(data['response_id']):
+            # Still arriving from a reply cancelled by barge-in
+            self.barge_in.drop_audio(len(delta) * 3 // 4)
+            return
+        if self.response_turns:
+            turn = self.response_turns.get(data['response_id'])
+            if turn:
+                turn.mark("first_audio_delta")
+        if self.reply_audio_mode == "stream":
+            message = self.reply_stream.add(delta)
+            if message:
+                await self.send_message_to_client(message)
+        else:
+            self.current_audio.append(delta)
+            self.current_audio_bytes += len(delta) * 3 // 4
+            if self.current_audio_bytes >= SESSION_MAX_REPLY_AUDIO_BYTES:
+                # Long answer: hand what is buffered to the client now instead of holding all of it
+                self.early_reply_flushes += 1
+                pcm_bytes = join_pcm16(self.current_audio)
                 self.current_audio = []
-            else:
-                #log("Insufficient length", LOG_FILENAME)
-                return
-                
-        elif(data['type'] == "response.done"):
-            try:
-                if(data['metadata']['topic'] == "rag"):
-                    rag_response = data['response']['output']['content']['text']
-                    item_id = data['response']['output']['id']
-                    #log(item_id, LOG_FILENAME)
-            except:
-                pass
+                self.current_audio_bytes = 0
+                await self.send_to_client(pcm_bytes)
+            #log("Data added into array", LOG_FILENAME)
+
+    async def on_audio_done(self, data):
+        if self.barge_in and self.barge_in.is_cancelled(data['response_id']):
+            self.response_turns.pop(data['response_id'], None)
+            return
+        turn = self.response_turns.pop(data['response_id'], None) if self.response_turns else None
+        if turn:
+            turn.mark("audio_done")
+        if self.reply_audio_mode == "stream":
+            for message in self.reply_stream.finish():
+                await self.send_message_to_client(message)
+            if turn:
+                turn.finish()
+            return
+        # The deltas are already PCM16, so join them without a float round trip
+        pcm_bytes = join_pcm16(self.current_audio)
+        if pcm_bytes:
+            await self.send_to_client(pcm_bytes)
+            #print("Message sent")
+            #log("Message sen", LOG_FILENAME)
+            if turn:
+                turn.finish()
         else:
             pass
-            #print("Received event:", json.dumps(data, indent=2) + '\n')
-            #log("Received event:" + json.dumps(data, indent=2) + '\n', LOG_FILENAME)
-                
-    def on_error(self, ws, error):
+            #log("Reconstructed audio is empty", LOG_FILENAME)
+        self.current_audio = []
+        self.current_audio_bytes = 0
+
+    def on_error(self, error):
         if isinstance(error, Exception):
             error_msg = str(error)
         else:
             error_msg = error
-        #print("Error:", error_msg)
+        logger.error(f"OpenAI session error: {error_msg}")
         #log("Error:" + error_msg, LOG_FILENAME)
-    
-    async def send_to_client(self, base_64_audio):
-        if not base_64_audio:
+
+    async def send_to_client(self, pcm_bytes):
+        if not pcm_bytes:
             #log("Attempted to send empty audio data", LOG_FILENAME)
             return
+        # The channel base64-encodes the clip only for JSON clients
         message = {
                     "event_type": "audio_response_transmitting",
-                    "event_data": base_64_audio
+                    "event_data": pcm_bytes
                 }
+        await self.send_message_to_client(message)
+
+    async def send_message_to_client(self, message):
         try:
-            await self.client_websocket.send_json(message)    
+            await self.client.send(message)
         except Exception as e:
             pass
             #print(e)
             #log(str(e), LOG_FILENAME)
-        
-    def stop_transcription(self):
+
+    async def stop_transcription(self):
         self.stream_active = False
-        
+
+        if self.reader_task:
+            self.reader_task.cancel()
+            self.reader_task = None
+
+        if self.speculative:
+            self.speculative.cancel_all()
+
+        if self.retrieval:
+            await self.retrieval.close()
+
+        if self.frame_aggregator:
+            self.frame_aggregator.close()
+
+        if self.writer:
+            await self.writer.close()
+
         if self.openai_ws:
-            self.openai_ws.close()
+            await self.openai_ws.close()
             self.openai_ws = None
-            
+
+        self.current_audio = []
+        self.current_audio_bytes = 0
+        self.recording = None
         return True
-    
-    def get_voice_output(self, text):
+
+    async def get_voice_output(self, text):
         event = {
             "type": "session.update"
-        } 
-        self.openai_ws.send(json.dumps(event))       
-        
-if __name__ == "__main__":
+        }
+        await self.send_event_to_openai(event)
+
+async def main():
     #print("Entering main function")
     #log("Entering main function", LOG_FILENAME)
-    transcriber = OpenAITranscriber()
-    # Keep the main thread alive to prevent immediate exit
+    transcriber = OpenAITranscriber(None)
+    await transcriber.start()
+    # Keep the session alive until interrupted
     try:
         #print("Transcription running. Press Ctrl+C to exit...")
         #log("Transcription running. Press Ctrl+C to exit...", LOG_FILENAME)
-        while True:
-            time.sleep(2.5)
-    except KeyboardInterrupt:
+        await transcriber.reader_task
+    finally:
         #print("Stopping transcription...")
         #log("Stopping transcription...", LOG_FILENAME)
-        transcriber.stop_transcription()
+        await transcriber.stop_transcription()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,72 @@
+import json
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "auto" uses orjson when it is installed, "json" forces the standard library
+UPSTREAM_JSON_BACKEND = os.environ.get("UPSTREAM_JSON_BACKEND", "auto")
+# Pull audio deltas out of the raw frame instead of parsing the whole event
+UPSTREAM_DELTA_FAST_PATH = os.environ.get("UPSTREAM_DELTA_FAST_PATH", "1") == "1"
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None and UPSTREAM_JSON_BACKEND != "json":
+    JSON_BACKEND = "orjson"
+    loads = orjson.loads
+
+    def dumps(event):
+        return orjson.dumps(event).decode()
+else:
+    JSON_BACKEND = "json"
+    loads = json.loads
+    dumps = json.dumps
+
+AUDIO_DELTA_TYPE = "response.audio.delta"
+
+# The realtime API sends compact JSON with "type" among the first keys; anything
+# laid out differently simply takes the full parse
+_DELTA_TYPE_FIELD = b'"type":"response.audio.delta"'
+_DELTA_TYPE_WINDOW = 96
+_DELTA_KEY = b'"delta":"'
+_RESPONSE_ID_KEY = b'"response_id":"'
+
+def _string_field(message, key):
+    """(start, end) of a string value with no escapes, or None."""
+    start = message.find(key)
+    if start < 0:
+        return None
+    start += len(key)
+    end = message.find(b'"', start)
+    if end < 0 or message.find(b'\\', start, end) >= 0:
+        return None
+    return start, end
+
+def parse_audio_delta(message):
+    """
+    Read a response.audio.delta frame (raw bytes) without a full JSON parse.
+    Returns {"type", "response_id", "delta"} with the base64 delta as a
+    memoryview into the frame, or None when the frame is anything else.
+    """
+    if message.find(_DELTA_TYPE_FIELD, 0, _DELTA_TYPE_WINDOW) < 0:
+        return None
+    delta = _string_field(message, _DELTA_KEY)
+    response_id = _string_field(message, _RESPONSE_ID_KEY)
+    if delta is None or response_id is None:
+        return None
+    return {
+        "type": AUDIO_DELTA_TYPE,
+        "response_id": message[response_id[0]:response_id[1]].decode("ascii"),
+        "delta": memoryview(message)[delta[0]:delta[1]]
+    }
+
+def parse_event(message, fast_path=UPSTREAM_DELTA_FAST_PATH):
+    """Decode one upstream frame (str or bytes) into an event dict."""
+    if fast_path and isinstance(message, (bytes, bytearray)):
+        event = parse_audio_delta(message)
+        if event is not None:
+            return event
+    return loads(message)
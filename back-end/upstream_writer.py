@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+from upstream_events import dumps
+
+load_dotenv()
+
+# Maximum number of audio frames waiting to go upstream for one session
+UPSTREAM_QUEUE_SIZE = int(os.environ.get("UPSTREAM_QUEUE_SIZE", "50"))
+# "drop_oldest" discards stale microphone audio, "block" makes the client reader wait
+UPSTREAM_QUEUE_POLICY = os.environ.get("UPSTREAM_QUEUE_POLICY", "drop_oldest")
+
+logger = logging.getLogger("upstream-writer")
+
+class UpstreamWriter:
+    """
+    Owns all writes to one session's upstream socket.
+
+    Events are queued and sent by a single task, so a slow upstream
+    connection only ever delays its own session. Audio frames are bounded
+    by max_queue and handled by the full-queue policy; control events
+    (session.update, response.create, ...) are never dropped.
+    """
+
+    def __init__(self, ws, max_queue=UPSTREAM_QUEUE_SIZE, policy=UPSTREAM_QUEUE_POLICY):
+        if policy not in ("drop_oldest", "block"):
+            raise ValueError(f"Unknown upstream queue policy: {policy}")
+        self.ws = ws
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue = deque()
+        self.audio_depth = 0
+        self.has_items = asyncio.Event()
+        self.has_space = asyncio.Event()
+        self.has_space.set()
+        self.task = None
+        self.closed = False
+
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.blocked_seconds = 0.0
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def _push(self, is_audio, event):
+        self.queue.append((is_audio, event))
+        if is_audio:
+            self.audio_depth += 1
+            if self.audio_depth >= self.max_queue:
+                self.has_space.clear()
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self.has_items.set()
+
+    def _drop_oldest_audio(self):
+        for index, (is_audio, _) in enumerate(self.queue):
+            if is_audio:
+                del self.queue[index]
+                self.audio_depth -= 1
+                self.dropped += 1
+                return
+
+    async def send_audio(self, base64_audio):
+        """Queue an input_audio_buffer.append; returns False if the writer is closed."""
+        if self.closed:
+            return False
+        if self.audio_depth >= self.max_queue:
+            if self.policy == "drop_oldest":
+                self._drop_oldest_audio()
+            else:
+                started = time.monotonic()
+                # Several blocked senders can wake on the same free slot; only one may take it
+                while self.audio_depth >= self.max_queue:
+                    await self.has_space.wait()
+                    if self.closed:
+                        return False
+                self.blocked_seconds += time.monotonic() - started
+        self._push(True, {
+            "type": "input_audio_buffer.append",
+            "audio": base64_audio
+        })
+        return True
+
+    async def send_event(self, event):
+        """Queue a control event; these bypass the audio bound and are never dropped."""
+        if self.closed:
+            return False
+        self._push(False, event)
+        return True
+
+    async def run(self):
+        while True:
+            await self.has_items.wait()
+            while self.queue:
+                is_audio, event = self.queue.popleft()
+                if is_audio:
+                    self.audio_depth -= 1
+                    if self.audio_depth < self.max_queue:
+                        self.has_space.set()
+                try:
+                    await self.ws.send(dumps(event))
+                    self.sent += 1
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Error sending {event.get('type')} upstream: {e}")
+            self.has_items.clear()
+
+    async def close(self):
+        self.closed = True
+        # Release any client reader blocked on a full queue
+        self.has_space.set()
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self.task = None
+
+    def stats(self):
+        return {
+            "depth": len(self.queue),
+            "audio_depth": self.audio_depth,
+            "max_depth": self.max_depth,
+            "max_queue": self.max_queue,
+            "policy": self.policy,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "blocked_seconds": round(self.blocked_seconds, 3)
+        }
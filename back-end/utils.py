@@ -1,6 +1,5 @@
-import base64
 import json
-import struct
+from audio_codec import encode_float, float_to_pcm16_bytes
 
 # def resetb64():
 #     file = open("b64audio.txt", "w")
@@ -33,11 +32,7 @@ def amplify_audio(audio_data, gain=3.0):
     return amplified
 
 def float_to_16bit_pcm(float32_array):
-    clipped = [max(-1.0, min(1.0, x)) for x in float32_array]
-    pcm16 = b''.join(struct.pack('<h', int(x * 32767)) for x in clipped)
-    return pcm16
+    return float_to_pcm16_bytes(float32_array)
 
 def base64_encode_audio(float32_array):
-    pcm_bytes = float_to_16bit_pcm(float32_array)
-    encoded = base64.b64encode(pcm_bytes).decode('ascii')
-    return encoded
\ No newline at end of file
+    return encode_float(float32_array)
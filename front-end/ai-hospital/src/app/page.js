@@ -22,6 +22,19 @@ export default function Home() {
   const audioQueueRef = useRef([]);
   const isPlayingRef = useRef(false);
 
+  // Streaming playback state: chunks are scheduled back to back on one context
+  const streamContextRef = useRef(null);
+  const streamNextTimeRef = useRef(0);
+  const streamUtteranceRef = useRef(null);
+  const streamSeqRef = useRef(0);
+  // Sources still scheduled or playing, so a barge-in can silence them
+  const streamSourcesRef = useRef([]);
+  const clipSourceRef = useRef(null);
+
+  // Binary websocket protocol, used once the server accepts our hello
+  const binaryProtocolRef = useRef(false);
+  const inputSeqRef = useRef(0);
+
   const log = (message) => {
     console.log(`[${new Date().toLocaleTimeString()}] ${message}`);
     setLogMessages(prev => [...prev, `[${new Date().toLocaleTimeString()}] ${message}`]);
@@ -55,12 +68,33 @@ export default function Home() {
         log(`WebSocket connection error: ${error.message}`);
       }
       //socketRef.current = new WebSocket('ws://localhost:8000/ws');
+      socketRef.current.binaryType = "arraybuffer";
+      socketRef.current.onopen = () => {
+        // Offer raw PCM frames and streamed replies; servers that don't know the hello keep using JSON
+        socketRef.current.send(JSON.stringify({
+          event_type: "hello", protocol: "binary", version: 1, codecs: PREFERRED_REPLY_CODECS,
+          reply_audio: "stream"
+        }));
+      };
       socketRef.current.onmessage = (event) => {
+        if (event.data instanceof ArrayBuffer) {
+          handleBinaryFrame(event.data);
+          return;
+        }
         log(`Received WebSocket message: ${event.data.substring(0, 50)}...`);
         try {
           const data = JSON.parse(event.data);
           log(`Parsed data: ${JSON.stringify(data, null, 2)}`);
 
+          if (data.event_type === "server_busy") {
+            log(`Server busy: ${data.event_data}`);
+          }
+
+          if (data.event_type === "hello") {
+            binaryProtocolRef.current = data.protocol === "binary";
+            log(`Using ${data.protocol} websocket protocol, ${data.reply_audio || "buffered"} ${data.codec || "pcm16"} reply audio`);
+          }
+
           if (data.event_type === "checking connectivity" && data.event_data === "connection established") {
             setConnectionReady(true);
             log("Server connection confirmed - ready to record");
@@ -68,7 +102,19 @@ export default function Home() {
           }
 
           if (data.event_type === "audio_response_transmitting") {
-            handleAudioResponse(data.event_data);
+            handleAudioResponse(data.codec ? int16ToBytes(decodeReplyAudio(base64ToBytes(data.event_data), data.codec)) : data.event_data);
+          }
+
+          if (data.event_type === "audio_response_chunk") {
+            handleAudioChunk(data.codec ? decodeReplyAudio(base64ToBytes(data.event_data), data.codec) : data.event_data, data.utterance_id, data.seq);
+          }
+
+          if (data.event_type === "audio_response_end") {
+            handleAudioEnd(data.utterance_id, data.seq);
+          }
+
+          if (data.event_type === "audio_response_flush") {
+            flushPlayback();
           }
         } catch (e) {
           log(`Error handling message: ${e.message}`);
@@ -180,7 +226,8 @@ export default function Home() {
 
   const startActualRecording = () => {
     log("Starting actual recording process");
-    const mediaStreamConstraints = { audio: true };
+    // Echo cancellation keeps our own reply audio from being heard as the caller barging in
+    const mediaStreamConstraints = { audio: { echoCancellation: true } };
 
     navigator.mediaDevices.getUserMedia(mediaStreamConstraints)
       .then(stream => {
@@ -200,6 +247,10 @@ export default function Home() {
           if (socketRef.current?.readyState === WebSocket.OPEN) {
             const inputData = e.inputBuffer.getChannelData(0);
             const pcm16 = float32ToInt16(inputData);
+            if (binaryProtocolRef.current) {
+              socketRef.current.send(encodeAudioFrame(pcm16, inputSeqRef.current++));
+              return;
+            }
             const base64data = btoa(
               String.fromCharCode.apply(null, new Uint8Array(pcm16.buffer))
             );
@@ -237,16 +288,18 @@ export default function Home() {
       return;
     }
   
-    const base64Data = audioQueueRef.current.shift();
+    const audioData = audioQueueRef.current.shift();
     isPlayingRef.current = true;
   
     try {
-      // Convert base64 to array buffer
-      const binaryString = atob(base64Data);
-      const bytes = new Uint8Array(binaryString.length);
-      
-      for (let i = 0; i < binaryString.length; i++) {
-        bytes[i] = binaryString.charCodeAt(i);
+      // Binary clips arrive as bytes already; JSON clips are base64
+      let bytes = audioData;
+      if (typeof audioData === "string") {
+        const binaryString = atob(audioData);
+        bytes = new Uint8Array(binaryString.length);
+        for (let i = 0; i < binaryString.length; i++) {
+          bytes[i] = binaryString.charCodeAt(i);
+        }
       }
   
       // Check if we have valid data
@@ -281,9 +334,11 @@ export default function Home() {
           
           source.onended = () => {
             log("Audio playback finished");
+            clipSourceRef.current = null;
             playNextAudio();
           };
           
+          clipSourceRef.current = source;
           source.start(0);
           log("Audio playback started successfully");
         },
@@ -317,6 +372,227 @@ export default function Home() {
       log("Currently playing audio, new audio added to queue and will play when current audio finishes");
     }
   };
+  const STREAM_SAMPLE_RATE = 24000; // Realtime API output rate
+
+  const base64ToBytes = (base64Data) => {
+    const binaryString = atob(base64Data);
+    const bytes = new Uint8Array(binaryString.length);
+    for (let i = 0; i < binaryString.length; i++) {
+      bytes[i] = binaryString.charCodeAt(i);
+    }
+    return bytes;
+  };
+
+  const base64ToInt16 = (base64Data) => {
+    const bytes = base64ToBytes(base64Data);
+    return new Int16Array(bytes.buffer, 0, bytes.length >> 1);
+  };
+
+  const int16ToBytes = (samples) => new Uint8Array(samples.buffer, samples.byteOffset, samples.byteLength);
+
+  // Reply audio codecs, most compact first; the server picks the first one it allows.
+  // Ids match the codec byte of binary frames.
+  const PREFERRED_REPLY_CODECS = ["mulaw", "adpcm", "pcm16"];
+  const REPLY_CODEC_NAMES = ["pcm16", "mulaw", "adpcm"];
+
+  // G.711 mu-law: one byte per sample, expanded through a 256-entry table
+  const MULAW_TABLE = (() => {
+    const table = new Int16Array(256);
+    for (let i = 0; i < 256; i++) {
+      const code = ~i & 0xFF;
+      const exponent = (code >> 4) & 0x07;
+      const magnitude = ((((code & 0x0F) << 3) + 0x84) << exponent) - 0x84;
+      table[i] = code & 0x80 ? -magnitude : magnitude;
+    }
+    return table;
+  })();
+
+  const mulawDecode = (bytes) => {
+    const samples = new Int16Array(bytes.length);
+    for (let i = 0; i < bytes.length; i++) {
+      samples[i] = MULAW_TABLE[bytes[i]];
+    }
+    return samples;
+  };
+
+  // IMA-ADPCM blocks: first sample (i16), step index (u8), padding flag (u8), then 4-bit codes, low nibble first
+  const ADPCM_BLOCK_SAMPLES = 129;
+  const ADPCM_HEADER_BYTES = 4;
+  const ADPCM_INDEX_TABLE = [-1, -1, -1, -1, 2, 4, 6, 8];
+  const ADPCM_STEP_TABLE = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487,
+    12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767
+  ];
+
+  const adpcmDecode = (bytes) => {
+    const blockBytes = ADPCM_HEADER_BYTES + (ADPCM_BLOCK_SAMPLES >> 1);
+    const samples = new Int16Array(Math.ceil(bytes.length / blockBytes) * ADPCM_BLOCK_SAMPLES);
+    let count = 0;
+    for (let start = 0; start + ADPCM_HEADER_BYTES <= bytes.length; start += blockBytes) {
+      const end = Math.min(start + blockBytes, bytes.length);
+      let predictor = (bytes[start] | (bytes[start + 1] << 8)) << 16 >> 16;
+      let index = bytes[start + 2];
+      const nibbles = (end - start - ADPCM_HEADER_BYTES) * 2 - (bytes[start + 3] ? 1 : 0);
+      samples[count++] = predictor;
+      for (let n = 0; n < nibbles; n++) {
+        const byte = bytes[start + ADPCM_HEADER_BYTES + (n >> 1)];
+        const code = n & 1 ? byte >> 4 : byte & 0x0F;
+        const step = ADPCM_STEP_TABLE[index];
+        let delta = step >> 3;
+        if (code & 4) delta += step;
+        if (code & 2) delta += step >> 1;
+        if (code & 1) delta += step >> 2;
+        predictor = Math.max(-32768, Math.min(32767, code & 8 ? predictor - delta : predictor + delta));
+        index = Math.max(0, Math.min(88, index + ADPCM_INDEX_TABLE[code & 7]));
+        samples[count++] = predictor;
+      }
+    }
+    return samples.subarray(0, count);
+  };
+
+  // Returns Int16Array PCM for reply audio bytes in the given codec
+  const decodeReplyAudio = (bytes, codec) => {
+    if (codec === "mulaw") {
+      return mulawDecode(bytes);
+    }
+    if (codec === "adpcm") {
+      return adpcmDecode(bytes);
+    }
+    if (bytes.byteOffset % 2 === 0) {
+      return new Int16Array(bytes.buffer, bytes.byteOffset, bytes.byteLength >> 1);
+    }
+    return new Int16Array(bytes.slice().buffer, 0, bytes.byteLength >> 1);
+  };
+
+  const getStreamContext = () => {
+    if (!streamContextRef.current || streamContextRef.current.state === 'closed') {
+      streamContextRef.current = new (window.AudioContext || window.webkitAudioContext)({
+        sampleRate: STREAM_SAMPLE_RATE
+      });
+      streamNextTimeRef.current = 0;
+    }
+    return streamContextRef.current;
+  };
+
+  const schedulePcm16 = (samples) => {
+    if (samples.length === 0) {
+      return;
+    }
+    const audioContext = getStreamContext();
+    const audioBuffer = audioContext.createBuffer(1, samples.length, STREAM_SAMPLE_RATE);
+    const channel = audioBuffer.getChannelData(0);
+    for (let i = 0; i < samples.length; i++) {
+      channel[i] = samples[i] / 0x7FFF;
+    }
+    const source = audioContext.createBufferSource();
+    source.buffer = audioBuffer;
+    source.connect(audioContext.destination);
+    streamSourcesRef.current.push(source);
+    source.onended = () => {
+      streamSourcesRef.current = streamSourcesRef.current.filter((s) => s !== source);
+    };
+
+    // Start each chunk exactly where the previous one ends so playback is gapless
+    const startAt = Math.max(audioContext.currentTime, streamNextTimeRef.current);
+    source.start(startAt);
+    streamNextTimeRef.current = startAt + audioBuffer.duration;
+  };
+
+  // The caller started speaking: stop the reply and drop everything still queued
+  const flushPlayback = () => {
+    const stopped = streamSourcesRef.current.length + (clipSourceRef.current ? 1 : 0) + audioQueueRef.current.length;
+    streamSourcesRef.current.forEach((source) => {
+      try {
+        source.stop();
+      } catch (error) {
+        // Already finished
+      }
+    });
+    streamSourcesRef.current = [];
+    streamNextTimeRef.current = 0;
+    streamUtteranceRef.current = null;
+    streamSeqRef.current = 0;
+    audioQueueRef.current = [];
+    if (clipSourceRef.current) {
+      try {
+        clipSourceRef.current.stop();
+      } catch (error) {
+        // Already finished
+      }
+      clipSourceRef.current = null;
+    }
+    if (stopped > 0) {
+      log(`Barge-in: stopped ${stopped} queued or playing audio buffers`);
+    }
+  };
+
+  const handleAudioChunk = (data, utteranceId, seq) => {
+    if (!data || data.length === 0) {
+      return;
+    }
+    if (streamUtteranceRef.current !== utteranceId) {
+      streamUtteranceRef.current = utteranceId;
+      streamSeqRef.current = 0;
+    }
+    if (seq !== streamSeqRef.current) {
+      log(`Audio chunk out of order: expected ${streamSeqRef.current}, got ${seq}`);
+    }
+    streamSeqRef.current = seq + 1;
+    try {
+      schedulePcm16(typeof data === "string" ? base64ToInt16(data) : data);
+    } catch (error) {
+      log(`Error scheduling audio chunk: ${error.message}`);
+    }
+  };
+
+  // Binary frames: type (u8), reply codec id (u8), utterance id (u16), seq (u32), little-endian, then the audio
+  const FRAME_HEADER_BYTES = 8;
+  const FRAME_AUDIO_INPUT = 1;
+  const FRAME_AUDIO_CHUNK = 2;
+  const FRAME_AUDIO_CLIP = 3;
+
+  const encodeAudioFrame = (pcm16, seq) => {
+    const frame = new Uint8Array(FRAME_HEADER_BYTES + pcm16.byteLength);
+    const view = new DataView(frame.buffer);
+    view.setUint8(0, FRAME_AUDIO_INPUT);
+    view.setUint32(4, seq >>> 0, true);
+    frame.set(new Uint8Array(pcm16.buffer, pcm16.byteOffset, pcm16.byteLength), FRAME_HEADER_BYTES);
+    return frame.buffer;
+  };
+
+  const handleBinaryFrame = (buffer) => {
+    if (buffer.byteLength < FRAME_HEADER_BYTES) {
+      log(`Ignoring short binary frame of ${buffer.byteLength} bytes`);
+      return;
+    }
+    const view = new DataView(buffer);
+    const frameType = view.getUint8(0);
+    const codec = REPLY_CODEC_NAMES[view.getUint8(1)] || "pcm16";
+    const utteranceId = view.getUint16(2, true);
+    const seq = view.getUint32(4, true);
+    const payload = new Uint8Array(buffer, FRAME_HEADER_BYTES);
+    if (frameType === FRAME_AUDIO_CHUNK) {
+      handleAudioChunk(decodeReplyAudio(payload, codec), utteranceId, seq);
+    } else if (frameType === FRAME_AUDIO_CLIP) {
+      handleAudioResponse(codec === "pcm16" ? payload : int16ToBytes(decodeReplyAudio(payload, codec)));
+    } else {
+      log(`Ignoring binary frame of unknown type ${frameType}`);
+    }
+  };
+
+  const handleAudioEnd = (utteranceId, chunkCount) => {
+    if (streamUtteranceRef.current === utteranceId && streamSeqRef.current !== chunkCount) {
+      log(`Utterance ${utteranceId} ended after ${streamSeqRef.current} of ${chunkCount} chunks`);
+    }
+    streamUtteranceRef.current = null;
+    streamSeqRef.current = 0;
+    log(`Utterance ${utteranceId} complete`);
+  };
+
   // Improved WAV creation function with correct sample rate
   const createWavFromPCM = (pcmData) => {
     const numChannels = 1;